@@ -1,11 +1,93 @@
 import asyncio
-import requests
+import os
 import httpx
-from concurrent.futures import ThreadPoolExecutor
 
-from utilis.utils import retry
+from GTI.limitador import limitador
+from utilis.metricas import metricas
+from utilis.utils import retry, retry_after
+
+BASE_URL = os.getenv("GTI_BASE_URL", "https://api.gtiapi.workers.dev")
+
+# ======================== TRANSPORTE COMPARTILHADO ========================
+# um único cliente httpx (pool de conexões keep-alive, HTTP/2 se o pacote h2 existir)
+# para todos os agentes; o token vai no header de cada requisição
+GTI_MAX_CONEXOES = int(os.getenv("GTI_MAX_CONEXOES", "100"))
+GTI_MAX_KEEPALIVE = int(os.getenv("GTI_MAX_KEEPALIVE", "50"))
+GTI_TIMEOUT = float(os.getenv("GTI_TIMEOUT", "20"))
+GTI_MAX_STATUS_PARALELO = int(os.getenv("GTI_MAX_STATUS_PARALELO", "50"))
+GTI_MAX_DISPARO_PARALELO = int(os.getenv("GTI_MAX_DISPARO_PARALELO", "20"))  # envios simultâneos no disparo em massa
+
+try:
+    import h2  # noqa: F401
+    GTI_HTTP2 = os.getenv("GTI_HTTP2", "1") == "1"
+except ImportError:
+    GTI_HTTP2 = False
+
+M_ENVIO = metricas.histograma("gti_envio_segundos", "Latência de enviar_mensagem_async (com retries)")
+M_ENVIOS = metricas.contador("gti_envios_total", "Envios de mensagem por resultado", ("resultado",))
+M_STATUS = metricas.histograma("gti_status_segundos", "Latência da atualização de status")
+M_STATUS_TOTAL = metricas.contador("gti_status_total", "Atualizações de status por resultado", ("resultado",))
+
+_cliente = None
+_config = {
+    "base_url": BASE_URL,
+    "max_conexoes": GTI_MAX_CONEXOES,
+    "max_keepalive": GTI_MAX_KEEPALIVE,
+    "timeout": GTI_TIMEOUT,
+    "http2": GTI_HTTP2,
+}
+
+
+def configurar_transporte(max_conexoes=None, max_keepalive=None, timeout=None, http2=None, base_url=None):
+    #ajusta os limites do pool; vale para o próximo cliente criado
+    if _cliente is not None:
+        raise RuntimeError("Transporte GTI já iniciado; chame fechar_transporte() antes de reconfigurar.")
+    if max_conexoes is not None:
+        _config["max_conexoes"] = max_conexoes
+    if max_keepalive is not None:
+        _config["max_keepalive"] = max_keepalive
+    if timeout is not None:
+        _config["timeout"] = timeout
+    if http2 is not None:
+        _config["http2"] = http2
+    if base_url is not None:
+        _config["base_url"] = base_url
+
+
+def obter_cliente():
+    #cria o cliente compartilhado na primeira chamada
+    global _cliente
+    if _cliente is None or _cliente.is_closed:
+        _cliente = httpx.AsyncClient(
+            base_url=_config["base_url"],
+            http2=_config["http2"],
+            timeout=_config["timeout"],
+            limits=httpx.Limits(
+                max_connections=_config["max_conexoes"],
+                max_keepalive_connections=_config["max_keepalive"],
+            ),
+            headers={"Content-Type": "application/json"},
+        )
+    return _cliente
+
+
+async def fechar_transporte():
+    global _cliente
+    if _cliente is not None:
+        await _cliente.aclose()
+        _cliente = None
+
+
+#POST /send/text não é idempotente: timeout de leitura, conexão caída no meio ou 5xx podem ter
+#entregado a mensagem, e repetir mandaria o mesmo texto de novo. Só repete quando a requisição
+#com certeza não saiu (falha ao conectar / sem conexão livre no pool) ou quando a API recusou
+#com 429/503 e disse quando voltar (Retry-After). GETs de status continuam com erro_repetivel.
+def envio_repetivel(erro):
+    if isinstance(erro, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    return (isinstance(erro, httpx.HTTPStatusError) and erro.response.status_code in (429, 503)
+            and retry_after(erro) is not None)
 
-BASE_URL = "https://api.gtiapi.workers.dev"
 
 #cria o  objeto "agente" com funcoes do webhook
 class AgenteGTI:
@@ -20,75 +102,72 @@ class AgenteGTI:
         self.qrcode = None
         self.status_data = {}
 
-        # Sessão síncrona para requests
-        self.session = requests.Session()
-        self.session.headers.update({"token": self.token, "Content-Type": "application/json"})
+        # Headers próprios do agente, enviados em cada requisição pelo cliente compartilhado
+        self.headers = {"token": self.token}
 
-        # Cliente async para asyncio
-        self.client = httpx.AsyncClient(timeout=timeout, headers={"token": self.token, "Content-Type": "application/json"})
+    #cria vários agentes a partir das linhas (telefone, senha) do banco,
+    #consultando o status de todos em paralelo com no máximo `max_paralelo` ao mesmo tempo
+    @classmethod
+    async def from_rows(cls, rows, max_paralelo=GTI_MAX_STATUS_PARALELO, verificar_status=True, **kwargs):
+        agentes = [cls(nome=telefone, token=senha, **kwargs) for telefone, senha in rows]
+        if verificar_status:
+            sem = asyncio.Semaphore(max_paralelo)
 
-        # Atualiza status inicial
-        self.atualizar_status()
+            async def atualizar(ag):
+                async with sem:
+                    await ag.atualizar_status_async()
 
-    # ======================== STATUS ========================
-    def atualizar_status(self):
+            await asyncio.gather(*(atualizar(ag) for ag in agentes), return_exceptions=True)
+        return agentes
+
+    #toda chamada passa pelo limitador global (taxa por rota e por instância + concorrência AIMD)
+    async def _request(self, metodo, rota, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        await limitador.adquirir(rota, self.nome)
+        loop = asyncio.get_running_loop()
+        inicio = loop.time()
+        status = None
         try:
-            resp = self.session.get(f"{BASE_URL}/instance/status", timeout=self.timeout)
-            data = resp.json()
-            self.numero = data.get("instance", {}).get("owner")
-            self.conectado = data.get("status", {}).get("connected", False)
-            self.qrcode = data.get("instance", {}).get("qrcode", "")
-            self.status_data = data
-        except Exception as e:
-            print(f"[{self.nome}] Erro ao atualizar status: {e}")
-            self.conectado = False
+            resp = await obter_cliente().request(metodo, rota, headers=self.headers, **kwargs)
+            status = resp.status_code
+            return resp
+        finally:
+            limitador.liberar(loop.time() - inicio, status)
+
+    # ======================== STATUS ========================
+    #novas tentativas só em erro de rede, 429 e 5xx (respeitando Retry-After e o orçamento global)
+    @retry(3, 1, exceptions=(httpx.HTTPError,))
+    async def _consultar_status(self):
+        resp = await self._request("GET", "/instance/status")
+        resp.raise_for_status()
+        return resp.json()
 
     async def atualizar_status_async(self):
         try:
-            resp = await self.client.get(f"{BASE_URL}/instance/status")
-            data = resp.json()
+            with M_STATUS.tempo():
+                data = await self._consultar_status()
             self.numero = data.get("instance", {}).get("owner")
             self.conectado = data.get("status", {}).get("connected", False)
             self.qrcode = data.get("instance", {}).get("qrcode", "")
             self.status_data = data
+            M_STATUS_TOTAL.inc(resultado="ok")
         except Exception as e:
             print(f"[{self.nome}] Erro async ao atualizar status: {e}")
             self.conectado = False
+            M_STATUS_TOTAL.inc(resultado="erro")
 
-    # ======================== ENVIAR MENSAGEM ========================
-    @retry(3, 1)
-    def enviar_mensagem(self, numero, mensagem, mentions=""):
-        if not mensagem:
-            print(f"[{self.nome}] Mensagem vazia. Abortando envio.")
-            return None
-        payload = {
-            "number": str(numero),
-            "text": str(mensagem),
-            "linkPreview": False,
-            "replyid": str(mentions),
-            "mentions": "",
-            "readchat": True,
-            "delay": 0
-        }
-        try:
-            resp = self.session.post(f"{BASE_URL}/send/text", json=payload, timeout=30)
-            resp.raise_for_status()
-            return resp.json()
-        except requests.RequestException as e:
-            print(f"[{self.nome}] Erro ao enviar mensagem: {e}")
-            return None
-
-    def verificar_webhook(self):
+    # ======================== WEBHOOK ========================
+    async def verificar_webhook_async(self):
         try:
-            resp = self.session.get(f"{BASE_URL}/webhook", timeout=self.timeout)
+            resp = await self._request("GET", "/webhook")
             resp.raise_for_status()
             return resp.json()
-        except requests.RequestException as e:
-            print(f"[{self.nome}] Erro ao enviar mensagem: {e}")
+        except httpx.HTTPError as e:
+            print(f"[{self.nome}] Erro ao verificar webhook: {e}")
             return None
 
-    def apagar_webhook(self):
-        data = self.verificar_webhook()
+    async def apagar_webhook_async(self):
+        data = await self.verificar_webhook_async()
         if data:
             id = data[0].get("id")
             payload = {
@@ -107,16 +186,17 @@ class AgenteGTI:
                 "id": id
             }
             try:
-                resp = self.session.post(f"{BASE_URL}/webhook", json=payload, timeout=self.timeout)
+                resp = await self._request("POST", "/webhook", json=payload)
                 resp.raise_for_status()
                 print(f"webhook do {self.nome} apagado")
                 return resp.json()
-            except requests.RequestException as e:
+            except httpx.HTTPError as e:
                 print(f"[{self.nome}] Erro ao atualizar webhook: {e}")
                 return None
         else:
             return None
-    def atualizar_webhook(self, webhook):
+
+    async def atualizar_webhook_async(self, webhook):
         payload ={
                 "enabled": True,
                 "url": webhook,
@@ -145,14 +225,21 @@ class AgenteGTI:
                 "action": "add"
             }
         try:
-            resp = self.session.post(f"{BASE_URL}/webhook", json=payload, timeout=self.timeout)
+            resp = await self._request("POST", "/webhook", json=payload)
             resp.raise_for_status()
             print(f"webhook do {self.nome} atualizado para {webhook}")
             return resp.json()
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"[{self.nome}] Erro ao atualizar webhook: {e}")
             return None
 
+    # ======================== ENVIAR MENSAGEM ========================
+    @retry(3, 1, exceptions=(httpx.HTTPError,), repetir_se=envio_repetivel)
+    async def _enviar_texto(self, payload):
+        resp = await self._request("POST", "/send/text", json=payload, timeout=30)
+        resp.raise_for_status()
+        return resp.json()
+
     async def enviar_mensagem_async(self, numero, mensagem, mentions=""):
         if not mensagem:
             print(f"[{self.nome}] Mensagem vazia. Abortando envio.")
@@ -167,32 +254,24 @@ class AgenteGTI:
             "delay": 0
         }
         try:
-            resp = await self.client.post(f"{BASE_URL}/send/text", json=payload)
-            resp.raise_for_status()
-            return True, resp.json()
-        except httpx.RequestError as e:
+            with M_ENVIO.tempo():
+                resultado = await self._enviar_texto(payload)
+            M_ENVIOS.inc(resultado="ok")
+            return True, resultado
+        except httpx.HTTPError as e:
             print(f"[{self.nome}] Erro async ao enviar mensagem: {e}")
+            M_ENVIOS.inc(resultado="erro")
             return False, None
 
 
     # ======================== DESCONEXÃO ========================
-    def desconectar(self):
-        try:
-            resp = self.session.post(f"{BASE_URL}/instance/disconnect", timeout=self.timeout)
-            resp.raise_for_status()
-            self.atualizar_status()
-            return resp.json()
-        except requests.RequestException as e:
-            print(f"[{self.nome}] Erro ao desconectar: {e}")
-            return None
-
     async def desconectar_async(self):
         try:
-            resp = await self.client.post(f"{BASE_URL}/instance/disconnect")
+            resp = await self._request("POST", "/instance/disconnect")
             resp.raise_for_status()
             await self.atualizar_status_async()
             return resp.json()
-        except httpx.RequestError as e:
+        except httpx.HTTPError as e:
             print(f"[{self.nome}] Erro async ao desconectar: {e}")
             return None
 
@@ -205,14 +284,152 @@ async def atualizar_status_parallel(agentes):
     tasks = [ag.atualizar_status_async() for ag in agentes]
     await asyncio.gather(*tasks, return_exceptions=True)
 
-def enviar_mensagens_parallel(agentes, numero, mensagem, max_workers=20):
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(ag.enviar_mensagem, numero, mensagem): ag for ag in agentes}
-        for f in futures:
-            ag = futures[f]
+#resultado de um envio do disparo em massa; status = "ok", "erro" ou "desconectado" (nem tentou)
+class ResultadoEnvio:
+    __slots__ = ("agente", "numero", "status", "resposta", "erro", "latencia")
+
+    def __init__(self, agente, numero, status, resposta=None, erro=None, latencia=0.0):
+        self.agente = agente
+        self.numero = numero
+        self.status = status
+        self.resposta = resposta
+        self.erro = erro
+        self.latencia = latencia
+
+    @property
+    def ok(self):
+        return self.status == "ok"
+
+    def como_dict(self):
+        return {"agente": self.agente.nome, "numero": self.numero, "status": self.status,
+                "erro": self.erro, "latencia": round(self.latencia, 3)}
+
+
+#todos os agentes x todos os números, intercalado por número (a1->n1, a2->n1, ..., a1->n2, ...)
+#para espalhar a carga entre as instâncias; mensagem pode ser texto ou função (agente, numero) -> texto,
+#chamada só na hora do envio (erro nela vira resultado "erro" daquele envio)
+def combinar_envios(agentes, numeros, mensagem):
+    for numero in numeros:
+        for ag in agentes:
+            yield ag, numero, mensagem
+
+
+# ======================== DISPARO EM MASSA ========================
+# envia (agente, numero, mensagem) com no máximo `max_paralelo` envios ao mesmo tempo, tudo no
+# loop (sem threads), e devolve os resultados conforme terminam:
+#   disparo = DisparoEmMassa(combinar_envios(agentes, numeros, "oi"))
+#   async for r in disparo:
+#       print(r.agente.nome, r.numero, r.status, r.latencia)
+# Os envios são lidos do iterável aos poucos (uma lista enorme de agentes x números não vira
+# milhares de tasks de uma vez). cancelar() ou sair do `async for` interrompe os envios em
+# andamento e os que ainda não começaram; um `break` só é visto quando o Python finaliza o
+# gerador (no próximo ciclo do loop), então para parar na hora use o disparo com `async with`:
+#   async with DisparoEmMassa(envios) as disparo:
+#       async for r in disparo: ...
+# O limitador global continua valendo por cima.
+# Erro no envio ou na função da mensagem vira resultado "erro"; erro do próprio iterável de
+# envios para o disparo e sobe no `async for`. Um disparo só pode ser percorrido uma vez.
+class DisparoEmMassa:
+    _FIM = object()
+
+    def __init__(self, envios, max_paralelo=GTI_MAX_DISPARO_PARALELO, so_conectados=True):
+        self.envios = iter(envios)
+        self.max_paralelo = max_paralelo
+        self.so_conectados = so_conectados
+        self.cancelado = False
+        self._fila = asyncio.Queue()
+        self._tarefas = []
+        self._percorrido = False
+        self.stats = {"ok": 0, "erro": 0, "desconectado": 0, "latencia_total": 0.0}
+
+    async def _enviar(self, ag, numero, mensagem):
+        if self.so_conectados and not ag.conectado:
+            return ResultadoEnvio(ag, numero, "desconectado")
+        loop = asyncio.get_running_loop()
+        inicio = loop.time()
+        try:
+            if callable(mensagem):
+                mensagem = mensagem(ag, numero)
+            retorno = await ag.enviar_mensagem_async(numero, mensagem)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return ResultadoEnvio(ag, numero, "erro", erro=str(e), latencia=loop.time() - inicio)
+        latencia = loop.time() - inicio
+        if retorno is None:
+            return ResultadoEnvio(ag, numero, "erro", erro="mensagem vazia", latencia=latencia)
+        enviado, resposta = retorno
+        return ResultadoEnvio(ag, numero, "ok" if enviado else "erro", resposta,
+                              None if enviado else "falha no envio", latencia)
+
+    #cada trabalhador puxa o próximo envio do iterável compartilhado até ele acabar;
+    #se o iterável falhar, o erro vai pela fila para o `async for`
+    async def _trabalhador(self):
+        while True:
             try:
-                f.result()
+                ag, numero, mensagem = next(self.envios)
+            except StopIteration:
+                return
             except Exception as e:
-                print(f"[{ag.nome}] Erro paralelo: {e}")
+                self._fila.put_nowait(e)
+                return
+            resultado = await self._enviar(ag, numero, mensagem)
+            self.stats[resultado.status] += 1
+            self.stats["latencia_total"] += resultado.latencia
+            self._fila.put_nowait(resultado)
+
+    def iniciar(self):
+        if not self._tarefas:
+            self._tarefas = [asyncio.create_task(self._trabalhador()) for _ in range(self.max_paralelo)]
+            # callback e não finally: tarefa cancelada antes de começar nem entra no corpo
+            for tarefa in self._tarefas:
+                tarefa.add_done_callback(lambda _: self._fila.put_nowait(self._FIM))
+
+    def cancelar(self):
+        self.cancelado = True
+        for tarefa in self._tarefas:
+            tarefa.cancel()
+
+    async def __aiter__(self):
+        if self._percorrido:
+            raise RuntimeError("DisparoEmMassa já foi percorrido; crie outro para enviar de novo")
+        self._percorrido = True
+        self.iniciar()
+        restantes = len(self._tarefas)
+        try:
+            while restantes:
+                item = await self._fila.get()
+                if item is self._FIM:
+                    restantes -= 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            if restantes:  # consumidor saiu antes do fim (ou o iterável de envios falhou)
+                self.cancelar()
+            await asyncio.gather(*self._tarefas, return_exceptions=True)
+
+    async def __aenter__(self):
+        return self
+
+    #saiu do bloco: o que ainda estiver enviando é cancelado e esperado antes de seguir
+    async def __aexit__(self, *erro):
+        if any(not tarefa.done() for tarefa in self._tarefas):
+            self.cancelar()
+        await asyncio.gather(*self._tarefas, return_exceptions=True)
+
+    #junta todos os resultados numa lista (quando não precisa ir tratando um a um)
+    async def aguardar(self):
+        return [r async for r in self]
+
+    def estatisticas(self):
+        feitos = self.stats["ok"] + self.stats["erro"]
+        return {"ok": self.stats["ok"], "erro": self.stats["erro"], "desconectado": self.stats["desconectado"],
+                "latencia_media": round(self.stats["latencia_total"] / feitos, 3) if feitos else 0.0,
+                "cancelado": self.cancelado}
 
 
+#mesma mensagem de vários agentes para um número; devolve um ResultadoEnvio por agente
+async def enviar_mensagens_parallel(agentes, numero, mensagem, max_workers=20):
+    return await DisparoEmMassa(combinar_envios(agentes, [numero], mensagem), max_workers).aguardar()
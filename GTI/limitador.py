@@ -0,0 +1,177 @@
+import asyncio
+import os
+from collections import deque
+
+from utilis.metricas import metricas
+from utilis.relogio import relogio_atual
+
+# ===========================
+# Limitador adaptativo das chamadas à API GTI
+# ===========================
+# um único limitador para todos os agentes:
+# - balde de tokens por endpoint (req/s da API inteira) e por instância (req/s de cada número)
+# - limite de requisições simultâneas ajustado por AIMD: sobe +1 a cada "janela" de respostas
+#   rápidas e cai pela metade quando chega 429/503 ou a latência passa do alvo
+# O tempo dos baldes vem do relógio atual (utilis.relogio), então na simulação eles enchem
+# com o tempo virtual pulado e a espera por token pode ser pulada junto.
+GTI_TAXA_ENVIO = float(os.getenv("GTI_TAXA_ENVIO", "20"))  # /send/text por segundo (todas as instâncias)
+GTI_TAXA_STATUS = float(os.getenv("GTI_TAXA_STATUS", "50"))  # /instance/status por segundo
+GTI_TAXA_PADRAO = float(os.getenv("GTI_TAXA_PADRAO", "10"))  # demais rotas
+GTI_TAXA_INSTANCIA = float(os.getenv("GTI_TAXA_INSTANCIA", "2"))  # por instância, qualquer rota
+GTI_CONCORRENCIA = int(os.getenv("GTI_CONCORRENCIA", "20"))
+GTI_LATENCIA_ALVO = float(os.getenv("GTI_LATENCIA_ALVO", "3"))  # segundos
+
+STATUS_SOBRECARGA = {429, 503}
+
+M_SOBRECARGA = metricas.contador("gti_sobrecarga_total", "Respostas 429/503 recebidas", ("status",))
+
+
+class BaldeTokens:
+    def __init__(self, taxa, capacidade=None):
+        self.taxa = taxa
+        self.capacidade = capacidade or max(1.0, taxa)
+        self.tokens = self.capacidade
+        self._ultimo = None
+
+    def _repor(self, agora):
+        if self._ultimo is not None:
+            self.tokens = min(self.capacidade, self.tokens + (agora - self._ultimo) * self.taxa)
+        self._ultimo = agora
+
+    #segundos até ter um token (0 = já tem)
+    def espera(self, agora):
+        self._repor(agora)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.taxa
+
+    def consumir(self):
+        self.tokens -= 1
+
+
+class LimitadorGTI:
+    def __init__(self, taxas=None, taxa_padrao=GTI_TAXA_PADRAO, taxa_instancia=GTI_TAXA_INSTANCIA,
+                 concorrencia=GTI_CONCORRENCIA, concorrencia_min=1, concorrencia_max=500,
+                 latencia_alvo=GTI_LATENCIA_ALVO, intervalo_reducao=1.0):
+        taxas = taxas or {"/send/text": GTI_TAXA_ENVIO, "/instance/status": GTI_TAXA_STATUS}
+        self.baldes = {rota: BaldeTokens(taxa) for rota, taxa in taxas.items()}
+        self.taxa_padrao = taxa_padrao
+        self.taxa_instancia = taxa_instancia
+        self.baldes_instancia = {}
+
+        self.limite = float(concorrencia)
+        self.concorrencia_min = concorrencia_min
+        self.concorrencia_max = concorrencia_max
+        self.latencia_alvo = latencia_alvo
+        self.intervalo_reducao = intervalo_reducao
+        self._ultima_reducao = 0.0
+        self._em_uso = 0
+        self._esperando = deque()
+
+        self.stats = {"requisicoes": 0, "sobrecarga": 0, "reducoes": 0, "espera_tokens": 0.0,
+                      "latencia_media": 0.0}
+
+    def _balde(self, rota):
+        if rota not in self.baldes:
+            self.baldes[rota] = BaldeTokens(self.taxa_padrao)
+        return self.baldes[rota]
+
+    def _balde_instancia(self, instancia):
+        if instancia not in self.baldes_instancia:
+            self.baldes_instancia[instancia] = BaldeTokens(self.taxa_instancia)
+        return self.baldes_instancia[instancia]
+
+    async def _tokens(self, rota, instancia):
+        relogio = relogio_atual()
+        balde, balde_inst = self._balde(rota), self._balde_instancia(instancia)
+        while True:
+            agora = relogio.agora()
+            espera = max(balde.espera(agora), balde_inst.espera(agora))
+            if espera <= 0:
+                balde.consumir()
+                balde_inst.consumir()
+                return
+            self.stats["espera_tokens"] += espera
+            await relogio.dormir(espera)
+
+    async def _vaga(self):
+        if self._em_uso < int(self.limite) and not self._esperando:
+            self._em_uso += 1
+            return
+        futuro = asyncio.get_running_loop().create_future()
+        self._esperando.append(futuro)
+        try:
+            await futuro
+        except asyncio.CancelledError:
+            if futuro.done() and not futuro.cancelled():
+                self._soltar()  # a vaga chegou junto com o cancelamento
+            elif futuro in self._esperando:
+                self._esperando.remove(futuro)
+            raise
+
+    def _soltar(self):
+        self._em_uso -= 1
+        self._acordar()
+
+    def _acordar(self):
+        while self._esperando and self._em_uso < int(self.limite):
+            futuro = self._esperando.popleft()
+            if not futuro.done():
+                self._em_uso += 1
+                futuro.set_result(None)
+
+    async def adquirir(self, rota, instancia):
+        await self._tokens(rota, instancia)
+        await self._vaga()
+
+    #status None = erro de rede/timeout
+    def liberar(self, latencia, status=None):
+        self.stats["requisicoes"] += 1
+        self.stats["latencia_media"] += 0.1 * (latencia - self.stats["latencia_media"])
+        if status in STATUS_SOBRECARGA or status is None or latencia > self.latencia_alvo:
+            if status in STATUS_SOBRECARGA:
+                self.stats["sobrecarga"] += 1
+                M_SOBRECARGA.inc(status=str(status))
+            self._reduzir()
+        else:
+            # aumento aditivo: +1 vaga a cada `limite` respostas boas
+            self.limite = min(self.concorrencia_max, self.limite + 1 / self.limite)
+        self._soltar()
+
+    def _reduzir(self):
+        agora = relogio_atual().agora()
+        # várias respostas ruins da mesma rajada contam como uma só redução
+        if agora - self._ultima_reducao < self.intervalo_reducao:
+            return
+        self._ultima_reducao = agora
+        self.limite = max(self.concorrencia_min, self.limite / 2)
+        self.stats["reducoes"] += 1
+
+    #ajuste manual das taxas em tempo de execução
+    def definir_taxa(self, rota, taxa):
+        self._balde(rota).taxa = taxa
+
+    #ajuste manual do teto de concorrência: o limite vai direto ao teto e o AIMD continua dali
+    def definir_concorrencia(self, maximo):
+        self.concorrencia_max = max(self.concorrencia_min, maximo)
+        self.limite = float(self.concorrencia_max)
+        self._acordar()
+
+    def estatisticas(self):
+        return {
+            "concorrencia_limite": round(self.limite, 2),
+            "em_uso": self._em_uso,
+            "esperando": len(self._esperando),
+            "requisicoes": self.stats["requisicoes"],
+            "sobrecarga_429_503": self.stats["sobrecarga"],
+            "reducoes": self.stats["reducoes"],
+            "latencia_media": round(self.stats["latencia_media"], 3),
+            "espera_tokens_total": round(self.stats["espera_tokens"], 2),
+            "tokens": {rota: round(b.tokens, 2) for rota, b in self.baldes.items()},
+            "instancias": len(self.baldes_instancia),
+        }
+
+
+limitador = LimitadorGTI()
+
+metricas.medidor("gti_concorrencia_limite", "Limite AIMD de requisições simultâneas à API GTI", lambda: limitador.limite)
+metricas.medidor("gti_em_uso", "Requisições à API GTI em andamento", lambda: limitador._em_uso)
+metricas.medidor("gti_esperando", "Requisições esperando vaga no limitador", lambda: len(limitador._esperando))
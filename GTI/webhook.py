@@ -0,0 +1,206 @@
+import asyncio
+import hmac
+import json
+import os
+
+from utilis.metricas import metricas
+
+# ===========================
+# Receptor de webhook da GTI
+# ===========================
+# em vez de consultar /instance/status de cada agente, a GTI avisa quando uma instância
+# conecta ou cai (evento "connection"). Cada agente assina o webhook com a própria URL
+# (WEBHOOK_URL/<nome>) e, com addUrlEvents, a GTI acrescenta o tipo do evento no fim:
+#   POST /webhook/<nome>/connection
+# O receptor atualiza `conectado`/`numero` do agente na hora e chama os callbacks
+# registrados (ex.: parear quem conectou, parar as conversas de quem caiu).
+# Só age em evento autenticado: o corpo traz o token da própria instância (a GTI manda) ou
+# o proxy na frente do receptor manda o segredo compartilhado no header WEBHOOK_CABECALHO.
+# O nome no caminho sozinho não vale nada (qualquer um que alcance a porta sabe os nomes);
+# sem token ele só identifica o agente quando o segredo confere. O resto recebe 401.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # URL pública que chega neste receptor (vazio = desligado)
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")  # atrás de um proxy; 0.0.0.0 só de propósito
+WEBHOOK_PORTA = int(os.getenv("WEBHOOK_PORTA", "8088"))
+WEBHOOK_SEGREDO = os.getenv("WEBHOOK_SEGREDO", "")  # vazio = só o token da instância autentica
+WEBHOOK_CABECALHO = os.getenv("WEBHOOK_CABECALHO", "X-Webhook-Segredo")
+
+ESTADOS_CONECTADO = {"connected", "open", "online"}
+ESTADOS_DESCONECTADO = {"disconnected", "close", "closed", "offline", "logout"}
+
+M_EVENTOS = metricas.contador("gti_webhook_eventos_total", "Eventos recebidos do webhook GTI", ("evento", "resultado"))
+
+_RECUSADO = object()
+
+
+#True/False quando o evento diz o estado da conexão, None quando não diz
+def estado_conexao(corpo):
+    instancia = corpo.get("instance") if isinstance(corpo.get("instance"), dict) else {}
+    status = corpo.get("status")
+    if isinstance(status, dict) and isinstance(status.get("connected"), bool):
+        return status["connected"]  # mesmo formato do /instance/status
+    for valor in (instancia.get("status"), status, corpo.get("state")):
+        if isinstance(valor, str):
+            if valor.lower() in ESTADOS_CONECTADO:
+                return True
+            if valor.lower() in ESTADOS_DESCONECTADO:
+                return False
+    return None
+
+
+class ReceptorWebhook:
+    def __init__(self, agentes=(), host=WEBHOOK_HOST, porta=WEBHOOK_PORTA, caminho="/webhook",
+                 segredo=WEBHOOK_SEGREDO, cabecalho=WEBHOOK_CABECALHO):
+        self.host = host
+        self.porta = porta
+        self.caminho = caminho.rstrip("/")
+        self.segredo = segredo
+        self.cabecalho = cabecalho.lower()
+        self.por_nome = {}
+        self.por_token = {}
+        self.ao_conectar = []  # callbacks(agente)
+        self.ao_desconectar = []
+        self.servidor = None
+        self.stats = {"eventos": 0, "conexao": 0, "desconexao": 0, "desconhecidos": 0, "ignorados": 0,
+                      "recusados": 0}
+        for agente in agentes:
+            self.registrar(agente)
+
+    def registrar(self, agente):
+        self.por_nome[agente.nome] = agente
+        self.por_token[agente.token] = agente
+
+    def remover(self, agente):
+        self.por_nome.pop(agente.nome, None)
+        self.por_token.pop(agente.token, None)
+
+    #URL que o agente deve assinar na GTI
+    def url_agente(self, agente, base=WEBHOOK_URL):
+        return f"{base.rstrip('/')}/{agente.nome}"
+
+    async def iniciar(self):
+        self.servidor = await asyncio.start_server(self._conexao, self.host, self.porta)
+        self.porta = self.servidor.sockets[0].getsockname()[1]
+        print(f"📬 Webhook GTI em http://{self.host}:{self.porta}{self.caminho}")
+        return self.servidor
+
+    async def parar(self):
+        if self.servidor:
+            self.servidor.close()
+            await self.servidor.wait_closed()
+
+    #assina o webhook de cada agente (com no máximo `max_paralelo` chamadas ao mesmo tempo)
+    async def assinar(self, agentes, base=WEBHOOK_URL, max_paralelo=20):
+        sem = asyncio.Semaphore(max_paralelo)
+
+        async def assinar_um(ag):
+            async with sem:
+                await ag.atualizar_webhook_async(self.url_agente(ag, base))
+
+        await asyncio.gather(*(assinar_um(ag) for ag in agentes), return_exceptions=True)
+
+    async def _conexao(self, reader, writer):
+        try:
+            while True:
+                linha = await reader.readline()
+                if not linha:
+                    break
+                partes = linha.decode("latin-1").split()
+                if len(partes) < 2:
+                    break
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    chave, _, valor = h.decode("latin-1").partition(":")
+                    headers[chave.strip().lower()] = valor.strip()
+                corpo = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+                aceito = partes[0] != "POST" or self.processar(partes[1].split("?")[0], corpo, headers)
+                # os callbacks só agendam trabalho: a GTI não espera o pareamento
+                if aceito:
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 11\r\n\r\n"
+                                 b'{"ok":true}')
+                else:
+                    writer.write(b"HTTP/1.1 401 Unauthorized\r\nContent-Type: application/json\r\n"
+                                 b'Content-Length: 12\r\n\r\n{"ok":false}')
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except Exception as e:
+            print(f"⚠️ Erro no webhook GTI: {e}")
+        finally:
+            writer.close()
+
+    #agente do evento, _RECUSADO se não autenticou (None = autenticado mas agente desconhecido)
+    def _identificar(self, nome, dados, headers):
+        instancia = dados.get("instance") if isinstance(dados.get("instance"), dict) else {}
+        token = dados.get("token") or instancia.get("token")
+        agente = self.por_token.get(token) if isinstance(token, str) else None
+        if agente is not None:
+            # token de uma instância no caminho de outra: alguém trocou o nome
+            return agente if nome is None or nome is agente else _RECUSADO
+        segredo = headers.get(self.cabecalho, "")
+        if self.segredo and hmac.compare_digest(segredo.encode(), self.segredo.encode()):
+            return nome
+        return _RECUSADO
+
+    #caminho = /webhook[/<nome>][/<evento>]; o corpo também pode trazer token/EventType
+    #devolve False quando o evento não autenticou (vira 401)
+    def processar(self, caminho, corpo, headers=None):
+        self.stats["eventos"] += 1
+        try:
+            dados = json.loads(corpo) if corpo else {}
+        except ValueError:
+            dados = {}
+        if not isinstance(dados, dict):
+            dados = {}
+
+        segmentos = [s for s in caminho[len(self.caminho):].split("/") if s] if caminho.startswith(self.caminho) else []
+        nome = self.por_nome.get(segmentos[0]) if segmentos else None
+        evento = segmentos[-1] if len(segmentos) > 1 or (segmentos and nome is None) else None
+        evento = (evento or dados.get("EventType") or dados.get("event") or "").lower()
+
+        agente = self._identificar(nome, dados, headers or {})
+        if agente is _RECUSADO:
+            self.stats["recusados"] += 1
+            M_EVENTOS.inc(evento=evento or "?", resultado="recusado")
+            return False
+        if agente is None:
+            self.stats["desconhecidos"] += 1
+            M_EVENTOS.inc(evento=evento or "?", resultado="desconhecido")
+            return True
+
+        if evento != "connection":
+            self.stats["ignorados"] += 1
+            M_EVENTOS.inc(evento=evento or "?", resultado="ignorado")
+            return True
+
+        conectado = estado_conexao(dados)
+        if conectado is None:
+            self.stats["ignorados"] += 1
+            M_EVENTOS.inc(evento=evento, resultado="ignorado")
+            return True
+        instancia = dados.get("instance") if isinstance(dados.get("instance"), dict) else {}
+        if instancia.get("owner"):
+            agente.numero = instancia["owner"]
+        M_EVENTOS.inc(evento=evento, resultado="ok")
+        self.atualizar(agente, conectado)
+        return True
+
+    #muda o estado do agente e avisa os callbacks só quando o estado realmente mudou
+    def atualizar(self, agente, conectado):
+        if agente.conectado == conectado:
+            return
+        agente.conectado = conectado
+        self.stats["conexao" if conectado else "desconexao"] += 1
+        print(f"{'🟢' if conectado else '🔴'} {agente.nome} {'conectou' if conectado else 'desconectou'} (webhook)")
+        for callback in (self.ao_conectar if conectado else self.ao_desconectar):
+            try:
+                callback(agente)
+            except Exception as e:
+                print(f"⚠️ Erro no callback do webhook ({agente.nome}): {e}")
+
+    def estatisticas(self):
+        return {**self.stats, "agentes": len(self.por_nome)}
@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from functools import wraps
+
+from IA.contexto import ContextoConversa
+from utilis.metricas import metricas
+
+# ===========================
+# Cache de respostas do LLM
+# ===========================
+# mensagens curtas de WhatsApp se repetem muito ("opa, tudo bem?"), e o prompt de sistema é
+# sempre o mesmo, então a mesma entrada pede quase sempre a mesma resposta. A chave é a última
+# mensagem normalizada + prompt_extra + uma assinatura do contexto (começo ou não, hash do resumo
+# das mensagens antigas e, se configurado, as últimas mensagens); cada chave guarda alguns
+# candidatos e só passa a responder do cache depois de `min_candidatos` gerações para ela,
+# sorteando um diferente do último entregue (os pares não ficam repetindo a mesma frase).
+# LRU com no máximo `max_chaves` chaves, candidatos expiram depois de `ttl` segundos e o cache
+# pode ser gravado em disco (JSON) para sobreviver ao restart, a cada IA_CACHE_SALVAR segundos.
+# Textos de fallback (ex.: "não consegui pensar") ficam em `ignorar` e nunca são guardados.
+IA_CACHE_CHAVES = int(os.getenv("IA_CACHE_CHAVES", "5000"))
+IA_CACHE_TTL = float(os.getenv("IA_CACHE_TTL", "21600"))  # 6 horas
+IA_CACHE_CONTEXTO = int(os.getenv("IA_CACHE_CONTEXTO", "0"))  # mensagens anteriores que entram na chave
+IA_CACHE_ARQUIVO = os.getenv("IA_CACHE_ARQUIVO", "")  # vazio = só em memória
+IA_CACHE_SALVAR = float(os.getenv("IA_CACHE_SALVAR", "300"))  # segundos entre gravações (0 = só no fim)
+PALAVRAS_CHAVE = 12  # a chave usa só o começo da mensagem
+
+M_CACHE = metricas.contador("ia_cache_total", "Consultas ao cache de respostas", ("resultado",))
+
+
+def normalizar(texto):
+    #minúsculas, sem acento, emoji e pontuação, espaços colapsados
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[^a-z0-9 ]+", " ", texto).split()[:PALAVRAS_CHAVE])
+
+
+class CacheRespostas:
+    def __init__(self, max_chaves=IA_CACHE_CHAVES, ttl=IA_CACHE_TTL, candidatos=4, min_candidatos=3,
+                 contexto=IA_CACHE_CONTEXTO):
+        self.max_chaves = max_chaves
+        self.ttl = ttl
+        self.candidatos = candidatos
+        self.min_candidatos = min_candidatos
+        self.contexto = contexto
+        self.entradas = OrderedDict()  # chave -> {"itens": [[texto, criado_em], ...], "ultimo": índice, "geracoes": n}
+        self.ignorar = set()  # respostas de fallback dos backends: nunca entram no cache
+        self._trava = threading.Lock()  # backends síncronos consultam de threads do pool
+        self.stats = {"acertos": 0, "faltas": 0, "expirados": 0, "removidos_lru": 0}
+
+    def chave(self, user_message, historico=None, prompt_extra=""):
+        if isinstance(historico, ContextoConversa):
+            mensagens, total = historico.mensagens_prompt(), historico.total
+        else:
+            mensagens, total = list(historico or []), len(historico or [])
+        textos = [m.get("content", "") for m in mensagens if m.get("role") != "system"]
+        if textos and textos[-1] == user_message:
+            textos.pop()  # a própria mensagem já está no fim do contexto
+        anteriores = textos[-self.contexto:] if self.contexto else []
+        # o resumo das mensagens antigas vai no prompt, então entra na chave (só o hash, ele é grande)
+        resumo = "\n".join(m.get("content", "") for m in mensagens if m.get("role") == "system")
+        resumo = hashlib.blake2b(resumo.encode(), digest_size=8).hexdigest() if resumo else ""
+        # começo de conversa ou não + resumo + as últimas mensagens anteriores (se configurado)
+        assinatura = "|".join(["inicio" if total <= 1 else "conversa", resumo] + [normalizar(t) for t in anteriores])
+        return f"{normalizar(user_message)}\x1f{prompt_extra}\x1f{assinatura}"
+
+    def _validos(self, entrada, agora):
+        itens = [item for item in entrada["itens"] if agora - item[1] < self.ttl]
+        self.stats["expirados"] += len(entrada["itens"]) - len(itens)
+        entrada["itens"] = itens
+        return itens
+
+    #resposta do cache ou None (falta: a geração deve ser feita e guardada com guardar())
+    def buscar(self, chave):
+        agora = time.time()
+        with self._trava:
+            entrada = self.entradas.get(chave)
+            if entrada is not None:
+                self.entradas.move_to_end(chave)
+                itens = self._validos(entrada, agora)
+                # modelo que sempre devolve o mesmo texto não junta candidatos: conta as gerações
+                if itens and max(len(itens), entrada["geracoes"]) >= self.min_candidatos:
+                    opcoes = [i for i in range(len(itens)) if i != entrada["ultimo"]] or [0]
+                    entrada["ultimo"] = random.choice(opcoes)
+                    self.stats["acertos"] += 1
+                    M_CACHE.inc(resultado="acerto")
+                    return itens[entrada["ultimo"]][0]
+            self.stats["faltas"] += 1
+            M_CACHE.inc(resultado="falta")
+            return None
+
+    def guardar(self, chave, texto):
+        if not texto or texto in self.ignorar:
+            return
+        with self._trava:
+            entrada = self.entradas.get(chave)
+            if entrada is None:
+                entrada = self.entradas[chave] = {"itens": [], "ultimo": -1, "geracoes": 0}
+            self.entradas.move_to_end(chave)
+            entrada["geracoes"] += 1
+            if all(item[0] != texto for item in entrada["itens"]):
+                entrada["itens"].append([texto, time.time()])
+                # cheio: sai o candidato mais velho
+                del entrada["itens"][:-self.candidatos]
+            while len(self.entradas) > self.max_chaves:
+                self.entradas.popitem(last=False)
+                self.stats["removidos_lru"] += 1
+
+    #envolve um gerar(user_message, historico, prompt_extra, ...) síncrono ou assíncrono
+    def envolver(self, gerar):
+        if asyncio.iscoroutinefunction(gerar):
+            @wraps(gerar)
+            async def com_cache_async(user_message, historico=None, prompt_extra="", **kwargs):
+                chave = self.chave(user_message, historico, prompt_extra)
+                resposta = self.buscar(chave)
+                if resposta is None:
+                    resposta = await gerar(user_message, historico, prompt_extra, **kwargs)
+                    self.guardar(chave, resposta)
+                return resposta
+            return com_cache_async
+
+        @wraps(gerar)
+        def com_cache(user_message, historico=None, prompt_extra="", **kwargs):
+            chave = self.chave(user_message, historico, prompt_extra)
+            resposta = self.buscar(chave)
+            if resposta is None:
+                resposta = gerar(user_message, historico, prompt_extra, **kwargs)
+                self.guardar(chave, resposta)
+            return resposta
+        return com_cache
+
+    # ======================== DISCO ========================
+    def salvar(self, caminho=IA_CACHE_ARQUIVO):
+        if not caminho:
+            return
+        with self._trava:
+            dados = {chave: entrada["itens"] for chave, entrada in self.entradas.items()}
+        try:
+            # com o supervisor vários processos gravam o mesmo arquivo (e a gravação periódica roda numa thread)
+            tmp = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(dados, f, ensure_ascii=False)
+            os.replace(tmp, caminho)
+        except Exception as e:
+            print(f"⚠️ Erro ao salvar cache de respostas: {e}")
+
+    #grava o cache a cada `intervalo` segundos (numa thread: o JSON pode ser grande)
+    async def salvar_periodico(self, intervalo=IA_CACHE_SALVAR, caminho=IA_CACHE_ARQUIVO):
+        while True:
+            await asyncio.sleep(intervalo)
+            await asyncio.to_thread(self.salvar, caminho)
+
+    def carregar(self, caminho=IA_CACHE_ARQUIVO):
+        if not caminho or not os.path.exists(caminho):
+            return 0
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Erro ao ler cache de respostas: {e}")
+            return 0
+        agora = time.time()
+        with self._trava:
+            for chave, itens in dados.items():
+                itens = [item for item in itens if agora - item[1] < self.ttl and item[0] not in self.ignorar]
+                if itens:
+                    itens = itens[-self.candidatos:]
+                    self.entradas[chave] = {"itens": itens, "ultimo": -1, "geracoes": len(itens)}
+            while len(self.entradas) > self.max_chaves:
+                self.entradas.popitem(last=False)
+        return len(self.entradas)
+
+    def estatisticas(self):
+        consultas = self.stats["acertos"] + self.stats["faltas"]
+        return {**self.stats, "chaves": len(self.entradas),
+                "taxa_acerto": round(self.stats["acertos"] / consultas, 3) if consultas else 0.0}
+
+
+cache_respostas = CacheRespostas()
@@ -0,0 +1,123 @@
+import os
+from collections import deque
+
+from utilis.utils import carregar_historico, anexar_historico, carregar_contexto, salvar_contexto
+
+JANELA_RECENTE = 3  # mensagens que vão inteiras no prompt
+TAMANHO_RESUMO = 150  # caracteres do "Resumo" das mensagens mais antigas
+HISTORICO_MEMORIA = int(os.getenv("HISTORICO_MEMORIA", "20"))  # mensagens por par mantidas em memória
+HISTORICO_MEMORIA_BYTES = int(os.getenv("HISTORICO_MEMORIA_BYTES", "8192"))  # teto aproximado por par
+CUSTO_MENSAGEM = 120  # bytes aproximados de uma Mensagem fora o texto
+
+
+#contexto de um par para montar o prompt em tempo constante:
+#guarda só as últimas mensagens e o resumo, atualizado a cada mensagem nova
+#(o resumo é o começo das mensagens que já saíram da janela, limitado a TAMANHO_RESUMO)
+class ContextoConversa:
+    def __init__(self, resumo="", recentes=None, total=0):
+        self.resumo = resumo
+        self.recentes = deque(recentes or [], maxlen=JANELA_RECENTE)
+        self.total = total
+
+    @classmethod
+    def de_historico(cls, historico):
+        contexto = cls()
+        for msg in historico:
+            contexto.adicionar(msg)
+        return contexto
+
+    #carrega o contexto salvo; se não existir, monta uma vez a partir do log completo
+    @classmethod
+    def carregar(cls, ag1, ag2):
+        dados = carregar_contexto(ag1, ag2)
+        if dados is not None:
+            return cls(dados.get("resumo", ""), dados.get("recentes"), dados.get("total", 0))
+        return cls.de_historico(carregar_historico(ag1, ag2, limite=None))
+
+    def salvar(self, ag1, ag2):
+        salvar_contexto(ag1, ag2, {"resumo": self.resumo, "recentes": list(self.recentes), "total": self.total})
+
+    def adicionar(self, msg):
+        if len(self.recentes) == JANELA_RECENTE:
+            self._resumir(self.recentes[0]["content"])
+        self.recentes.append(msg)
+        self.total += 1
+
+    def _resumir(self, conteudo):
+        # depois de cheio o resumo não muda mais, então o custo é O(1)
+        if len(self.resumo) >= TAMANHO_RESUMO:
+            return
+        self.resumo = (f"{self.resumo} {conteudo}" if self.resumo else conteudo)[:TAMANHO_RESUMO]
+
+    #mensagens prontas para o prompt: resumo (se houver mensagens antigas) + janela recente
+    def mensagens_prompt(self):
+        mensagens = list(self.recentes)
+        if self.total > JANELA_RECENTE:
+            mensagens.insert(0, {"role": "system", "content": f"Resumo: {self.resumo}..."})
+        return mensagens
+
+    def copia(self):
+        return ContextoConversa(self.resumo, self.recentes, self.total)
+
+
+#registro compacto de uma mensagem (sem o __dict__ de cada objeto)
+class Mensagem:
+    __slots__ = ("role", "content", "number", "time")
+
+    def __init__(self, role, content, number=None, time=None):
+        self.role = role
+        self.content = content
+        self.number = number
+        self.time = time
+
+    @classmethod
+    def de_dict(cls, msg):
+        return cls(msg.get("role"), msg.get("content", ""), msg.get("number"), msg.get("time"))
+
+    def como_dict(self):
+        return {"role": self.role, "content": self.content, "number": self.number, "time": self.time}
+
+    def tamanho(self):
+        return CUSTO_MENSAGEM + len(self.content or "")
+
+
+#histórico de um par com memória limitada: em memória só as últimas mensagens (até `janela`
+#mensagens e `max_bytes` aproximados; a última fica sempre, mesmo maior que o teto), o log completo vai direto para o JSONL em disco
+#(anexar_historico) e só é lido de lá quando alguém pede (completo()).
+class HistoricoPar:
+    __slots__ = ("ag1", "ag2", "janela", "max_bytes", "mensagens", "bytes")
+
+    def __init__(self, ag1, ag2, janela=HISTORICO_MEMORIA, max_bytes=HISTORICO_MEMORIA_BYTES):
+        self.ag1 = ag1
+        self.ag2 = ag2
+        self.janela = janela
+        self.max_bytes = max_bytes
+        self.mensagens = deque()
+        self.bytes = 0
+        for msg in carregar_historico(ag1, ag2, limite=janela):
+            self._guardar(Mensagem.de_dict(msg))
+
+    def _guardar(self, mensagem):
+        self.mensagens.append(mensagem)
+        self.bytes += mensagem.tamanho()
+        while len(self.mensagens) > 1 and (len(self.mensagens) > self.janela or self.bytes > self.max_bytes):
+            self.bytes -= self.mensagens.popleft().tamanho()
+
+    #grava no disco e guarda na janela; devolve a mensagem como dict
+    def adicionar(self, msg: dict):
+        anexar_historico(self.ag1, self.ag2, msg)
+        self._guardar(Mensagem.de_dict(msg))
+        return msg
+
+    def __len__(self):
+        return len(self.mensagens)
+
+    def __iter__(self):
+        return (m.como_dict() for m in self.mensagens)
+
+    def ultimas(self, n):
+        return [m.como_dict() for m in list(self.mensagens)[-n:]]
+
+    #log inteiro do par, lido do disco
+    def completo(self):
+        return carregar_historico(self.ag1, self.ag2, limite=None)
@@ -1,11 +1,20 @@
 import asyncio
-import datetime
+import heapq
+import itertools
 import os
 import random
+import re
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 import ollama
 from dotenv import load_dotenv
-from utilis.utils import carregar_historico, salvar_historico, delay_ms_async, retry
+from utilis.utils import segundos_delay, retry, salvar_checkpoint, carregar_checkpoint, apagar_checkpoint
+from utilis.agendador import Agendador
+from IA.contexto import ContextoConversa, HistoricoPar
+from IA.pregeracao import ABERTURA, CONTINUACAO
+from IA.cache import cache_respostas
+from IA.roteador import BackendIA, RoteadorIA
+from utilis.metricas import metricas
 from google import genai
 
 #colocar api key no arquivo .env
@@ -14,22 +23,158 @@ GENI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GENI_API_KEY:
     raise RuntimeError("GEMINI_API_KEY não configurada.")
 client = genai.Client(api_key=GENI_API_KEY)
-executor = ThreadPoolExecutor(max_workers=20)
 
-#gera a mensagem de Ia pelo ollama
-@retry(3, 1)
-def get_ia_response_ollama(user_message, historico=None, prompt_extra=""):
-    if not user_message:
-        return "🤔 Não entendi sua mensagem."
-
-    historico = historico or []
-    if len(historico) > 3:
-        resumo = " ".join([m["content"] for m in historico[:-3]])
-        historico = historico[-3:]
-        historico.insert(0, {
-            "role": "system",
-            "content": f"Resumo: {resumo[:150]}..."
-        })
+
+#pool dedicado de threads para as gerações, despachadas por prazo (earliest-deadline-first):
+#o pedido só vai para o executor quando há thread livre, então a resposta que precisa sair agora
+#nunca fica na fila atrás de uma que só será enviada daqui a 9 minutos
+class PoolEDF:
+    def __init__(self, max_workers=20):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._heap = []  # (prazo, seq, func, args, futuro)
+        self._seq = itertools.count()
+        self._livres = max_workers
+
+    async def executar(self, prazo, func, *args):
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        heapq.heappush(self._heap, (prazo, next(self._seq), func, args, futuro))
+        self._despachar(loop)
+        return await futuro
+
+    def _despachar(self, loop):
+        while self._livres > 0 and self._heap:
+            _, _, func, args, futuro = heapq.heappop(self._heap)
+            if futuro.done():  # quem pediu desistiu (conversa cancelada)
+                continue
+            self._livres -= 1
+            tarefa = loop.run_in_executor(self.executor, func, *args)
+            tarefa.add_done_callback(lambda t, f=futuro: self._concluir(loop, t, f))
+
+    def _concluir(self, loop, tarefa, futuro):
+        self._livres += 1
+        if not futuro.done():
+            if tarefa.exception() is not None:
+                futuro.set_exception(tarefa.exception())
+            else:
+                futuro.set_result(tarefa.result())
+        self._despachar(loop)
+
+    def pendentes(self):
+        return len(self._heap)
+
+    def em_execucao(self):
+        return max(0, self.max_workers - self._livres)
+
+    #muda o número de gerações simultâneas em tempo de execução; ao diminuir, as que já
+    #estão rodando terminam normalmente e só então as vagas somem
+    def redimensionar(self, max_workers):
+        if max_workers > self.executor._max_workers:
+            antigo, self.executor = self.executor, ThreadPoolExecutor(max_workers=max_workers)
+            antigo.shutdown(wait=False)
+        self._livres += max_workers - self.max_workers
+        self.max_workers = max_workers
+        self._despachar(asyncio.get_running_loop())
+
+
+pool_llm = PoolEDF(max_workers=20)
+
+M_LOTE = metricas.histograma("ia_lote_tamanho", "Pedidos por lote da fila de inferência",
+                             buckets=(1, 2, 4, 8, 16, 32, 64))
+M_ESPERA_FILA = metricas.histograma("ia_espera_fila_segundos", "Tempo do pedido na fila de inferência até começar a gerar")
+M_MENSAGENS = metricas.contador("conversa_mensagens_total", "Mensagens enviadas pelas conversas", ("resultado",))
+_envios_recentes = deque(maxlen=100_000)  # loop.time() de cada envio ok (para msgs/min)
+
+
+#mensagens enviadas com sucesso no último minuto (ou na `janela` dada, em segundos)
+def mensagens_por_minuto(janela=60.0):
+    limite = asyncio.get_running_loop().time() - janela
+    n = 0
+    for quando in reversed(_envios_recentes):
+        if quando < limite:
+            break
+        n += 1
+    return round(n * 60.0 / janela, 2)
+
+OLLAMA_MODELO = "TinyLlama"
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # mantém o modelo carregado entre as falas
+OLLAMA_MAX_TOKENS = int(os.getenv("OLLAMA_MAX_TOKENS", "96"))  # teto no servidor, caso o corte não aconteça antes
+
+#textos de fallback dos backends: vão para a conversa, mas nunca para o cache de respostas
+RESPOSTA_VAZIA = "😅 Não consegui pensar em nada agora."
+RESPOSTA_SEM_MENSAGEM = "🤔 Não entendi sua mensagem."
+RESPOSTA_ERRO = "⚠️ Deu ruim aqui 😅"
+cache_respostas.ignorar.update({RESPOSTA_VAZIA, RESPOSTA_SEM_MENSAGEM, RESPOSTA_ERRO})
+
+# ===========================
+# Streaming com corte no limite da mensagem
+# ===========================
+# lê os tokens conforme chegam e para a geração assim que a resposta já passou do tamanho
+# que vai ser enviado (caracteres, palavras, primeira frase ou quebra de linha)
+IA_STREAM = os.getenv("IA_STREAM", "1") == "1"
+LIMITE_CARACTERES = 120
+LIMITE_PALAVRAS = 20
+MIN_FRASE = 20  # só corta na primeira frase se ela tiver pelo menos isso
+_FIM_FRASE = re.compile(r"([.!?…]+[^\w\n]*?)\s+(?=\w)")
+_LIMITE_PROMPT = re.compile(r"<=\s*(\d+)\s*caracteres")
+
+
+#usa o limite pedido no prompt_extra, ex. "(<=80 caracteres)"
+def _limite_caracteres(prompt_extra):
+    m = _LIMITE_PROMPT.search(prompt_extra or "")
+    return int(m.group(1)) if m else LIMITE_CARACTERES
+
+
+#posição onde a resposta deve ser cortada, ou None se ainda cabe
+def _ponto_de_corte(texto, max_caracteres=LIMITE_CARACTERES):
+    cortes = []
+    quebra = texto.find("\n")
+    if quebra > 0:
+        cortes.append(quebra)
+    for m in _FIM_FRASE.finditer(texto):
+        if m.end(1) >= MIN_FRASE:
+            cortes.append(m.end(1))
+            break
+    palavras = list(re.finditer(r"\S+", texto))
+    if len(palavras) > LIMITE_PALAVRAS:
+        cortes.append(palavras[LIMITE_PALAVRAS - 1].end())
+    if len(texto) > max_caracteres:
+        espaco = texto.rfind(" ", 0, max_caracteres + 1)
+        cortes.append(espaco if espaco > 0 else max_caracteres)
+    return min(cortes) if cortes else None
+
+
+def _cortar_resposta(texto, max_caracteres=LIMITE_CARACTERES):
+    texto = (texto or "").strip()
+    corte = _ponto_de_corte(texto, max_caracteres)
+    return texto if corte is None else texto[:corte].strip()
+
+
+#consome o stream até o ponto de corte e fecha a conexão (o servidor para de gerar)
+def _ler_stream(stream, extrair, max_caracteres=LIMITE_CARACTERES):
+    texto = ""
+    try:
+        for pedaco in stream:
+            texto = (texto + (extrair(pedaco) or "")).lstrip()
+            if _ponto_de_corte(texto, max_caracteres) is not None:
+                break
+    finally:
+        fechar = getattr(stream, "close", None)
+        if fechar:
+            fechar()
+    return _cortar_resposta(texto, max_caracteres)
+
+
+#histórico para o prompt: aceita o ContextoConversa (tempo constante) ou a lista completa de mensagens
+def _historico_prompt(historico):
+    if isinstance(historico, ContextoConversa):
+        return historico.mensagens_prompt()
+    return ContextoConversa.de_historico(historico or []).mensagens_prompt()
+
+#monta as mensagens no formato do ollama
+def _montar_mensagens_ollama(user_message, historico=None, prompt_extra=""):
+    historico = _historico_prompt(historico)
 
     #prompt para personalidade do agente
     mensagens = [{
@@ -54,29 +199,162 @@ def get_ia_response_ollama(user_message, historico=None, prompt_extra=""):
 
     # Adiciona última fala do usuário
     mensagens.append({"role": "user", "content": user_message})
+    return mensagens
+
+def _chamar_ollama(mensagens, max_caracteres=LIMITE_CARACTERES):
+    if IA_STREAM:
+        stream = ollama.chat(model=OLLAMA_MODELO, messages=mensagens, keep_alive=OLLAMA_KEEP_ALIVE,
+                             options={"num_predict": OLLAMA_MAX_TOKENS}, stream=True)
+        texto = _ler_stream(stream, lambda p: p.get("message", {}).get("content", ""), max_caracteres)
+    else:
+        response = ollama.chat(model=OLLAMA_MODELO, messages=mensagens, keep_alive=OLLAMA_KEEP_ALIVE,
+                               options={"num_predict": OLLAMA_MAX_TOKENS})
+        texto = _cortar_resposta(response.get("message", {}).get("content", ""), max_caracteres)
+    return texto or RESPOSTA_VAZIA
+
+#backend ollama para o roteador: lança exceção quando falha
+def gerar_ollama(user_message, historico=None, prompt_extra=""):
+    if not user_message:
+        return RESPOSTA_SEM_MENSAGEM
+    return _chamar_ollama(_montar_mensagens_ollama(user_message, historico, prompt_extra),
+                          _limite_caracteres(prompt_extra))
+
+#gera a mensagem de Ia pelo ollama (com novas tentativas; nunca lança exceção)
+#cache fica por fora do retry: só resposta de verdade é guardada, nunca a mensagem de erro
+_gerar_ollama_cache = cache_respostas.envolver(retry(3, 1)(gerar_ollama))
 
+def get_ia_response_ollama(user_message, historico=None, prompt_extra=""):
     try:
-        response = ollama.chat(model="TinyLlama", messages=mensagens)
-        return (
-                response.get("message", {}).get("content", "").strip()
-                or "😅 Não consegui pensar em nada agora."
-        )
+        return _gerar_ollama_cache(user_message, historico, prompt_extra)
     except Exception as e:
         print(f"⚠️ Erro IA: {e}")
-        return "⚠️ Deu ruim aqui 😅"
+        return RESPOSTA_ERRO
 
-#gera a mensagem de Ia pelo gemini
-@retry(3, 1)
-def get_ia_response_gemini(user_message, historico=None, prompt_extra=""):
-    if not user_message:
-        return "🤔 Não entendi sua mensagem."
+#fila de inferência do ollama: junta os pedidos de todas as conversas que chegam dentro de
+#`janela` segundos e dispara todos juntos, com no máximo `max_paralelo` chamadas ao mesmo tempo.
+#Não é inferência em lote: cada pedido continua sendo uma chamada própria no PoolEDF, a janela é
+#só um atraso de coleta para as chamadas chegarem juntas ao servidor (quem agrupa as requisições
+#simultâneas no modelo carregado é o próprio ollama, com OLLAMA_NUM_PARALLEL). janela=0 desliga.
+class ServicoInferencia:
+    def __init__(self, janela=0.05, max_lote=16, max_paralelo=4):
+        self.janela = janela
+        self.max_lote = max_lote
+        self.max_paralelo = max_paralelo
+        self.fila = None
+        self.pool = PoolEDF(max_workers=max_paralelo)
+        self._tarefa = None
+        self._lotes_ativos = set()
+        self.stats = {"pedidos": 0, "concluidos": 0, "lotes": 0, "maior_lote": 0,
+                      "espera_fila_total": 0.0, "tempo_geracao_total": 0.0}
+
+    def iniciar(self):
+        self.fila = asyncio.Queue()
+        self._tarefa = asyncio.create_task(self._coletar())
+
+    async def aquecer(self):
+        #carrega o modelo na memória antes das primeiras conversas
+        try:
+            await asyncio.to_thread(ollama.generate, model=OLLAMA_MODELO, prompt="", keep_alive=OLLAMA_KEEP_ALIVE)
+        except Exception as e:
+            print(f"⚠️ Erro ao aquecer modelo {OLLAMA_MODELO}: {e}")
+
+    #mesma assinatura de get_ia_response_ollama, mas assíncrona e passando pela fila;
+    #`prazo` é o instante (loop.time()) em que a resposta vai ser enviada, None = agora;
+    #`execucao` (lista) recebe o tempo da chamada ao ollama, sem a espera na fila (para o roteador)
+    async def gerar(self, user_message, historico=None, prompt_extra="", prazo=None, execucao=None):
+        if not user_message:
+            return RESPOSTA_SEM_MENSAGEM
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        agora = loop.time()
+        mensagens = _montar_mensagens_ollama(user_message, historico, prompt_extra)
+        self.fila.put_nowait((mensagens, _limite_caracteres(prompt_extra), futuro, agora,
+                              agora if prazo is None else prazo, execucao))
+        self.stats["pedidos"] += 1
+        return await futuro
+
+    async def _coletar(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = [await self.fila.get()]
+            limite = loop.time() + self.janela
+            while len(lote) < self.max_lote and self.janela > 0:
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(await asyncio.wait_for(self.fila.get(), restante))
+                except asyncio.TimeoutError:
+                    break
+
+            self.stats["lotes"] += 1
+            M_LOTE.observar(len(lote))
+            self.stats["maior_lote"] = max(self.stats["maior_lote"], len(lote))
+            tarefa = asyncio.create_task(self._processar_lote(lote))
+            self._lotes_ativos.add(tarefa)
+            tarefa.add_done_callback(self._lotes_ativos.discard)
+
+    async def _processar_lote(self, lote):
+        await asyncio.gather(*(self._processar(*item) for item in lote))
+
+    async def _processar(self, mensagens, max_caracteres, futuro, enfileirado, prazo, execucao):
+        loop = asyncio.get_running_loop()
+        inicio = [None]
 
-    historico = historico or []
+        def chamar():
+            inicio[0] = loop.time()
+            return _chamar_ollama(mensagens, max_caracteres)
 
-    if len(historico) > 3:
-        resumo = " ".join([m["content"] for m in historico[:-3]])
-        historico = historico[-3:]
-        historico.insert(0, {"role": "system", "content": f"Resumo: {resumo[:150]}..."})
+        try:
+            # o pool só despacha quando tem vaga, sempre o pedido de prazo mais próximo
+            resposta = await self.pool.executar(prazo, chamar)
+        except Exception as e:
+            if not futuro.done():
+                futuro.set_exception(e)
+            return
+        finally:
+            fim = loop.time()
+            comeco = inicio[0] or fim
+            self.stats["espera_fila_total"] += comeco - enfileirado
+            M_ESPERA_FILA.observar(comeco - enfileirado)
+            self.stats["tempo_geracao_total"] += fim - comeco
+            self.stats["concluidos"] += 1
+            if execucao is not None:
+                execucao.append(fim - comeco)
+        if not futuro.done():
+            futuro.set_result(resposta)
+
+    #pedidos ainda sem resposta (na fila de coleta, esperando vaga no pool ou gerando)
+    def pendentes(self):
+        return self.stats["pedidos"] - self.stats["concluidos"]
+
+    def estatisticas(self):
+        concluidos = self.stats["concluidos"] or 1
+        lotes = self.stats["lotes"] or 1
+        gerando = self.pool.em_execucao()
+        return {
+            "fila": max(0, self.pendentes() - gerando),  # esperando: coleta + vaga no pool
+            "gerando": gerando,  # chamadas ao ollama rodando agora
+            "lotes": self.stats["lotes"],
+            "lote_medio": round(self.stats["pedidos"] / lotes, 2),
+            "maior_lote": self.stats["maior_lote"],
+            "espera_fila_media": round(self.stats["espera_fila_total"] / concluidos, 3),
+            "geracao_media": round(self.stats["tempo_geracao_total"] / concluidos, 3),
+        }
+
+    async def parar(self):
+        if self._tarefa:
+            self._tarefa.cancel()
+        for tarefa in list(self._lotes_ativos):
+            tarefa.cancel()
+        self.pool.executor.shutdown(wait=False, cancel_futures=True)
+
+#backend gemini para o roteador: lança exceção quando falha
+def gerar_gemini(user_message, historico=None, prompt_extra=""):
+    if not user_message:
+        return RESPOSTA_SEM_MENSAGEM
+
+    historico = _historico_prompt(historico)
 
     contexto = "\n".join([f"{m['role']}: {m['content']}" for m in historico])
     prompt = (
@@ -87,81 +365,285 @@ def get_ia_response_gemini(user_message, historico=None, prompt_extra=""):
         f"{prompt_extra}\n{contexto}\nuser: {user_message}"
     )
 
+    max_caracteres = _limite_caracteres(prompt_extra)
+    config = genai.types.GenerateContentConfig(
+        max_output_tokens=20,
+        temperature=0.3
+    )
+    if IA_STREAM:
+        stream = client.models.generate_content_stream(model="gemini-1.5-flash", contents=prompt, config=config)
+        return _ler_stream(stream, lambda p: p.text, max_caracteres)
+    resp = client.models.generate_content(model="gemini-1.5-flash", contents=prompt, config=config)
+    return _cortar_resposta(resp.text, max_caracteres)
+
+#gera a mensagem de Ia pelo gemini (com novas tentativas; nunca lança exceção)
+_gerar_gemini_cache = cache_respostas.envolver(retry(3, 1)(gerar_gemini))
+
+def get_ia_response_gemini(user_message, historico=None, prompt_extra=""):
     try:
-        resp = client.models.generate_content(
-            model="gemini-1.5-flash",
-            contents=prompt,
-            generation_config=genai.types.GenerationConfig(
-                max_output_tokens=20,
-                temperature=0.3
-            )
-        )
-        return resp.text.strip()  # <-- faltava retornar a resposta
+        return _gerar_gemini_cache(user_message, historico, prompt_extra)
     except Exception as e:
         print(f"⚠️ Erro IA Gemini: {e}")
-        return "⚠️ Deu ruim aqui 😅"
+        return RESPOSTA_ERRO
 
 
-#funcao de conversa entre agentes criados
-#param - escolha dos agentes para conversa, quantidade de turnos, modo de intervalo de mensagens, modelo de ia(ollama ou gemini)
-async def conversar_async(agente1, agente2, max_turnos=10, test_mode=False, get_ia_response=get_ia_response_ollama):
-    historico = carregar_historico(agente1, agente2)
-    print(f"🤖 Iniciando conversa entre {agente1.nome} e {agente2.nome}")
+#roteador padrão: ollama como principal, gemini quando o ollama estiver lento ou fora;
+#as conversas chamam pelo cache, que só vai ao roteador (e a um dos backends) quando falta
+roteador = RoteadorIA([BackendIA("ollama", gerar_ollama), BackendIA("gemini", gerar_gemini)], pool=pool_llm)
+gerar_com_cache = cache_respostas.envolver(roteador.gerar)
 
-    # Agente 1 inicia
-    msg = await asyncio.to_thread(get_ia_response, " ", historico, "Inicie uma conversa casual")
-    count1, count2 = 0, 0
 
-    for _ in range(max_turnos):
-        # Agente 1 envia
-        enviado, resultado = await enviar_mensagem_async(agente1, agente2.numero, msg)
-        if not enviado:
-            print(f"{agente1.nome} falhou no envio. ({count1} msgs enviadas)")
-            print(f"{agente2.nome}: {resultado['message']}")
-            break
-        historico.append({"role": agente1.nome, "content": msg, "number": agente1.numero,
-                          "time": datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")})
-        print(f"{agente1.nome}: {msg} → {agente2.nome} {datetime.datetime.now().strftime('%H:%M:%S')}")
-        count1 += 1
-        salvar_historico(agente1, agente2, historico)
-        # já dispara a resposta do agente 2 em paralelo
-        tarefa_resposta2 = asyncio.create_task(
-            asyncio.to_thread(get_ia_response, msg, historico, "Responda curto e natural (<=80 caracteres)")
-        )
+#conversa entre dois agentes como máquina de estados, executada pelo Agendador
+#cada passo envia a fala já gerada, dispara a geração da próxima e devolve o atraso até o próximo envio
+class Conversa:
+    PROMPT_INICIO = "Inicie uma conversa casual"
+    PROMPT_RESPOSTA = "Responda curto e natural (<=80 caracteres)"
+    PROMPT_CONTINUAR = "Continue a conversa de forma resumida (<=120 caracteres)"
 
-        minutos = random.randint(1, 10)
-        print(
-            f"Proxima mensagem do {agente2.nome} em {minutos} minutos para {agente1.nome} {datetime.datetime.now().strftime('%H:%M:%S')}")
-        await delay_ms_async(minutos, test_mode)
+    MAX_FALHAS = 3  # gerações seguidas sem nenhum backend antes de desistir
+    ESPERA_FALHA = 30  # segundos até tentar de novo
+
+    #retomar = continua do checkpoint do par, se houver
+    #pregeracao = PoolPregeracao com aberturas/continuações prontas (None = sempre gera ao vivo)
+    def __init__(self, agente1, agente2, max_turnos=10, test_mode=False, get_ia_response=gerar_com_cache,
+                 retomar=True, pregeracao=None):
+        self.agente1 = agente1
+        self.agente2 = agente2
+        self.max_turnos = max_turnos
+        self.test_mode = test_mode
+        self.get_ia_response = get_ia_response
+        self.falhas = 0
+        self.agendador = None
+        self.cancelada = False
+        self.solta = False  # parou para outro processo retomar (o checkpoint fica)
+        self.pausada = False
+        self.pregeracao = pregeracao
+
+        self.historico = HistoricoPar(agente1, agente2)  # janela limitada, log completo no disco
+        self.contexto = ContextoConversa.carregar(agente1, agente2)
+        self.turno = 0
+        self.vez = 0  # 0 = agente1 fala, 1 = agente2 fala
+        self.counts = [0, 0]
+        self.entrada = (" ", self.PROMPT_INICIO)  # (mensagem, prompt) da próxima geração
+        self.pendente = None  # task da próxima fala já sendo gerada
+        self.enviando = None  # fala saindo agora (vai no checkpoint antes do envio)
+        self.sem_confirmacao = None  # fala que estava saindo quando o processo caiu
+        self.proximo = None  # horário (timestamp do relógio) do próximo envio
+        self.concluida = asyncio.get_running_loop().create_future()
+        if retomar:
+            self._restaurar(carregar_checkpoint(agente1, agente2))
+
+    # ======================== CHECKPOINT ========================
+    def estado(self):
+        pronta = None
+        if self.pendente is not None and self.pendente.done() and not self.pendente.cancelled() \
+                and self.pendente.exception() is None:
+            pronta = self.pendente.result()
+        return {"agente1": self.agente1.nome, "agente2": self.agente2.nome, "turno": self.turno, "vez": self.vez,
+                "counts": self.counts, "entrada": list(self.entrada), "pendente": pronta, "proximo": self.proximo,
+                "enviando": self.enviando}
+
+    def _restaurar(self, estado):
+        if not estado:
+            return
+        self.turno = estado.get("turno", 0)
+        self.vez = estado.get("vez", 0)
+        self.counts = list(estado.get("counts", [0, 0]))
+        self.entrada = tuple(estado.get("entrada") or self.entrada)
+        self.proximo = estado.get("proximo")
+        if estado.get("enviando"):
+            # caiu no meio do envio: a fala pode ter chegado, então não sai de novo (no máximo uma vez)
+            self.sem_confirmacao = estado["enviando"]
+        elif estado.get("pendente"):
+            # fala já gerada antes da queda: não gasta outra geração
+            self.pendente = self._pronta(estado["pendente"])
+        print(f"♻️ Retomando {self.agente1.nome} x {self.agente2.nome} no turno {self.turno}")
+
+    #segundos até o envio que estava marcado quando o checkpoint foi gravado (0 = já venceu)
+    def espera_retomada(self, relogio):
+        if self.proximo is None:
+            return 0.0
+        return max(0.0, self.proximo - relogio.datahora().timestamp())
+
+    def _salvar_checkpoint(self, *_):
+        if not self.cancelada and not self.concluida.done():
+            salvar_checkpoint(self.agente1, self.agente2, self.estado())
+
+    def _falantes(self):
+        if self.vez == 0:
+            return self.agente1, self.agente2
+        return self.agente2, self.agente1
 
-        # pega a resposta (se já estiver pronta sai na hora)
-        resposta = await tarefa_resposta2
-        enviado, resultado = await enviar_mensagem_async(agente2, agente1.numero, resposta)
+    async def _gerar(self, mensagem, historico, prompt_extra, prazo):
+        # backends assíncronos (ex.: ServicoInferencia.gerar) recebem o prazo e rodam direto no loop;
+        # os síncronos vão para o pool EDF dedicado
+        if asyncio.iscoroutinefunction(self.get_ia_response):
+            return await self.get_ia_response(mensagem, historico, prompt_extra, prazo=prazo)
+        return await pool_llm.executar(prazo, self.get_ia_response, mensagem, historico, prompt_extra)
+
+    #fala que já está pronta (checkpoint ou estoque da pré-geração) no lugar de uma geração
+    def _pronta(self, texto):
+        futuro = asyncio.get_running_loop().create_future()
+        futuro.set_result(texto)
+        return futuro
+
+    def _disparar_geracao(self, atraso=0.0):
+        #atraso = segundos até a fala ser enviada, vira o prazo da geração
+        mensagem, prompt_extra = self.entrada
+        prazo = self.agendador.agora() + atraso
+        self.pendente = asyncio.create_task(self._gerar(mensagem, self.contexto.copia(), prompt_extra, prazo))
+        # quando a fala ficar pronta ela entra no checkpoint
+        self.pendente.add_done_callback(self._salvar_checkpoint)
+        # na simulação o agendador não pula o tempo com a geração ainda rodando
+        self.agendador.acompanhar(self.pendente)
+
+    async def passo(self):
+        if self.sem_confirmacao is not None:
+            msg, self.sem_confirmacao = self.sem_confirmacao, None
+            print(f"♻️ {self._falantes()[0].nome}: envio sem confirmação antes da queda, contando como enviado")
+            return self._registrar_envio(msg)
+
+        if self.pendente is None:
+            abertura = None
+            if self.turno == 0 and self.vez == 0:
+                print(f"🤖 Iniciando conversa entre {self.agente1.nome} e {self.agente2.nome}")
+                if self.pregeracao is not None and self.entrada[1] == self.PROMPT_INICIO:
+                    abertura = self.pregeracao.pegar(ABERTURA)
+            if abertura is not None:
+                self.pendente = self._pronta(abertura)
+            else:
+                self._disparar_geracao()
+
+        # pega a fala (se já estiver pronta sai na hora)
+        msg = await self.pendente
+        self.pendente = None
+        self.falhas = 0
+
+        remetente, destinatario = self._falantes()
+        async with self.agendador.sem_envio:
+            if self.cancelada:
+                return None  # cancelada esperando vaga: o checkpoint não marcou envio, quem retomar gera de novo
+            # grava antes de enviar: se o processo cair no meio, o restart sabe que esta fala pode ter saído
+            self.enviando = msg
+            self._salvar_checkpoint()
+            enviado, resultado = await enviar_mensagem_async(remetente, destinatario.numero, msg)
+        self.enviando = None
+        if self.cancelada and self.solta:
+            return None  # outro processo assumiu a conversa e registra esta fala pelo checkpoint
+        M_MENSAGENS.inc(resultado="ok" if enviado else "erro")
+        if enviado:
+            _envios_recentes.append(asyncio.get_running_loop().time())
         if not enviado:
-            print(f"{agente2.nome} falhou no envio. ({count2} msgs enviadas)")
-            print(f"{agente2.nome}: {resultado['message']}")
-            break
-        historico.append({"role": agente2.nome, "content": resposta, "number": agente2.numero,
-                          "time": datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")})
-        print(f"{agente2.nome}: {resposta} → {agente1.nome} {datetime.datetime.now().strftime('%H:%M:%S')}")
-        count2 += 1
-        salvar_historico(agente1, agente2, historico)
-        # já dispara a próxima fala do agente1 em paralelo
-        tarefa_resposta1 = asyncio.create_task(
-            asyncio.to_thread(get_ia_response, resposta, historico,
-                              "Continue a conversa de forma resumida (<=120 caracteres)")
-        )
+            print(f"{remetente.nome} falhou no envio. ({self.counts[self.vez]} msgs enviadas)")
+            print(f"{remetente.nome}: {resultado}")
+            return None
+        return self._registrar_envio(msg)
+
+    #fala enviada: entra no histórico, passa a vez e dispara a próxima geração;
+    #o checkpoint gravado no fim confirma o envio. Devolve o atraso até o próximo passo (None = acabou).
+    #Cancelada com o envio no ar: a fala saiu e fica no histórico, mas não gera a próxima
+    def _registrar_envio(self, msg):
+        remetente, destinatario = self._falantes()
+        agora = self.agendador.relogio.datahora()
+        registro = self.historico.adicionar({"role": remetente.nome, "content": msg, "number": remetente.numero,
+                                             "time": agora.strftime("%d/%m/%Y %H:%M:%S")})
+        self.contexto.adicionar(registro)
+        self.contexto.salvar(self.agente1, self.agente2)
+        print(f"{remetente.nome}: {msg} → {destinatario.nome} {agora.strftime('%H:%M:%S')}")
+        self.counts[self.vez] += 1
+        if self.cancelada:
+            return None
+
+        if self.vez == 1:
+            self.turno += 1
+            if self.turno >= self.max_turnos:
+                return None
+
         #escolha de intervalo de tempo entre mensagens dos agentes
         minutos = random.randint(1, 10)
-        print(
-            f"Proxima mensagem do {agente1.nome} em {minutos} minutos para {agente2.nome} {datetime.datetime.now().strftime('%H:%M:%S')}")
-        await delay_ms_async(minutos, test_mode)
+        atraso = segundos_delay(minutos, self.test_mode)
+
+        # já dispara a resposta do outro agente em paralelo, com prazo no próximo envio
+        self.vez = 1 - self.vez
+        self.entrada = (msg, self.PROMPT_RESPOSTA if self.vez == 1 else self.PROMPT_CONTINUAR)
+        self.proximo = self.agendador.relogio.datahora().timestamp() + atraso
+        self._disparar_geracao(atraso)
+        self._salvar_checkpoint()
 
-        # pega a próxima fala do agente 1
-        msg = await tarefa_resposta1
+        print(f"Proxima mensagem do {destinatario.nome} em {minutos} minutos para {remetente.nome} "
+              f"{self.agendador.relogio.datahora().strftime('%H:%M:%S')}")
+        return atraso
 
-    print(f"✅ {agente1.nome} enviou {count1} msgs | {agente2.nome} enviou {count2} msgs")
-    return True
+    def ao_falhar(self, erro):
+        #a troca de backend já é feita pelo roteador a cada chamada; aqui só tenta a mesma fala
+        #de novo mais tarde (disjuntores podem fechar) e desiste depois de MAX_FALHAS seguidas
+        self.pendente = None
+        self.enviando = None
+        self.falhas += 1
+        # só troca por fala pronta do mesmo tipo: resposta ao que o outro disse não tem genérica
+        # que sirva, então ela (e abertura sem estoque) espera e gera ao vivo de novo
+        tipo = {self.PROMPT_INICIO: ABERTURA, self.PROMPT_CONTINUAR: CONTINUACAO}.get(self.entrada[1])
+        reserva = self.pregeracao.pegar(tipo) if self.pregeracao is not None and tipo else None
+        if reserva is not None:
+            # sem backend agora: manda uma fala genérica já pronta em vez de esperar
+            print(f"⚠️ Conversa {self.agente1.nome} x {self.agente2.nome} falhou ({erro}), usando fala pré-gerada")
+            self.pendente = self._pronta(reserva)
+            return 0.0
+        if self.falhas < self.MAX_FALHAS:
+            print(f"⚠️ Conversa {self.agente1.nome} x {self.agente2.nome} falhou ({erro}), "
+                  f"tentando de novo em {self.ESPERA_FALHA}s")
+            return segundos_delay(self.ESPERA_FALHA / 60, self.test_mode)
+        print(f"❌ Conversa {self.agente1.nome} x {self.agente2.nome} encerrada por erro: {erro}")
+        return None
+
+    #para a conversa (ex.: um dos agentes desconectou)
+    def cancelar(self):
+        if self.agendador is not None:
+            return self.agendador.cancelar(self)
+        return False
+
+    #para a conversa mantendo o checkpoint: o par mudou de processo e continua lá
+    def soltar(self):
+        if self.agendador is None or self.cancelada:
+            return False
+        self.solta = True
+        return self.agendador.cancelar(self, manter_checkpoint=True)
+
+    def pausar(self):
+        return self.agendador is not None and self.agendador.pausar(self)
+
+    def retomar(self):
+        return self.agendador is not None and self.agendador.retomar(self)
+
+    #desligamento (agendador parado) não passa por aqui, então o checkpoint fica para o restart
+    def finalizar(self, manter_checkpoint=False):
+        if self.pendente is not None:
+            self.pendente.cancel()
+        if not manter_checkpoint:
+            apagar_checkpoint(self.agente1, self.agente2)
+        print(f"✅ {self.agente1.nome} enviou {self.counts[0]} msgs | {self.agente2.nome} enviou {self.counts[1]} msgs")
+        if not self.concluida.done():
+            self.concluida.set_result(True)
+
+
+#funcao de conversa entre agentes criados
+#param - escolha dos agentes para conversa, quantidade de turnos, modo de intervalo de mensagens, modelo de ia(ollama ou gemini)
+#sem agendador próprio cria um só para esta conversa, com o relógio dado (None = real)
+async def conversar_async(agente1, agente2, max_turnos=10, test_mode=False, get_ia_response=gerar_com_cache,
+                          agendador=None, relogio=None, pregeracao=None):
+    proprio = agendador is None
+    if proprio:
+        agendador = Agendador(relogio=relogio)
+        laco = asyncio.create_task(agendador.executar())
+
+    conversa = Conversa(agente1, agente2, max_turnos, test_mode, get_ia_response, pregeracao=pregeracao)
+    agendador.adicionar(conversa, conversa.espera_retomada(agendador.relogio))
+    try:
+        return await conversa.concluida
+    finally:
+        if proprio:
+            agendador.parar()
+            laco.cancel()
 
 async def enviar_mensagem_async(agente, numero, mensagem):
     resultado = None
@@ -0,0 +1,113 @@
+import asyncio
+from collections import deque
+
+from IA.cache import cache_respostas
+from utilis.metricas import metricas
+from utilis.relogio import relogio_atual
+
+# ===========================
+# Pré-geração especulativa
+# ===========================
+# enquanto o LLM está ocioso (quase todo o intervalo de 1-10 minutos entre mensagens) gera
+# aberturas de conversa e continuações genéricas e guarda num estoque limitado por tipo.
+# A conversa pega do estoque na hora em vez de esperar uma geração; com o estoque vazio a
+# geração é feita ao vivo como antes. Cada item é entregue uma vez só e itens mais velhos
+# que `validade` segundos são descartados (o texto "envelhece" e o estoque gira); a idade é
+# medida no relógio do agendador, então na simulação o estoque vence com o tempo virtual.
+# As gerações especulativas vão com prazo infinito, então no pool EDF e na fila de
+# inferência qualquer pedido de conversa de verdade passa na frente.
+# Texto de fallback do backend (o mesmo conjunto `ignorar` do cache) não entra no estoque:
+# com o LLM fora ele viraria fala "pronta" mandada pelo ao_falhar da conversa.
+ABERTURA, CONTINUACAO = "abertura", "continuacao"
+
+M_PREGERACAO = metricas.contador("ia_pregeracao_total", "Uso do estoque de pré-geração", ("tipo", "resultado"))
+
+
+class PoolPregeracao:
+    #gerar(user_message, historico, prompt_extra, prazo=...) assíncrono (ex.: RoteadorIA.gerar)
+    #prompts = {tipo: (mensagem, prompt_extra)}; tamanhos = {tipo: máximo em estoque}
+    #ocioso() diz se dá para gerar agora (None = sempre); relogio = o do agendador (None = o atual)
+    #ignorar = textos que nunca vão para o estoque (None = os fallbacks registrados no cache de respostas)
+    def __init__(self, gerar, prompts, tamanhos=None, validade=1800.0, ocioso=None, intervalo=1.0, relogio=None,
+                 ignorar=None):
+        self.gerar = gerar
+        self.prompts = prompts
+        self.tamanhos = tamanhos or {tipo: 16 for tipo in prompts}
+        self.validade = validade
+        self.ocioso = ocioso or (lambda: True)
+        self.intervalo = intervalo
+        self.relogio = relogio or relogio_atual()
+        self.ignorar = cache_respostas.ignorar if ignorar is None else ignorar
+        self.itens = {tipo: deque() for tipo in prompts}  # (texto, criado_em)
+        self._tarefa = None
+        self.stats = {"gerados": 0, "entregues": 0, "vazio": 0, "vencidos": 0, "erros": 0, "fallbacks": 0}
+
+    def _agora(self):
+        return self.relogio.agora()
+
+    def _descartar_vencidos(self, tipo):
+        itens, limite = self.itens[tipo], self._agora() - self.validade
+        while itens and itens[0][1] < limite:
+            itens.popleft()
+            self.stats["vencidos"] += 1
+
+    #texto pronto do estoque (o mais antigo ainda válido) ou None se estiver vazio
+    def pegar(self, tipo):
+        if tipo not in self.itens:
+            return None
+        self._descartar_vencidos(tipo)
+        if not self.itens[tipo]:
+            self.stats["vazio"] += 1
+            M_PREGERACAO.inc(tipo=tipo, resultado="vazio")
+            return None
+        self.stats["entregues"] += 1
+        M_PREGERACAO.inc(tipo=tipo, resultado="entregue")
+        return self.itens[tipo].popleft()[0]
+
+    #tipo com o estoque proporcionalmente mais vazio (None = todos cheios)
+    def _faltando(self):
+        faltando = [(len(self.itens[t]) / self.tamanhos[t], t) for t in self.itens
+                    if len(self.itens[t]) < self.tamanhos.get(t, 0)]
+        return min(faltando)[1] if faltando else None
+
+    async def executar(self):
+        while True:
+            for tipo in self.itens:
+                self._descartar_vencidos(tipo)
+            tipo = self._faltando()
+            if tipo is None or not self.ocioso():
+                await asyncio.sleep(self.intervalo)
+                continue
+            mensagem, prompt_extra = self.prompts[tipo]
+            try:
+                texto = await self.gerar(mensagem, None, prompt_extra, prazo=float("inf"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # backend fora: não insiste, espera o próximo ciclo
+                self.stats["erros"] += 1
+                print(f"⚠️ Pré-geração ({tipo}) falhou: {e}")
+                await asyncio.sleep(self.intervalo)
+                continue
+            if texto in self.ignorar:
+                # backend respondeu com o texto de erro: conta como falha e espera o próximo ciclo
+                self.stats["fallbacks"] += 1
+                await asyncio.sleep(self.intervalo)
+                continue
+            if texto:
+                self.itens[tipo].append((texto, self._agora()))
+                self.stats["gerados"] += 1
+
+    def iniciar(self):
+        self._tarefa = asyncio.create_task(self.executar())
+
+    async def parar(self):
+        if self._tarefa:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+
+    def estatisticas(self):
+        return {**self.stats, "estoque": {tipo: len(itens) for tipo, itens in self.itens.items()}}
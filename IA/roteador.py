@@ -0,0 +1,186 @@
+import asyncio
+import inspect
+import time
+from collections import deque
+
+from utilis.metricas import metricas
+
+# ===========================
+# Roteador de backends de IA
+# ===========================
+# escolhe, a cada geração, o backend (ollama, gemini, ...) com melhor latência/taxa de erro
+# recente; se a chamada falhar tenta o próximo. Cada backend tem um disjuntor (circuit breaker):
+# depois de `limite_falhas` falhas seguidas fica "aberto" por `tempo_aberto` segundos sem
+# receber tráfego, e então deixa passar uma chamada de teste ("meio-aberto").
+# O backend é qualquer callable (user_message, historico, prompt_extra) que lança exceção
+# quando falha: síncrono roda no pool EDF, assíncrono recebe `prazo=` e roda no loop.
+# A latência que conta é só a execução do backend, sem a espera na fila EDF (que cresce com o
+# prazo): o síncrono é cronometrado dentro da thread e o assíncrono que aceita `execucao=`
+# (lista) anota nela o próprio tempo de execução (ex.: ServicoInferencia.gerar).
+# Backend sem medida de latência entra com a média dos outros (neutro, o principal continua na
+# frente no empate). Um backend preterido (ou nunca chamado) por mais de `tempo_aberto` segundos
+# recebe uma chamada de sonda para atualizar as estatísticas (senão ficaria de fora para sempre).
+FECHADO, ABERTO, MEIO_ABERTO = "fechado", "aberto", "meio-aberto"
+
+M_GERACAO = metricas.histograma("ia_geracao_segundos", "Latência de geração por backend", ("backend",))
+M_GERACOES = metricas.contador("ia_geracoes_total", "Gerações por backend e resultado", ("backend", "resultado"))
+
+
+class BackendIA:
+    def __init__(self, nome, gerar, limite_falhas=3, tempo_aberto=60.0, janela=50):
+        self.nome = nome
+        self.definir(gerar)
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+
+        self.latencias = deque(maxlen=janela)
+        self.resultados = deque(maxlen=janela)  # True = sucesso
+        self.falhas_seguidas = 0
+        self.aberto_ate = 0.0
+        self.testando = False
+        self.chamadas = 0
+        self.ultima_chamada = None
+
+    def definir(self, gerar):
+        self.gerar = gerar
+        self.assincrono = asyncio.iscoroutinefunction(gerar)
+        self.informa_execucao = self.assincrono and "execucao" in inspect.signature(gerar).parameters
+
+    def estado(self, agora):
+        if self.falhas_seguidas < self.limite_falhas:
+            return FECHADO
+        return MEIO_ABERTO if agora >= self.aberto_ate else ABERTO
+
+    def disponivel(self, agora):
+        estado = self.estado(agora)
+        # no meio-aberto só uma chamada de teste por vez
+        return estado == FECHADO or (estado == MEIO_ABERTO and not self.testando)
+
+    def taxa_erro(self):
+        if not self.resultados:
+            return 0.0
+        return 1 - sum(self.resultados) / len(self.resultados)
+
+    def latencia_media(self):
+        return sum(self.latencias) / len(self.latencias) if self.latencias else 0.0
+
+    #menor é melhor: latência penalizada pelos erros; sem medida usa `latencia_neutra`
+    def pontuacao(self, latencia_neutra=0.0):
+        latencia = self.latencia_media() if self.latencias else latencia_neutra
+        return latencia * (1 + 4 * self.taxa_erro()) + self.taxa_erro()
+
+    def registrar_sucesso(self, latencia):
+        self.latencias.append(latencia)
+        self.resultados.append(True)
+        self.falhas_seguidas = 0
+        self.testando = False
+
+    def registrar_falha(self, agora):
+        self.resultados.append(False)
+        self.falhas_seguidas += 1
+        self.testando = False
+        if self.falhas_seguidas >= self.limite_falhas:
+            self.aberto_ate = agora + self.tempo_aberto
+
+
+class SemBackendDisponivel(Exception):
+    pass
+
+
+class RoteadorIA:
+    def __init__(self, backends, pool=None):
+        self.backends = list(backends)
+        self.pool = pool  # PoolEDF para backends síncronos (None = asyncio.to_thread)
+        self._inicio = None  # primeira geração (referência de sonda para quem nunca foi chamado)
+
+    def backend(self, nome):
+        for b in self.backends:
+            if b.nome == nome:
+                return b
+        raise KeyError(nome)
+
+    #troca o callable de um backend (ex.: stub local em testes)
+    def substituir(self, nome, gerar):
+        self.backend(nome).definir(gerar)
+
+    def _candidatos(self, agora):
+        if self._inicio is None:
+            self._inicio = agora
+        disponiveis = [b for b in self.backends if b.disponivel(agora)]
+        medidas = [b.latencia_media() for b in disponiveis if b.latencias]
+        neutra = sum(medidas) / len(medidas) if medidas else 0.0
+        # sort é estável: em empate vale a ordem de cadastro (principal primeiro)
+        candidatos = sorted(disponiveis, key=lambda b: b.pontuacao(neutra))
+        for i, b in enumerate(candidatos[1:], 1):
+            ultima = self._inicio if b.ultima_chamada is None else b.ultima_chamada
+            if agora - ultima >= b.tempo_aberto:
+                candidatos.insert(0, candidatos.pop(i))
+                break
+        return candidatos
+
+    #chama o backend e devolve (resposta, segundos de execução sem a espera na fila)
+    async def _chamar(self, backend, user_message, historico, prompt_extra, prazo):
+        loop = asyncio.get_running_loop()
+        if backend.assincrono:
+            inicio = loop.time()
+            if backend.informa_execucao:
+                execucao = []
+                resposta = await backend.gerar(user_message, historico, prompt_extra, prazo=prazo, execucao=execucao)
+                return resposta, execucao[-1] if execucao else loop.time() - inicio
+            resposta = await backend.gerar(user_message, historico, prompt_extra, prazo=prazo)
+            return resposta, loop.time() - inicio
+
+        duracao = [0.0]
+
+        def cronometrar():
+            comeco = time.perf_counter()
+            try:
+                return backend.gerar(user_message, historico, prompt_extra)
+            finally:
+                duracao[0] = time.perf_counter() - comeco
+
+        if self.pool is not None:
+            resposta = await self.pool.executar(prazo, cronometrar)
+        else:
+            resposta = await asyncio.to_thread(cronometrar)
+        return resposta, duracao[0]
+
+    #mesma assinatura dos backends assíncronos; tenta um por vez até um responder
+    async def gerar(self, user_message, historico=None, prompt_extra="", prazo=None):
+        loop = asyncio.get_running_loop()
+        if prazo is None:
+            prazo = loop.time()  # sem prazo = precisa agora (o heap do pool não compara None)
+        erros = []
+        for backend in self._candidatos(loop.time()):
+            if backend.estado(loop.time()) == MEIO_ABERTO:
+                backend.testando = True
+            backend.chamadas += 1
+            backend.ultima_chamada = loop.time()
+            try:
+                resposta, latencia = await self._chamar(backend, user_message, historico, prompt_extra, prazo)
+            except asyncio.CancelledError:
+                backend.testando = False
+                raise
+            except Exception as e:
+                backend.registrar_falha(loop.time())
+                M_GERACOES.inc(backend=backend.nome, resultado="erro")
+                erros.append(f"{backend.nome}: {e}")
+                print(f"⚠️ Backend {backend.nome} falhou ({e}), tentando o próximo")
+                continue
+            backend.registrar_sucesso(latencia)
+            M_GERACAO.observar(latencia, backend=backend.nome)
+            M_GERACOES.inc(backend=backend.nome, resultado="ok")
+            return resposta
+        raise SemBackendDisponivel("; ".join(erros) or "todos os backends com disjuntor aberto")
+
+    def estatisticas(self):
+        agora = asyncio.get_running_loop().time()
+        return {
+            b.nome: {
+                "estado": b.estado(agora),
+                "chamadas": b.chamadas,
+                "latencia_media": round(b.latencia_media(), 3),
+                "taxa_erro": round(b.taxa_erro(), 3),
+            }
+            for b in self.backends
+        }
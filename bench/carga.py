@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.falsos import servidor_gti, servidor_ollama, gemini_falso
+
+# ===========================
+# Benchmark offline do orquestrador
+# ===========================
+# sobe a API GTI e o ollama falsos, cria N agentes web* sintéticos e roda o mesmo fluxo do
+# main.main (status -> pares -> conversas). Mede msgs/s, p50/p99 por etapa, memória e CPU
+# e grava o resultado em bench/resultados/ com o commit atual para comparar entre versões.
+#
+#   python bench/carga.py --agentes 200 --turnos 5
+ETAPAS = (
+    "ia_geracao_segundos",
+    "ia_espera_fila_segundos",
+    "gti_envio_segundos",
+    "gti_status_segundos",
+    "historico_segundos",
+    "agendador_atraso_segundos",
+    "agendador_passo_segundos",
+)
+RESULTADOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+
+
+def _intervalo(texto):
+    minimo, _, maximo = texto.partition(",")
+    return float(minimo), float(maximo or minimo)
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTADOS_DIR)).stdout.strip() or "desconhecido"
+    except OSError:
+        return "desconhecido"
+
+
+def _rss_atual_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except (OSError, ValueError):
+        return None
+
+
+async def executar(args):
+    random.seed(args.semente)
+
+    gti = servidor_gti(_intervalo(args.gti_latencia), args.gti_erro, args.gti_status_erro)
+    ollama_falso = servidor_ollama(_intervalo(args.llm_latencia), args.llm_latencia_token, args.llm_erro)
+    url_gti = await gti.iniciar()
+    url_ollama = await ollama_falso.iniciar()
+
+    # o cliente padrão do ollama e as configs são lidos no import: ajusta o ambiente antes
+    os.environ["OLLAMA_HOST"] = url_ollama
+    os.environ.setdefault("GEMINI_API_KEY", "falso")
+    os.environ["METRICAS_PORTA"] = "0"
+    os.environ["METRICAS_ARQUIVO"] = ""
+
+    import main as app
+    from GTI.instancia_GTI import AgenteGTI, configurar_transporte
+    from utilis import utils
+    from utilis.metricas import metricas
+    from utilis.relogio import RelogioVirtual
+
+    configurar_transporte(base_url=url_gti)
+    utils.HISTORICO_DIR = tempfile.mkdtemp(prefix="bench_historicos_")
+
+    # simulação: intervalos reais (1-10 min) em tempo virtual em vez do test_mode de 0.1s
+    relogio = RelogioVirtual() if args.simulacao else None
+
+    saida = io.StringIO() if args.silencioso else sys.stdout
+    uso_inicio = resource.getrusage(resource.RUSAGE_SELF)
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(saida):
+        agentes = await AgenteGTI.from_rows([(f"web_{i}", f"token{i}") for i in range(1, args.agentes + 1)])
+        tempo_partida = time.perf_counter() - inicio
+        await app.main(agentes=agentes, turno=args.turnos, test_mode=not args.simulacao,
+                       reserva=gemini_falso(_intervalo(args.gemini_latencia), args.gemini_erro), controle=False,
+                       relogio=relogio, rodadas=args.rodadas)
+    duracao = time.perf_counter() - inicio
+    uso_fim = resource.getrusage(resource.RUSAGE_SELF)
+
+    snapshot = metricas.snapshot()
+    mensagens = snapshot.get("conversa_mensagens_total", {})
+    cpu = (uso_fim.ru_utime - uso_inicio.ru_utime) + (uso_fim.ru_stime - uso_inicio.ru_stime)
+
+    resultado = {
+        "commit": _commit(),
+        "data": datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+        "python": platform.python_version(),
+        "parametros": vars(args),
+        "duracao_s": round(duracao, 3),
+        "partida_frota_s": round(tempo_partida, 3),
+        "mensagens_ok": mensagens.get("ok", 0),
+        "mensagens_erro": mensagens.get("erro", 0),
+        "msgs_por_s": round(mensagens.get("ok", 0) / duracao, 2) if duracao else 0.0,
+        "etapas": {nome: snapshot.get(nome, {}) for nome in ETAPAS},
+        "cpu_s": round(cpu, 3),
+        "cpu_pct": round(100 * cpu / duracao, 1) if duracao else 0.0,
+        "memoria_pico_mb": round(uso_fim.ru_maxrss / 1024, 1),
+        "memoria_atual_mb": _rss_atual_mb(),
+        "servidores": {
+            "gti": {**gti.stats, "enviados": gti.enviados["total"]},
+            "ollama": {**ollama_falso.stats, "tokens_gerados": ollama_falso.tokens["gerados"]},
+        },
+        "backends": snapshot.get("ia_geracoes_total", {}),
+        "cache": snapshot.get("ia_cache_total", {}),
+        "pregeracao": snapshot.get("ia_pregeracao_total", {}),
+    }
+    if relogio is not None:
+        virtual = duracao + relogio.deslocamento
+        resultado["simulacao"] = {**relogio.estatisticas(), "tempo_virtual_s": round(virtual, 1),
+                                  "aceleracao": round(virtual / duracao, 1) if duracao else 0.0,
+                                  "msgs_por_min_virtual": round(60 * mensagens.get("ok", 0) / virtual, 2)}
+
+    await gti.parar()
+    await ollama_falso.parar()
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline com GTI e LLM falsos")
+    parser.add_argument("--agentes", type=int, default=100)
+    parser.add_argument("--turnos", type=int, default=3)
+    parser.add_argument("--gti-latencia", default="0.01,0.05", help="min,max em segundos")
+    parser.add_argument("--gti-erro", type=float, default=0.0, help="fração de respostas com erro")
+    parser.add_argument("--gti-status-erro", type=int, default=503)
+    parser.add_argument("--llm-latencia", default="0.05,0.2", help="min,max até o primeiro token")
+    parser.add_argument("--llm-latencia-token", type=float, default=0.01)
+    parser.add_argument("--llm-erro", type=float, default=0.0)
+    parser.add_argument("--gemini-latencia", default="0.2,0.6")
+    parser.add_argument("--gemini-erro", type=float, default=0.0)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--rodadas", type=int, default=1, help="conversas por agente (troca de parceiro a cada uma)")
+    parser.add_argument("--simulacao", action="store_true",
+                        help="relógio virtual com os intervalos reais entre mensagens (pula o tempo ocioso)")
+    parser.add_argument("--silencioso", action="store_true", help="esconde os prints das conversas")
+    parser.add_argument("--saida", default=None, help="arquivo JSON (padrão: bench/resultados/<data>_<commit>.json)")
+    args = parser.parse_args()
+
+    resultado = asyncio.run(executar(args))
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    print(texto)
+
+    caminho = args.saida
+    if caminho is None:
+        os.makedirs(RESULTADOS_DIR, exist_ok=True)
+        caminho = os.path.join(RESULTADOS_DIR, f"{datetime.datetime.now():%Y%m%d_%H%M%S}_{resultado['commit']}.json")
+    with open(caminho, "w", encoding="utf-8") as f:
+        f.write(texto)
+    print(f"💾 Resultado salvo em {caminho}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import random
+import time
+import zlib
+
+# ===========================
+# Servidores falsos para benchmark offline
+# ===========================
+# substitutos locais da API GTI e do ollama, com latência e taxa de erro configuráveis,
+# para medir o orquestrador sem instâncias reais, SQL Server ou GPU.
+# HTTP/1.1 mínimo com keep-alive (o cliente httpx reaproveita as conexões como em produção).
+TEXTO_LONGO = (
+    "Opa, tudo certo por aqui! 😄 E aí, como foi o dia? Hoje foi corrido demais, "
+    "mas agora tô de boa. Bora marcar aquele rolê no fim de semana? "
+    "Sure! Here's a new version of the text with longer characters and a more formal tone:\n\n"
+    "Hey virtual friend, I hope this message finds you well. It's been some time since we spoke, "
+    "but I wanted to check in and see how you're doing. Are you busy? Do you have anything on your mind?"
+)
+
+
+class ServidorFalso:
+    #rotas: {(metodo, caminho): handler(corpo, headers) -> (status, objeto | gerador async de bytes)}
+    #o handler pode ser async (ex.: para simular o tempo de uma geração sem stream)
+    def __init__(self, nome, rotas, latencia=(0.01, 0.05), taxa_erro=0.0, status_erro=503):
+        self.nome = nome
+        self.rotas = rotas
+        self.latencia = latencia
+        self.taxa_erro = taxa_erro
+        self.status_erro = status_erro
+        self.servidor = None
+        self.url = None
+        self.stats = {"requisicoes": 0, "erros": 0, "conexoes": 0}
+
+    async def iniciar(self, host="127.0.0.1", porta=0):
+        self.servidor = await asyncio.start_server(self._conexao, host, porta)
+        porta = self.servidor.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{porta}"
+        return self.url
+
+    async def parar(self):
+        if self.servidor:
+            self.servidor.close()
+            await self.servidor.wait_closed()
+
+    async def _conexao(self, reader, writer):
+        self.stats["conexoes"] += 1
+        try:
+            while True:
+                linha = await reader.readline()
+                if not linha:
+                    break
+                metodo, alvo, _ = linha.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    chave, _, valor = h.decode("latin-1").partition(":")
+                    headers[chave.strip().lower()] = valor.strip()
+                corpo = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+                await self._responder(writer, metodo, alvo.split("?")[0], corpo, headers)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _responder(self, writer, metodo, caminho, corpo, headers):
+        self.stats["requisicoes"] += 1
+        await asyncio.sleep(random.uniform(*self.latencia))
+        handler = self.rotas.get((metodo, caminho))
+        if handler is None:
+            return await self._escrever(writer, 404, {"error": "not found"})
+        if random.random() < self.taxa_erro:
+            self.stats["erros"] += 1
+            extra = {"Retry-After": "1"} if self.status_erro == 429 else {}
+            return await self._escrever(writer, self.status_erro, {"error": "falha simulada"}, extra)
+        resultado = handler(json.loads(corpo) if corpo else {}, headers)
+        if asyncio.iscoroutine(resultado):
+            resultado = await resultado
+        status, resposta = resultado
+        if hasattr(resposta, "__aiter__"):
+            return await self._escrever_stream(writer, status, resposta)
+        await self._escrever(writer, status, resposta)
+
+    async def _escrever(self, writer, status, objeto, extra=None):
+        dados = json.dumps(objeto).encode("utf-8")
+        cabecalho = "".join(f"{k}: {v}\r\n" for k, v in (extra or {}).items())
+        writer.write(f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n{cabecalho}"
+                     f"Content-Length: {len(dados)}\r\n\r\n".encode("latin-1") + dados)
+        await writer.drain()
+
+    #resposta em chunks (stream NDJSON do ollama); se o cliente fechar, para de "gerar"
+    async def _escrever_stream(self, writer, status, pedacos):
+        writer.write(f"HTTP/1.1 {status} X\r\nContent-Type: application/x-ndjson\r\n"
+                     f"Transfer-Encoding: chunked\r\n\r\n".encode("latin-1"))
+        async for pedaco in pedacos:
+            writer.write(f"{len(pedaco):x}\r\n".encode("latin-1") + pedaco + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+# ======================== GTI ========================
+def servidor_gti(latencia=(0.01, 0.05), taxa_erro=0.0, status_erro=503, taxa_conectados=1.0):
+    enviados = {"total": 0}
+
+    def status(corpo, headers):
+        token = headers.get("token", "")
+        return 200, {
+            "instance": {"owner": f"5511{zlib.crc32(token.encode()) % 10 ** 9:09d}", "qrcode": ""},
+            "status": {"connected": random.random() < taxa_conectados},
+        }
+
+    def enviar(corpo, headers):
+        enviados["total"] += 1
+        return 200, {"id": f"msg{enviados['total']}", "status": "sent", "number": corpo.get("number")}
+
+    rotas = {
+        ("GET", "/instance/status"): status,
+        ("POST", "/send/text"): enviar,
+        ("GET", "/webhook"): lambda corpo, headers: (200, []),
+        ("POST", "/webhook"): lambda corpo, headers: (200, {"ok": True}),
+        ("POST", "/instance/disconnect"): lambda corpo, headers: (200, {"ok": True}),
+    }
+    servidor = ServidorFalso("gti", rotas, latencia, taxa_erro, status_erro)
+    servidor.enviados = enviados
+    return servidor
+
+
+# ======================== OLLAMA ========================
+#gera TEXTO_LONGO token a token (o modelo "enrola" como o TinyLlama) até o cliente cortar
+def servidor_ollama(latencia=(0.05, 0.2), latencia_token=0.01, taxa_erro=0.0):
+    tokens = {"gerados": 0}
+
+    def palavras():
+        return TEXTO_LONGO.replace(" ", " \0").split("\0")
+
+    async def stream():
+        for palavra in palavras():
+            await asyncio.sleep(latencia_token)
+            tokens["gerados"] += 1
+            yield json.dumps({"model": "TinyLlama", "message": {"role": "assistant", "content": palavra},
+                              "done": False}).encode("utf-8") + b"\n"
+        yield json.dumps({"model": "TinyLlama", "message": {"role": "assistant", "content": ""},
+                          "done": True}).encode("utf-8") + b"\n"
+
+    async def chat(corpo, headers):
+        if corpo.get("stream", True):
+            return 200, stream()
+        # sem stream o cliente espera a geração inteira
+        await asyncio.sleep(latencia_token * len(palavras()))
+        tokens["gerados"] += len(palavras())
+        return 200, {"model": "TinyLlama", "message": {"role": "assistant", "content": TEXTO_LONGO}, "done": True}
+
+    rotas = {
+        ("POST", "/api/chat"): chat,
+        ("POST", "/api/generate"): lambda corpo, headers: (200, {"model": "TinyLlama", "response": "", "done": True}),
+    }
+    servidor = ServidorFalso("ollama", rotas, latencia, taxa_erro, 500)
+    servidor.tokens = tokens
+    return servidor
+
+
+# ======================== GEMINI ========================
+#backend síncrono no lugar do gemini (roda no pool EDF como o real)
+def gemini_falso(latencia=(0.2, 0.6), taxa_erro=0.0):
+    def gerar(user_message, historico=None, prompt_extra=""):
+        time.sleep(random.uniform(*latencia))
+        if random.random() < taxa_erro:
+            raise ConnectionError("gemini falso: falha simulada")
+        return "Opa, de boa! 😎 E tu?"
+    return gerar
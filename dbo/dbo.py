@@ -1,9 +1,11 @@
 # Carrega variáveis do .env
 import asyncio
 import os
-import pyodbc
+import re
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from GTI.instancia_GTI import AgenteGTI
+from utilis.metricas import metricas
 
 load_dotenv()
 
@@ -18,41 +20,206 @@ DB = (f"DRIVER={{ODBC Driver 18 for SQL Server}};"
       f"PWD={password};"
       f"TrustServerCertificate=yes;")
 
-# Conexão com o banco
-conn = pyodbc.connect(DB)
+DB_POOL_TAMANHO = int(os.getenv("DB_POOL_TAMANHO", "2"))
+DB_TABELA_ROTA = os.getenv("DB_TABELA_ROTA", "[NEWWORK].[dbo].[ROTA]")
+DB_RECARGA_INTERVALO = int(os.getenv("DB_RECARGA_INTERVALO", "0"))  # segundos entre recargas das rotas (0 = só no 'r')
 
-cursor = conn.cursor()
+# o nome da tabela entra direto no SQL (não dá para passar como parâmetro), então só aceita
+# identificador simples: tabela, schema.tabela ou banco.schema.tabela, cada parte com ou sem [ ]
+_IDENTIFICADOR = r"(?:[A-Za-z_][A-Za-z0-9_]*|\[[A-Za-z_][A-Za-z0-9_]*\])"
+_TABELA_VALIDA = re.compile(rf"{_IDENTIFICADOR}(?:\.{_IDENTIFICADOR}){{0,2}}")
 
-async def carregar_agentes_async_do_banco_async():
-    #Carrega agentes do banco de forma assíncrona e cria objetos AgenteGTI em paralelo.
 
+def validar_tabela(tabela):
+    if not isinstance(tabela, str) or not _TABELA_VALIDA.fullmatch(tabela):
+        raise ValueError(f"Nome de tabela inválido: {tabela!r}")
+    return tabela
+
+
+M_CARGA = metricas.histograma("db_carga_segundos", "Tempo para carregar os agentes do banco (com status)")
+M_AGENTES = metricas.contador("db_agentes_carregados_total", "Agentes carregados do banco")
+M_CONSULTA = metricas.histograma("db_consulta_segundos", "Tempo de cada consulta ao banco")
+
+
+def _conectar_sqlserver():
+    import pyodbc
+    return pyodbc.connect(DB, autocommit=True)
+
+
+# ======================== POOL DE CONEXÕES ========================
+# nada conecta no import: a primeira consulta abre a conexão e ela volta para o pool depois.
+# Os drivers (pyodbc, sqlite3) são síncronos, então cada consulta roda numa thread do pool
+# e o loop não trava. `conectar` é qualquer função que devolve uma conexão DB-API, o que
+# permite rodar contra um SQLite local em vez do SQL Server.
+class PoolBanco:
+    def __init__(self, conectar=_conectar_sqlserver, tamanho=DB_POOL_TAMANHO):
+        self.conectar = conectar
+        self.tamanho = tamanho
+        self._livres = []
+        self._criadas = 0
+        self._vaga = asyncio.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=tamanho, thread_name_prefix="db")
+
+    async def _pegar(self):
+        async with self._vaga:
+            while not self._livres and self._criadas >= self.tamanho:
+                await self._vaga.wait()
+            if self._livres:
+                return self._livres.pop()
+            self._criadas += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self.conectar)
+        except Exception:
+            await self._devolver(None)
+            raise
+
+    #conexão None = descartada (erro), libera a vaga para uma nova
+    async def _devolver(self, conn):
+        async with self._vaga:
+            if conn is None:
+                self._criadas -= 1
+            else:
+                self._livres.append(conn)
+            self._vaga.notify()
+
+    @staticmethod
+    def _executar(conn, query, parametros):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, parametros)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    async def consultar(self, query, parametros=()):
+        conn = await self._pegar()
+        try:
+            with M_CONSULTA.tempo():
+                linhas = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._executar, conn, query, parametros)
+        except Exception:
+            # conexão possivelmente quebrada: fecha e deixa o pool abrir outra
+            try:
+                conn.close()
+            except Exception:
+                pass
+            await self._devolver(None)
+            raise
+        await self._devolver(conn)
+        return linhas
+
+    async def fechar(self):
+        async with self._vaga:
+            livres, self._livres = self._livres, []
+            self._criadas -= len(livres)
+        for conn in livres:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._executor.shutdown(wait=False)
+
+
+_pool = None
+_config = {"conectar": _conectar_sqlserver, "tamanho": DB_POOL_TAMANHO, "tabela": validar_tabela(DB_TABELA_ROTA)}
+
+
+def configurar_banco(conectar=None, tamanho=None, tabela=None):
+    #ex.: configurar_banco(lambda: sqlite3.connect("teste.db", check_same_thread=False), tabela="ROTA")
+    if _pool is not None:
+        raise RuntimeError("Pool do banco já iniciado; chame fechar_banco() antes de reconfigurar.")
+    if conectar is not None:
+        _config["conectar"] = conectar
+    if tamanho is not None:
+        _config["tamanho"] = tamanho
+    if tabela is not None:
+        _config["tabela"] = validar_tabela(tabela)
+
+
+def obter_pool():
+    global _pool
+    if _pool is None:
+        _pool = PoolBanco(_config["conectar"], _config["tamanho"])
+    return _pool
+
+
+async def fechar_banco():
+    global _pool
+    if _pool is not None:
+        await _pool.fechar()
+        _pool = None
+    _rotas_conhecidas.clear()
+
+
+# ======================== ROTAS DE MATURAÇÃO ========================
+#telefone -> senha da última carga (base para a recarga incremental)
+_rotas_conhecidas = {}
+
+
+async def _consultar_rotas():
     #Seleciona as instancias que quer maturar
-    query = """
+    query = f"""
         SELECT TELEFONE, SENHA
-        FROM [NEWWORK].[dbo].[ROTA]
-        WHERE SERVICO='MATURACAO' 
-          AND (TIPO_ROTA = 'MATURACAO') AND (TELEFONE LIKE 'web%') 
+        FROM {_config["tabela"]}
+        WHERE SERVICO='MATURACAO'
+          AND (TIPO_ROTA = 'MATURACAO') AND (TELEFONE LIKE 'web%')
     """
+    return {telefone: senha for telefone, senha in await obter_pool().consultar(query)}
 
 
+async def carregar_agentes_async_do_banco_async():
+    with M_CARGA.tempo():
+        return await _carregar_agentes()
+
+async def _carregar_agentes():
+    #Carrega agentes do banco de forma assíncrona e cria objetos AgenteGTI em paralelo.
     try:
-        dsn = f'DRIVER={{ODBC Driver 18 for SQL Server}};SERVER={os.getenv("SERVER")};DATABASE={os.getenv("DATABASE")};UID={os.getenv("USERNAMEDB")};PWD={os.getenv("PASSWORD")};TrustServerCertificate=yes;'
-        import aioodbc
-        async with aioodbc.connect(dsn=dsn, autocommit=True) as conn:
-            async with conn.cursor() as cursor:
-                await cursor.execute(query)
-                registros = await cursor.fetchall()
-        #cria o agente de acordo com as instancias
-        async def criar_agente(telefone_senha):
-            telefone, senha = telefone_senha
-            agente = AgenteGTI(nome=telefone, token=senha)
-            await agente.atualizar_status_async()
-            return agente
-
-        # cria todos em paralelo
-        agentes = await asyncio.gather(*(criar_agente(r) for r in registros))
+        rotas = await _consultar_rotas()
+        _rotas_conhecidas.clear()
+        _rotas_conhecidas.update(rotas)
+        #cria os agentes de acordo com as instancias, status consultado em paralelo (limitado)
+        agentes = await AgenteGTI.from_rows(list(rotas.items()))
+        M_AGENTES.inc(len(agentes))
         return agentes
 
     except Exception as e:
         print(f"❌ Erro ao carregar agentes: {e}")
         return []
+
+
+#só as rotas (telefone -> senha), sem criar agentes nem consultar status; None se o banco falhar
+#(o supervisor usa para dividir as instâncias entre os processos)
+async def carregar_rotas_do_banco_async():
+    try:
+        return await _consultar_rotas()
+    except Exception as e:
+        print(f"❌ Erro ao consultar rotas: {e}")
+        return None
+
+
+#atualiza a lista `agentes` no lugar com as rotas que entraram/saíram desde a última carga;
+#só os agentes novos têm o status consultado. Devolve (novos, removidos).
+#Senha trocada conta como remoção + inclusão (o token do agente mudou).
+async def recarregar_agentes_do_banco_async(agentes):
+    try:
+        rotas = await _consultar_rotas()
+    except Exception as e:
+        print(f"❌ Erro ao recarregar agentes: {e}")
+        return [], []
+
+    base = _rotas_conhecidas or {ag.nome: ag.token for ag in agentes}
+    saiu = {tel for tel, senha in base.items() if rotas.get(tel) != senha}
+    entrou = [(tel, senha) for tel, senha in rotas.items() if base.get(tel) != senha]
+
+    removidos = [ag for ag in agentes if ag.nome in saiu]
+    if removidos:
+        agentes[:] = [ag for ag in agentes if ag.nome not in saiu]
+    novos = await AgenteGTI.from_rows(entrou) if entrou else []
+    agentes.extend(novos)
+    M_AGENTES.inc(len(novos))
+
+    _rotas_conhecidas.clear()
+    _rotas_conhecidas.update(rotas)
+    if novos or removidos:
+        print(f"🔄 Rotas: +{len(novos)} -{len(removidos)} (total {len(agentes)})")
+    return novos, removidos
@@ -1,75 +1,344 @@
 import asyncio
-import keyboard
-from GTI.instancia_GTI import atualizar_status_parallel
-from IA.ia import conversar_async, get_ia_response_ollama, get_ia_response_gemini
-from utilis.utils import carregar_agentes, verificar_agentes, extrair_numero
+from GTI.instancia_GTI import AgenteGTI, atualizar_status_parallel, fechar_transporte
+from GTI.limitador import limitador
+from GTI.webhook import ReceptorWebhook, WEBHOOK_URL
+from dbo.dbo import fechar_banco, DB_RECARGA_INTERVALO
+from IA.ia import Conversa, ServicoInferencia, gerar_gemini, mensagens_por_minuto, pool_llm
+from IA.cache import cache_respostas, IA_CACHE_ARQUIVO, IA_CACHE_SALVAR
+from IA.pregeracao import PoolPregeracao, ABERTURA, CONTINUACAO
+from IA.roteador import BackendIA, RoteadorIA
+from utilis.agendador import Agendador
+from utilis.controle import PainelControle, ErroComando
+from utilis.pareamento import MotorPareamento
+from utilis.supervisor import CanalTrabalhador, Supervisor, SUPERVISOR_TRABALHADORES, SUPERVISOR_RELATORIO
+from utilis.metricas import metricas, servir_metricas, snapshot_periodico, METRICAS_PORTA, METRICAS_ARQUIVO
+from utilis.relogio import definir_relogio
+from utilis.utils import (carregar_agentes, recarregar_agentes, verificar_agentes, extrair_numero, listar_checkpoints,
+                          apagar_checkpoints_orfaos)
 
-async def main():
-    sem = asyncio.Semaphore(20)  # limite de tarefas concorrentes
-    tarefas = []
-    pares_em_execucao = set()
-    turno = 100  # número de turnos
+#param - agentes já carregados (None = carrega do banco), número de turnos, modo de intervalo curto,
+#backend reserva do ollama, se sobe o painel de controle (o benchmark usa agentes e backends falsos)
+#o relógio (RelogioVirtual = simulação acelerada com os intervalos reais de 1-10 minutos)
+#e quantas conversas cada agente faz (None = troca de parceiro e continua para sempre);
+#canal = ligação com o supervisor quando roda como processo trabalhador (instâncias chegam por ele)
+async def main(agentes=None, turno=100, test_mode=False, reserva=gerar_gemini, controle=True, relogio=None,
+               rodadas=None, canal=None):
+    # na simulação o retry e o limitador da GTI também esperam no relógio virtual
+    definir_relogio(relogio)
+    # limites só para trabalho real (geração e envio); a espera entre mensagens não ocupa vaga
+    agendador = Agendador(max_envio=20, relogio=relogio)
+    # pedidos ao ollama de todas as conversas passam pela fila em lotes
+    inferencia = ServicoInferencia(janela=0.05, max_lote=16, max_paralelo=4)
+    inferencia.iniciar()
+    await inferencia.aquecer()
+    # cada geração escolhe o backend pela saúde recente (ollama em lote ou gemini)
+    roteador = RoteadorIA([BackendIA("ollama", inferencia.gerar), BackendIA("gemini", reserva)], pool=pool_llm)
+    # conversas passam pelo cache de respostas antes do roteador (a pré-geração não, quer textos novos)
+    cache_respostas.carregar()
+    gerar = cache_respostas.envolver(roteador.gerar)
+    tarefa_cache = asyncio.create_task(cache_respostas.salvar_periodico()) if IA_CACHE_ARQUIVO and IA_CACHE_SALVAR else None
+    # aberturas e continuações geradas enquanto o LLM está parado (só quando não há pedido de conversa)
+    pregeracao = PoolPregeracao(
+        roteador.gerar,
+        {ABERTURA: (" ", Conversa.PROMPT_INICIO), CONTINUACAO: (" ", Conversa.PROMPT_CONTINUAR)},
+        tamanhos={ABERTURA: 32, CONTINUACAO: 16},
+        ocioso=lambda: inferencia.pendentes() == 0 and pool_llm.em_execucao() == 0,
+        relogio=agendador.relogio,
+    )
+    pregeracao.iniciar()
 
+    # métricas: profundidade das filas lida só na coleta
+    metricas.medidor("agendador_eventos", "Eventos na fila do agendador", agendador.pendentes)
+    metricas.medidor("conversas_ativas", "Conversas em andamento", lambda: len(agendador.ativas))
+    metricas.medidor("ia_fila", "Pedidos esperando na fila de inferência", lambda: inferencia.estatisticas()["fila"])
+    metricas.medidor("ia_gerando", "Chamadas ao ollama em execução", inferencia.pool.em_execucao)
+    metricas.medidor("ia_pool_pendentes", "Gerações síncronas esperando thread", pool_llm.pendentes)
+    metricas.medidor("ia_pregeracao_estoque", "Falas pré-geradas em estoque",
+                     lambda: sum(pregeracao.estatisticas()["estoque"].values()))
+    servidor_metricas = await servir_metricas() if METRICAS_PORTA else None
+    tarefa_snapshot = asyncio.create_task(snapshot_periodico()) if METRICAS_ARQUIVO else None
     # Carrega agentes do banco
-    agentes = await carregar_agentes()
+    if agentes is None:
+        agentes = await carregar_agentes()
     agentes_conectados = await verificar_agentes(agentes)
 
-    # Cria pares ordenados sequencialmente
-    async def criar_pares_ordenados(ag):
-        # Ordena pelos números no nome
-        agentes_ordenados = sorted(ag, key=lambda a: extrair_numero(a.nome))
-        pares_agentes = [(agentes_ordenados[i], agentes_ordenados[i + 1])
-                         for i in range(0, len(agentes_ordenados) - 1, 2)]
-        # Filtra apenas pares novos
-        novos = [par for par in pares_agentes if par not in pares_em_execucao]
-        return novos
+    # Função para iniciar conversa entre um par
+    def iniciar_conversa(a1, a2):
+        conversa = Conversa(a1, a2, turno, test_mode, gerar, pregeracao=pregeracao)
+        # par com checkpoint continua no turno e no horário em que parou
+        agendador.adicionar(conversa, conversa.espera_retomada(agendador.relogio))
+        # quem não conseguiu enviar nada não volta direto para a fila (evita laço de falhas)
+        conversa.concluida.add_done_callback(lambda _: motor.liberar(conversa, reentrar=sum(conversa.counts) > 0))
+        return conversa
 
-    novos_pares = await criar_pares_ordenados(agentes_conectados)
+    def parar_conversa(conversa):
+        print(f"⏹ Parando conversa {conversa.agente1.nome} x {conversa.agente2.nome}")
+        conversa.cancelar()
 
-    # Função para iniciar conversa entre um par
-    async def conversar_com_limite(a1, a2, turno, sem):
-        async with sem:
+    # pares mudam por evento (conectou, caiu, conversa acabou), sem reordenar a frota
+    motor = MotorPareamento(iniciar_conversa, parar_conversa, max_conversas=rodadas)
+    metricas.medidor("agentes_livres", "Agentes conectados esperando parceiro", lambda: len(motor.livres))
+
+    # pares com checkpoint cujos dois agentes estão aqui voltam a conversar de onde pararam
+    # (no restart e quando o supervisor traz um par de outro processo)
+    def retomar_checkpoints():
+        por_nome = {ag.nome: ag for ag in agentes}
+        for estado in listar_checkpoints():
+            a1, a2 = por_nome.get(estado["agente1"]), por_nome.get(estado["agente2"])
+            if a1 is not None and a2 is not None:
+                motor.retomar(a1, a2)
+
+    # Retoma primeiro os pares que estavam conversando quando o processo parou;
+    # checkpoint de quem saiu da ROTA é apagado (o supervisor faz isso com a ROTA inteira)
+    if canal is None and agentes:
+        apagar_checkpoints_orfaos(ag.nome for ag in agentes)
+    retomar_checkpoints()
+
+    # Criar conversas iniciais: ordem pelos números no nome (1x2, 3x4, ...)
+    for ag in sorted(agentes_conectados, key=lambda a: extrair_numero(a.nome)):
+        motor.conectar(ag)
+
+    # Webhook: estado de conexão por evento em vez de consultar o status de cada agente
+    receptor = None
+    if WEBHOOK_URL:
+        receptor = ReceptorWebhook(agentes)
+        receptor.ao_conectar.append(motor.conectar)
+        receptor.ao_desconectar.append(motor.desconectar)
+        await receptor.iniciar()
+        await receptor.assinar(agentes)
+
+    # Recarga incremental das rotas: só quem entrou/saiu do banco muda na lista de agentes
+    # (como trabalhador do supervisor as mudanças chegam pelo canal, não do banco);
+    # manter_checkpoint = os removidos só mudaram de processo e a conversa continua no outro
+    async def aplicar_rotas(novos, removidos, manter_checkpoint=False):
+        for ag in removidos:
+            if manter_checkpoint and ag in motor.ocupados:
+                motor.ocupados[ag].soltar()
+            motor.remover(ag)
+            if receptor:
+                receptor.remover(ag)
+        if receptor and novos:
+            for ag in novos:
+                receptor.registrar(ag)
+            await receptor.assinar(novos)
+        if novos:
+            retomar_checkpoints()
+        for ag in novos:
+            motor.atualizar(ag)
+
+    async def recarregar_rotas():
+        if canal is None:
+            novos, removidos = await recarregar_agentes(agentes)
+            await aplicar_rotas(novos, removidos)
+            if removidos:
+                apagar_checkpoints_orfaos(ag.nome for ag in agentes)
+
+    async def recarga_periodica():
+        while DB_RECARGA_INTERVALO:
+            await asyncio.sleep(DB_RECARGA_INTERVALO)
+            await recarregar_rotas()
+
+    tarefa_recarga = asyncio.create_task(recarga_periodica()) if DB_RECARGA_INTERVALO and canal is None else None
+
+    # Painel de controle local (no lugar do teclado): comandos chegam por HTTP/socket Unix no mesmo loop;
+    # no trabalhador o painel não abre porta, os comandos vêm do supervisor pelo canal
+    parada = asyncio.Event()
+    painel = PainelControle() if controle or canal else None
+
+    def conversas_do_pedido(params):
+        nome = params.get("agente")
+        if not nome:
+            return list(agendador.ativas)
+        agente = next((ag for ag in agentes if ag.nome == nome), None)
+        if agente is None:
+            raise ErroComando(f"agente {nome} não encontrado")
+        conversa = motor.ocupados.get(agente)
+        return [conversa] if conversa is not None else []
+
+    def estado_atual():
+        return {
+            "conversas_ativas": len(agendador.ativas),
+            "conversas_pausadas": agendador.pausadas(),
+            "msgs_por_minuto": mensagens_por_minuto(),
+            "agendador_eventos": agendador.pendentes(),
+            "max_envio": agendador.max_envio,
+            "inferencia": inferencia.estatisticas(),
+            "pool_llm": {"pendentes": pool_llm.pendentes(), "em_execucao": pool_llm.em_execucao(),
+                         "max": pool_llm.max_workers},
+            "backends": roteador.estatisticas(),
+            "api_gti": limitador.estatisticas(),
+            "pareamento": motor.estatisticas(),
+            "pregeracao": pregeracao.estatisticas(),
+            "cache": cache_respostas.estatisticas(),
+        }
+
+    if painel:
+        @painel.rota("GET", "/estado")
+        def estado(params):
+            return estado_atual()
+
+        @painel.rota("POST", "/atualizar")
+        async def atualizar(params):
+            print("🔄 Atualizando status dos agentes...")
+            await recarregar_rotas()
+            await atualizar_status_parallel(agentes)
+            conectados = await verificar_agentes(agentes)
+            for ag in agentes:
+                motor.atualizar(ag)
+            return {"agentes": len(agentes), "conectados": len(conectados), "pareamento": motor.estatisticas()}
+
+        #sem `agente` vale para todas; parar tudo também segura novos pares até /retomar
+        @painel.rota("POST", "/cancelar")
+        def cancelar(params):
+            if not params.get("agente"):
+                print("\n⏹ Parada emergencial! Cancelando todas as conversas...")
+                motor.suspender()
+            return {"canceladas": sum(bool(c.cancelar()) for c in conversas_do_pedido(params))}
+
+        @painel.rota("POST", "/pausar")
+        def pausar(params):
+            if not params.get("agente"):
+                motor.suspender()
+            return {"pausadas": sum(bool(c.pausar()) for c in conversas_do_pedido(params))}
+
+        @painel.rota("POST", "/retomar")
+        def retomar(params):
+            retomadas = sum(bool(c.retomar()) for c in conversas_do_pedido(params))
+            if not params.get("agente"):
+                motor.reativar()
+            return {"retomadas": retomadas}
+
+        #qualquer combinação de: envio, gti, inferencia, pool_llm (vagas simultâneas)
+        @painel.rota("POST", "/limites")
+        def limites(params):
             try:
-                await conversar_async(a1, a2, turno, False, get_ia_response_ollama)
-            except Exception:
-                await conversar_async(a1, a2, turno, False, get_ia_response_gemini)
+                novos = {k: int(v) for k, v in params.items() if k in ("envio", "gti", "inferencia", "pool_llm")}
+            except (TypeError, ValueError):
+                raise ErroComando("limites devem ser números inteiros")
+            if any(v < 1 for v in novos.values()):
+                raise ErroComando("limites devem ser >= 1")
+            if "envio" in novos:
+                agendador.definir_max_envio(novos["envio"])
+            if "gti" in novos:
+                limitador.definir_concorrencia(novos["gti"])
+            if "inferencia" in novos:
+                inferencia.pool.redimensionar(novos["inferencia"])
+                inferencia.max_paralelo = novos["inferencia"]
+            if "pool_llm" in novos:
+                pool_llm.redimensionar(novos["pool_llm"])
+            print(f"🎛️ Limites alterados: {novos}")
+            return {"alterados": novos}
+
+        #desliga o processo mantendo os checkpoints (as conversas continuam no próximo start)
+        @painel.rota("POST", "/parar")
+        def parar(params):
+            parada.set()
+            return {"parando": True}
+
+        # sem porta não tem como mandar /parar: roda até as conversas acabarem
+        if controle and await painel.iniciar() is None and not canal:
+            painel = None
 
-    # Criar tarefas iniciais
-    for par in novos_pares:
-        tarefa = asyncio.create_task(conversar_com_limite(par[0], par[1], turno, sem))
-        tarefas.append(tarefa)
-        pares_em_execucao.add(par)
+    # Trabalhador: aplica as instâncias que o supervisor manda e devolve o estado periodicamente
+    respostas = set()
 
-    print("Pressione 'r' para atualizar agentes ou 'q' para parada emergencial...")
+    async def atender_supervisor():
+        while True:
+            tipo, *dados = await canal.receber()
+            if tipo == "adicionar":
+                novos = await AgenteGTI.from_rows(dados[0])
+                agentes.extend(novos)
+                await aplicar_rotas(novos, [])
+            elif tipo == "remover":
+                # o supervisor espera a confirmação antes de entregar as instâncias a outro processo
+                id_comando, nomes = dados
+                saem = set(nomes)
+                removidos = [ag for ag in agentes if ag.nome in saem]
+                agentes[:] = [ag for ag in agentes if ag.nome not in saem]
+                await aplicar_rotas([], removidos, manter_checkpoint=True)
+                canal.enviar("resposta", id_comando, 200, {"removidos": len(removidos)})
+            elif tipo == "comando":
+                # guarda a referência: o loop só segura tarefas fracamente
+                tarefa = asyncio.create_task(responder_supervisor(*dados))
+                respostas.add(tarefa)
+                tarefa.add_done_callback(respostas.discard)
+            elif tipo == "parar":
+                parada.set()
+                return
+
+    async def responder_supervisor(id_comando, metodo, caminho, params):
+        status, corpo = await painel.executar(metodo, caminho, params)
+        canal.enviar("resposta", id_comando, status, corpo)
 
-    # Monitoramento de teclas
-    async def monitorar_teclas():
-        nonlocal tarefas, pares_em_execucao
+    async def relatar_estado():
         while True:
-            await asyncio.sleep(0.2)
-            if keyboard.is_pressed('r'):
-                print("🔄 Atualizando status dos agentes...")
-                await atualizar_status_parallel(agentes)
-                agentes_conectados = await verificar_agentes(agentes)
-                novos_pares = await criar_pares_ordenados(agentes_conectados)
-                for par in novos_pares:
-                    tarefa = asyncio.create_task(conversar_com_limite(par[0], par[1], turno, sem))
-                    tarefas.append(tarefa)
-                    pares_em_execucao.add(par)
-
-            if keyboard.is_pressed('q'):
-                print("deveria parar mas desabilitei a opcao")  #print("\n⏹ Parada emergencial detectada! Cancelando todas as conversas...")
-                for t in tarefas:
-                    print("nao vai parar")
-                    #t.cancel()
-                break
-        print("Encerrando monitoramento de teclas...")
-
-    # Executa todas as tarefas + monitoramento
-    await asyncio.gather(*tarefas, monitorar_teclas(), return_exceptions=True)
+            canal.enviar("estado", {**estado_atual(), "agentes": len(agentes)})
+            await asyncio.sleep(SUPERVISOR_RELATORIO)
+
+    tarefas_canal = [asyncio.create_task(atender_supervisor()), asyncio.create_task(relatar_estado())] if canal else []
+
+    # Executa o agendador até todas as conversas terminarem; com painel ou webhook o processo
+    # é um serviço e só para com POST /parar (ou Ctrl+C)
+    laco = asyncio.create_task(agendador.executar())
+    esperas = [asyncio.create_task(parada.wait())]
+    if not (painel or receptor):
+        esperas.append(asyncio.create_task(agendador.aguardar()))
+    try:
+        await asyncio.wait(esperas, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for tarefa in esperas + tarefas_canal:
+            tarefa.cancel()
+        agendador.parar()
+        laco.cancel()
+        motor.encerrar()
+        print(f"📊 Inferência: {inferencia.estatisticas()}")
+        print(f"📊 Backends: {roteador.estatisticas()}")
+        print(f"📊 API GTI: {limitador.estatisticas()}")
+        print(f"📊 Pareamento: {motor.estatisticas()}")
+        print(f"📊 Pré-geração: {pregeracao.estatisticas()}")
+        print(f"📊 Cache de respostas: {cache_respostas.estatisticas()}")
+        if tarefa_cache:
+            tarefa_cache.cancel()
+        cache_respostas.salvar()
+        if receptor:
+            print(f"📊 Webhook: {receptor.estatisticas()}")
+            await receptor.parar()
+        if painel:
+            await painel.parar()
+        if agendador.relogio.virtual:
+            print(f"📊 Simulação: {agendador.relogio.estatisticas()}")
+        await pregeracao.parar()
+        await inferencia.parar()
+        await fechar_transporte()
+        await fechar_banco()
+        if tarefa_recarga:
+            tarefa_recarga.cancel()
+        if servidor_metricas:
+            servidor_metricas.close()
+        if tarefa_snapshot:
+            tarefa_snapshot.cancel()
+        definir_relogio(None)
 
 # ===========================
 # Rodar script
 # ===========================
+#processo trabalhador do supervisor: roda o main() só com as instâncias do seu pedaço do anel
+def rodar_trabalhador(indice, linhas, conexao, opcoes):
+    async def rodar():
+        canal = CanalTrabalhador(conexao)
+        canal.iniciar()
+        agentes = await AgenteGTI.from_rows(linhas)
+        print(f"🧩 Trabalhador {indice}: {len(agentes)} instâncias")
+        await main(agentes=agentes, controle=False, canal=canal, **opcoes)
+
+    try:
+        asyncio.run(rodar())
+    except KeyboardInterrupt:
+        pass  # Ctrl+C chega em todos os processos; o main() já fechou mantendo os checkpoints
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if SUPERVISOR_TRABALHADORES > 1:
+        asyncio.run(Supervisor(rodar_trabalhador).executar())
+    else:
+        asyncio.run(main())
\ No newline at end of file
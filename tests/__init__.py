@@ -0,0 +1,5 @@
+import os
+
+# IA.ia cria o cliente do gemini no import; os testes nunca chamam o serviço de verdade
+os.environ.setdefault("GEMINI_API_KEY", "teste")
+os.environ.setdefault("METRICAS_PORTA", "0")
@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+
+from IA.pregeracao import PoolPregeracao, ABERTURA
+from utilis.agendador import Agendador
+from utilis.relogio import RelogioVirtual, definir_relogio
+from utilis.utils import retry
+
+
+class ConversaFalsa:
+    #passos = lista de corrotinas (uma por passo); cada uma devolve o próximo atraso ou None
+    def __init__(self, passos):
+        self.passos = list(passos)
+        self.cancelada = False
+        self.pausada = False
+        self.agendador = None
+        self.concluida = asyncio.get_running_loop().create_future()
+
+    async def passo(self):
+        return await self.passos.pop(0)(self)
+
+    def ao_falhar(self, erro):
+        return None
+
+    def finalizar(self):
+        if not self.concluida.done():
+            self.concluida.set_result(True)
+
+
+class TestAgendadorVirtual(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.relogio = RelogioVirtual()
+        self.agendador = Agendador(relogio=self.relogio)
+        self.laco = asyncio.create_task(self.agendador.executar())
+
+    async def asyncTearDown(self):
+        self.agendador.parar()
+        self.laco.cancel()
+        definir_relogio(None)
+
+    async def test_nao_pula_com_geracao_pendente(self):
+        liberar = asyncio.Event()
+        momentos = []
+
+        async def dispara(conversa):
+            # como a Conversa: a geração do próximo passo roda enquanto ela espera a vez
+            conversa.agendador.acompanhar(asyncio.create_task(liberar.wait()))
+            return 600.0
+
+        async def anota(conversa):
+            momentos.append(self.relogio.deslocamento)
+            return None
+
+        conversa = ConversaFalsa([dispara, anota])
+        self.agendador.adicionar(conversa)
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.relogio.deslocamento, 0.0)
+        self.assertEqual(momentos, [])
+
+        liberar.set()
+        await asyncio.wait_for(conversa.concluida, 1)
+        self.assertGreater(momentos[0], 599)
+
+    async def test_pula_com_passo_parado_no_relogio(self):
+        definir_relogio(self.relogio)
+        tentativas = []
+
+        @retry(3, 300, exceptions=(ValueError,), delay_max=300, jitter=False, orcamento=None, repetir_se=lambda e: True)
+        async def instavel():
+            tentativas.append(self.relogio.agora())
+            if len(tentativas) < 2:
+                raise ValueError("falhou")
+            return "ok"
+
+        async def envia(conversa):
+            await instavel()
+            return None
+
+        conversa = ConversaFalsa([envia])
+        self.agendador.adicionar(conversa)
+        # o backoff de 300s do retry dorme no relógio virtual e é pulado
+        await asyncio.wait_for(conversa.concluida, 1)
+        self.assertEqual(len(tentativas), 2)
+        self.assertGreaterEqual(tentativas[1] - tentativas[0], 300)
+        self.assertGreaterEqual(self.relogio.deslocamento, 299)
+
+
+class TestPregeracaoVirtual(unittest.IsolatedAsyncioTestCase):
+    async def test_validade_no_relogio_virtual(self):
+        relogio = RelogioVirtual()
+
+        async def gerar(*args, **kwargs):
+            return "oi"
+
+        pool = PoolPregeracao(gerar, {ABERTURA: (" ", "")}, validade=60.0, relogio=relogio)
+        pool.itens[ABERTURA].append(("oi", pool._agora()))
+        relogio.avancar_ate(relogio.agora() + 120)
+        self.assertIsNone(pool.pegar(ABERTURA))
+        self.assertEqual(pool.stats["vencidos"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
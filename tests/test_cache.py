@@ -0,0 +1,75 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from IA import ia
+from IA.cache import CacheRespostas
+from IA.contexto import ContextoConversa
+
+
+def contexto(resumo, total=40):
+    return ContextoConversa(resumo, [{"role": "web_1", "content": "tudo bem?"}], total)
+
+
+class TestChaveCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = CacheRespostas(min_candidatos=1)
+
+    def test_resumo_diferente_muda_a_chave(self):
+        a = self.cache.chave("tudo bem?", contexto("falamos de futebol"), "p")
+        b = self.cache.chave("tudo bem?", contexto("falamos de receitas"), "p")
+        self.assertNotEqual(a, b)
+        self.assertEqual(a, self.cache.chave("tudo bem?", contexto("falamos de futebol"), "p"))
+
+    def test_resumo_em_lista_de_mensagens(self):
+        historico = [{"role": "system", "content": "Resumo: falamos de futebol..."},
+                     {"role": "web_1", "content": "tudo bem?"}]
+        outro = [{"role": "system", "content": "Resumo: falamos de receitas..."},
+                 {"role": "web_1", "content": "tudo bem?"}]
+        self.assertNotEqual(self.cache.chave("tudo bem?", historico), self.cache.chave("tudo bem?", outro))
+
+    def test_fallback_nao_entra_no_cache(self):
+        cache = ia.cache_respostas
+        chave = cache.chave("pergunta só deste teste", None, "")
+        cache.guardar(chave, ia.RESPOSTA_VAZIA)
+        self.assertNotIn(chave, cache.entradas)
+
+        chamadas = []
+
+        def gerar(user_message, historico=None, prompt_extra=""):
+            chamadas.append(user_message)
+            return ia.RESPOSTA_VAZIA
+
+        envolvido = CacheRespostas(min_candidatos=1)
+        envolvido.ignorar.add(ia.RESPOSTA_VAZIA)
+        gerar = envolvido.envolver(gerar)
+        gerar("oi")
+        gerar("oi")
+        self.assertEqual(len(chamadas), 2)
+        self.assertEqual(len(envolvido.entradas), 0)
+
+
+class TestSalvarCache(unittest.IsolatedAsyncioTestCase):
+    async def test_salva_periodicamente(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, "cache.json")
+            cache = CacheRespostas()
+            cache.guardar(cache.chave("oi", None, ""), "e aí")
+            tarefa = asyncio.create_task(cache.salvar_periodico(intervalo=0.05, caminho=caminho))
+            try:
+                for _ in range(100):
+                    if os.path.exists(caminho):
+                        break
+                    await asyncio.sleep(0.01)
+            finally:
+                tarefa.cancel()
+            with open(caminho, encoding="utf-8") as f:
+                dados = json.load(f)
+            self.assertEqual([itens[0][0] for itens in dados.values()], ["e aí"])
+            self.assertEqual(CacheRespostas().carregar(caminho), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from IA.contexto import ContextoConversa, HistoricoPar, Mensagem, CUSTO_MENSAGEM, JANELA_RECENTE, TAMANHO_RESUMO
+from utilis import utils
+
+
+class No:
+    def __init__(self, nome):
+        self.nome = nome
+
+
+def mensagem(i, texto=None):
+    return {"role": "web_1" if i % 2 == 0 else "web_2", "content": texto or f"msg{i}"}
+
+
+#o que o contexto tem que ter depois de n mensagens, calculado do jeito lento (log inteiro)
+def esperado(mensagens):
+    antigas = [m["content"] for m in mensagens[:-JANELA_RECENTE]]
+    return " ".join(antigas)[:TAMANHO_RESUMO], mensagens[-JANELA_RECENTE:]
+
+
+class TestContextoConversa(unittest.TestCase):
+    def test_resumo_e_janela_depois_de_n_mensagens(self):
+        for n in (0, 1, JANELA_RECENTE, JANELA_RECENTE + 1, 10, 60):
+            with self.subTest(n=n):
+                mensagens = [mensagem(i) for i in range(n)]
+                ctx = ContextoConversa.de_historico(mensagens)
+                resumo, recentes = esperado(mensagens)
+                self.assertEqual(ctx.resumo, resumo)
+                self.assertEqual(list(ctx.recentes), recentes)
+                self.assertEqual(ctx.total, n)
+
+    def test_mensagens_prompt(self):
+        ctx = ContextoConversa.de_historico([mensagem(i) for i in range(JANELA_RECENTE)])
+        self.assertEqual(ctx.mensagens_prompt(), [mensagem(i) for i in range(JANELA_RECENTE)])  # nada saiu da janela
+
+        ctx.adicionar(mensagem(JANELA_RECENTE))
+        prompt = ctx.mensagens_prompt()
+        self.assertEqual(prompt[0], {"role": "system", "content": "Resumo: msg0..."})
+        self.assertEqual(prompt[1:], [mensagem(i) for i in range(1, JANELA_RECENTE + 1)])
+
+    def test_resumo_para_de_crescer_no_limite(self):
+        ctx = ContextoConversa()
+        longa = "x" * (TAMANHO_RESUMO - 10)
+        for i in range(JANELA_RECENTE + 2):
+            ctx.adicionar(mensagem(i, f"{i}{longa}"))
+        self.assertEqual(len(ctx.resumo), TAMANHO_RESUMO)
+        self.assertEqual(ctx.resumo, f"0{longa} 1{longa}"[:TAMANHO_RESUMO])
+
+        cheio = ctx.resumo
+        for i in range(1000):
+            ctx.adicionar(mensagem(i))
+        self.assertEqual(ctx.resumo, cheio)
+        self.assertEqual(len(ctx.recentes), JANELA_RECENTE)
+        self.assertEqual(len(ctx.mensagens_prompt()), JANELA_RECENTE + 1)
+
+    def test_copia_nao_muda_com_o_original(self):
+        ctx = ContextoConversa.de_historico([mensagem(i) for i in range(5)])
+        copia = ctx.copia()
+        ctx.adicionar(mensagem(5))
+        self.assertEqual(copia.total, 5)
+        self.assertEqual(list(copia.recentes), [mensagem(i) for i in range(2, 5)])
+        self.assertEqual(copia.resumo, "msg0 msg1")
+
+
+class TestContextoEmDisco(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.object(utils, "HISTORICO_DIR", self.dir.name)
+        self.patch.start()
+        self.a1, self.a2 = No("web_1"), No("web_2")
+
+    def tearDown(self):
+        self.patch.stop()
+        self.dir.cleanup()
+
+    def test_salvar_e_carregar(self):
+        ctx = ContextoConversa.de_historico([mensagem(i) for i in range(8)])
+        ctx.salvar(self.a1, self.a2)
+        carregado = ContextoConversa.carregar(self.a1, self.a2)
+        self.assertEqual((carregado.resumo, list(carregado.recentes), carregado.total),
+                         (ctx.resumo, list(ctx.recentes), ctx.total))
+        carregado.adicionar(mensagem(8))
+        self.assertEqual(len(carregado.recentes), JANELA_RECENTE)
+
+    def test_sem_contexto_salvo_monta_do_log(self):
+        mensagens = [mensagem(i) for i in range(12)]
+        for msg in mensagens:
+            utils.anexar_historico(self.a1, self.a2, msg)
+        ctx = ContextoConversa.carregar(self.a1, self.a2)
+        resumo, recentes = esperado(mensagens)
+        self.assertEqual((ctx.resumo, list(ctx.recentes), ctx.total), (resumo, recentes, 12))
+        self.assertFalse(os.path.exists(os.path.join(self.dir.name, "web_1_web_2.ctx.json")))
+
+    def test_par_novo(self):
+        ctx = ContextoConversa.carregar(self.a1, self.a2)
+        self.assertEqual((ctx.resumo, list(ctx.recentes), ctx.total), ("", [], 0))
+        self.assertEqual(ctx.mensagens_prompt(), [])
+
+
+class TestHistoricoPar(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.object(utils, "HISTORICO_DIR", self.dir.name)
+        self.patch.start()
+        self.a1, self.a2 = No("web_1"), No("web_2")
+
+    def tearDown(self):
+        self.patch.stop()
+        self.dir.cleanup()
+
+    def conferir_limites(self, historico):
+        self.assertLessEqual(len(historico), historico.janela)
+        self.assertLessEqual(historico.bytes, historico.max_bytes)
+        self.assertEqual(historico.bytes, sum(m.tamanho() for m in historico.mensagens))
+
+    def test_janela_depois_de_n_mensagens(self):
+        for n in (0, 1, 5, 6, 50):
+            with self.subTest(n=n):
+                historico = HistoricoPar(No(f"a{n}"), No(f"b{n}"), janela=5, max_bytes=10**6)
+                mensagens = [historico.adicionar(mensagem(i)) for i in range(n)]
+                self.assertEqual(len(historico), min(n, 5))
+                self.assertEqual([m["content"] for m in historico], [m["content"] for m in mensagens[-5:]])
+                self.assertEqual(historico.ultimas(2), [dict(m, number=None, time=None) for m in mensagens[-2:]])
+                self.assertEqual(len(historico.completo()), n)  # o log inteiro continua no disco
+                self.conferir_limites(historico)
+
+    def test_teto_de_bytes(self):
+        historico = HistoricoPar(self.a1, self.a2, janela=100, max_bytes=4 * (CUSTO_MENSAGEM + 100))
+        for i in range(30):
+            historico.adicionar(mensagem(i, f"{i:03d}" + "x" * 97))
+            self.conferir_limites(historico)
+        self.assertEqual([m["content"][:3] for m in historico], ["026", "027", "028", "029"])
+
+        historico.adicionar(mensagem(30, "curta"))  # abre espaço só o que precisa
+        self.assertEqual([m["content"][:3] for m in historico], ["027", "028", "029", "cur"])
+        self.conferir_limites(historico)
+
+    def test_mensagem_maior_que_o_teto_fica_sozinha(self):
+        historico = HistoricoPar(self.a1, self.a2, janela=10, max_bytes=500)
+        historico.adicionar(mensagem(0))
+        historico.adicionar(mensagem(1, "x" * 1000))
+        self.assertEqual(len(historico), 1)
+        self.assertEqual(historico.ultimas(1)[0]["content"], "x" * 1000)
+        historico.adicionar(mensagem(2))
+        self.assertEqual([m["content"] for m in historico], ["msg2"])
+        self.conferir_limites(historico)
+
+    def test_recarrega_do_disco_dentro_dos_limites(self):
+        for i in range(40):
+            utils.anexar_historico(self.a1, self.a2, mensagem(i, f"{i:03d}" + "x" * 97))
+        historico = HistoricoPar(self.a1, self.a2, janela=10, max_bytes=10**6)
+        self.assertEqual([m["content"][:3] for m in historico], [f"{i:03d}" for i in range(30, 40)])
+        historico = HistoricoPar(self.a1, self.a2, janela=10, max_bytes=3 * (CUSTO_MENSAGEM + 100))
+        self.assertEqual([m["content"][:3] for m in historico], ["037", "038", "039"])
+        self.conferir_limites(historico)
+
+    def test_mensagem_sem_dict(self):
+        msg = Mensagem.de_dict({"role": "web_1", "content": "oi"})
+        self.assertFalse(hasattr(msg, "__dict__"))
+        self.assertEqual(msg.tamanho(), CUSTO_MENSAGEM + 2)
+        self.assertEqual(Mensagem.de_dict({"role": "web_1"}).tamanho(), CUSTO_MENSAGEM)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import socket
+import tempfile
+import unittest
+from unittest import mock
+
+import httpx
+
+import main as app
+from GTI import instancia_GTI
+from GTI.instancia_GTI import AgenteGTI
+from utilis import utils
+from utilis.controle import ErroComando, PainelControle
+
+
+class TestPainelControle(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.painel = PainelControle(host="127.0.0.1", porta=0, socket="")
+
+        @self.painel.rota("GET", "/eco")
+        def eco(params):
+            return params
+
+        @self.painel.rota("POST", "/falha")
+        def falha(params):
+            raise ErroComando("agente x não encontrado")
+
+        await self.painel.iniciar()
+        self.cliente = httpx.AsyncClient(base_url=f"http://127.0.0.1:{self.painel.porta}")
+
+    async def asyncTearDown(self):
+        await self.cliente.aclose()
+        await self.painel.parar()
+
+    async def test_parametros_da_query_e_do_corpo(self):
+        r = await self.cliente.request("GET", "/eco?a=1", json={"b": 2})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json(), {"a": "1", "b": 2})
+
+    async def test_erros(self):
+        r = await self.cliente.post("/nao_existe")
+        self.assertEqual(r.status_code, 404)
+        self.assertIn("GET /eco", r.json()["comandos"])
+        r = await self.cliente.request("GET", "/eco", content=b"{nao e json")
+        self.assertEqual(r.status_code, 400)
+        r = await self.cliente.post("/falha")
+        self.assertEqual((r.status_code, r.json()), (400, {"erro": "agente x não encontrado"}))
+
+    async def test_linha_de_status_com_a_frase(self):
+        leitor, escritor = await asyncio.open_connection("127.0.0.1", self.painel.porta)
+        escritor.write(b"POST /nao_existe HTTP/1.1\r\nHost: x\r\n\r\n")
+        await escritor.drain()
+        self.assertEqual(await leitor.readline(), b"HTTP/1.1 404 Not Found\r\n")
+        escritor.close()
+
+    async def test_porta_ocupada_nao_derruba(self):
+        outro = PainelControle(host="127.0.0.1", porta=self.painel.porta, socket="")
+        self.assertIsNone(await outro.iniciar())
+        self.assertIsNone(outro.servidor)
+        await outro.parar()
+
+
+#main() de verdade com a GTI simulada (MockTransport), o ollama fora e o gemini falso respondendo
+class TestRotasDoMain(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.enviadas = 0
+
+        def atender(request):
+            if request.url.path.endswith("/send/text"):
+                self.enviadas += 1
+                return httpx.Response(200, json={"ok": True})
+            return httpx.Response(200, json={"status": {"connected": True}, "instance": {"owner": "5511"}})
+
+        self.cliente = httpx.AsyncClient(base_url="http://gti.teste", transport=httpx.MockTransport(atender))
+        self.painel = None
+
+        def criar_painel():
+            self.painel = PainelControle(host="127.0.0.1", porta=0, socket="")
+            return self.painel
+
+        ollama_fora = ConnectionError("ollama fora")
+        for alvo in (mock.patch.object(utils, "HISTORICO_DIR", self.dir.name),
+                     mock.patch.object(instancia_GTI, "_cliente", self.cliente),
+                     mock.patch.object(app, "PainelControle", criar_painel),
+                     mock.patch("ollama.chat", side_effect=ollama_fora),
+                     mock.patch("ollama.generate", side_effect=ollama_fora)):
+            alvo.start()
+            self.addCleanup(alvo.stop)
+
+    async def asyncTearDown(self):
+        self.dir.cleanup()
+
+    async def test_estado_pausar_retomar_parar(self):
+        agentes = await AgenteGTI.from_rows([(f"web_{i}", f"t{i}") for i in range(1, 5)])
+
+        def reserva(user_message, historico=None, prompt_extra=""):
+            return "oi, tudo bem?"
+
+        execucao = asyncio.create_task(app.main(agentes=agentes, turno=1000, test_mode=True, reserva=reserva))
+        for _ in range(100):
+            if self.painel is not None and self.painel.servidor is not None:
+                break
+            await asyncio.sleep(0.05)
+
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{self.painel.porta}", timeout=10) as http:
+            estado = (await http.get("/estado")).json()
+            self.assertEqual(estado["conversas_ativas"], 2)
+            self.assertEqual(estado["pareamento"]["pares"], 2)
+
+            r = await http.post("/pausar", params={"agente": "web_1"})
+            self.assertEqual(r.json(), {"pausadas": 1})
+            self.assertEqual((await http.get("/estado")).json()["conversas_pausadas"], 1)
+            r = await http.post("/pausar")
+            self.assertEqual(r.json(), {"pausadas": 1})  # a outra; a primeira já estava
+            self.assertFalse((await http.get("/estado")).json()["pareamento"]["ativo"])
+
+            r = await http.post("/retomar", json={})
+            self.assertEqual(r.json(), {"retomadas": 2})
+            estado = (await http.get("/estado")).json()
+            self.assertEqual(estado["conversas_pausadas"], 0)
+            self.assertTrue(estado["pareamento"]["ativo"])
+
+            r = await http.post("/pausar", params={"agente": "web_99"})
+            self.assertEqual(r.status_code, 400)
+            r = await http.post("/limites", content=b"{envio: 5")
+            self.assertEqual(r.status_code, 400)
+            r = await http.post("/limites", json={"envio": "muitos"})
+            self.assertEqual(r.status_code, 400)
+            r = await http.post("/desligar")
+            self.assertEqual(r.status_code, 404)
+
+            r = await http.post("/parar")
+            self.assertEqual(r.json(), {"parando": True})
+        await asyncio.wait_for(execucao, 10)
+        self.assertGreater(self.enviadas, 0)
+        # parada limpa: os pares ficam com checkpoint para o próximo start
+        self.assertEqual(len(utils.listar_checkpoints()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
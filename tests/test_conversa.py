@@ -0,0 +1,207 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from IA.ia import Conversa, RESPOSTA_ERRO, RESPOSTA_VAZIA
+from IA.pregeracao import PoolPregeracao, ABERTURA, CONTINUACAO
+from utilis import utils
+from utilis.agendador import Agendador
+
+
+class AgenteFalso:
+    def __init__(self, nome, numero):
+        self.nome = nome
+        self.numero = numero
+        self.enviadas = []
+        self.ao_enviar = None  # chamado durante o envio (ex.: ler o checkpoint)
+
+    async def enviar_mensagem_async(self, numero, mensagem):
+        if self.ao_enviar:
+            self.ao_enviar()
+        self.enviadas.append((numero, mensagem))
+        return True, {"ok": True}
+
+
+class TestCheckpointConversa(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.object(utils, "HISTORICO_DIR", self.dir.name)
+        self.patch.start()
+        self.a1, self.a2 = AgenteFalso("web_1", "5501"), AgenteFalso("web_2", "5502")
+        self.agendador = Agendador()
+        self.gerados = 0
+
+    async def asyncTearDown(self):
+        self.patch.stop()
+        self.dir.cleanup()
+
+    async def gerar(self, mensagem, historico, prompt_extra, prazo=None):
+        self.gerados += 1
+        return f"fala {self.gerados}"
+
+    def conversa(self):
+        conversa = Conversa(self.a1, self.a2, max_turnos=5, test_mode=True, get_ia_response=self.gerar)
+        conversa.agendador = self.agendador
+        return conversa
+
+    async def test_checkpoint_antes_e_depois_do_envio(self):
+        conversa = self.conversa()
+        durante = []
+        self.a1.ao_enviar = lambda: durante.append(utils.carregar_checkpoint(self.a1, self.a2))
+
+        await conversa.passo()
+        self.assertEqual(durante[0]["enviando"], "fala 1")
+        self.assertEqual(durante[0]["vez"], 0)
+
+        await conversa.pendente
+        depois = utils.carregar_checkpoint(self.a1, self.a2)
+        self.assertIsNone(depois["enviando"])
+        self.assertEqual(depois["vez"], 1)
+        self.assertEqual(depois["counts"], [1, 0])
+        self.assertEqual(depois["pendente"], "fala 2")
+        conversa.pendente.cancel()
+
+    async def test_queda_no_meio_do_envio_nao_reenvia(self):
+        primeira = self.conversa()
+
+        async def cai(numero, mensagem):
+            raise asyncio.CancelledError  # processo derrubado com a requisição no ar
+
+        self.a1.enviar_mensagem_async = cai
+        with self.assertRaises(asyncio.CancelledError):
+            await primeira.passo()
+        self.assertEqual(utils.carregar_checkpoint(self.a1, self.a2)["enviando"], "fala 1")
+
+        del self.a1.enviar_mensagem_async
+        retomada = self.conversa()
+        await retomada.passo()
+        self.assertEqual(self.a1.enviadas, [])  # a fala incerta não sai de novo
+        self.assertEqual(retomada.counts, [1, 0])
+        self.assertEqual(retomada.vez, 1)
+        self.assertEqual(retomada.entrada[0], "fala 1")
+        self.assertEqual(retomada.historico.ultimas(1)[0]["content"], "fala 1")
+
+        await retomada.passo()
+        self.assertEqual(self.a2.enviadas, [("5501", "fala 2")])
+        retomada.pendente.cancel()
+
+    async def test_soltar_mantem_checkpoint(self):
+        conversa = self.conversa()
+        self.agendador.ativas.add(conversa)
+        await conversa.passo()
+        await conversa.pendente
+        self.assertTrue(conversa.soltar())
+        retomada = self.conversa()
+        self.assertEqual(retomada.vez, 1)
+        self.assertEqual(retomada.counts, [1, 0])
+
+        self.agendador.ativas.add(retomada)
+        self.assertTrue(retomada.cancelar())  # cancelar de verdade apaga
+        self.assertIsNone(utils.carregar_checkpoint(self.a1, self.a2))
+
+    async def test_soltar_esperando_vaga_nao_envia(self):
+        conversa = self.conversa()
+        self.agendador.ativas.add(conversa)
+        await conversa.passo()
+        await conversa.pendente
+
+        while not self.agendador.sem_envio.locked():  # todas as vagas de envio ocupadas
+            await self.agendador.sem_envio.acquire()
+        passo = asyncio.create_task(conversa.passo())
+        await asyncio.sleep(0)
+        conversa.soltar()
+        self.agendador.sem_envio.release()
+        self.assertIsNone(await passo)
+        self.assertEqual(self.a2.enviadas, [])
+        # o checkpoint não marca a fala como enviada: quem retomar gera e envia
+        estado = utils.carregar_checkpoint(self.a1, self.a2)
+        self.assertIsNone(estado["enviando"])
+        self.assertEqual(estado["vez"], 1)
+
+    async def test_cancelar_com_envio_no_ar_nao_gera_a_proxima(self):
+        conversa = self.conversa()
+        self.agendador.ativas.add(conversa)
+        self.a1.ao_enviar = conversa.cancelar
+        self.assertIsNone(await conversa.passo())
+        self.assertEqual(self.a1.enviadas, [("5502", "fala 1")])
+        self.assertIsNone(conversa.pendente)
+        self.assertEqual(self.gerados, 1)
+        self.assertEqual(conversa.counts, [1, 0])
+        self.assertEqual(conversa.historico.ultimas(1)[0]["content"], "fala 1")
+        self.assertIsNone(utils.carregar_checkpoint(self.a1, self.a2))
+
+    def test_apaga_checkpoints_fora_da_rota(self):
+        utils.salvar_checkpoint(self.a1, self.a2, {"agente1": "web_1", "agente2": "web_2"})
+        web_3 = AgenteFalso("web_3", "5503")
+        utils.salvar_checkpoint(self.a1, web_3, {"agente1": "web_1", "agente2": "web_3"})
+
+        self.assertEqual(utils.apagar_checkpoints_orfaos(["web_1", "web_2"]), 1)
+        self.assertIsNotNone(utils.carregar_checkpoint(self.a1, self.a2))
+        self.assertIsNone(utils.carregar_checkpoint(self.a1, web_3))
+        self.assertEqual(os.listdir(self.dir.name).count("web_1_web_2.estado.json"), 1)
+
+
+class TestFalhaGeracao(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.object(utils, "HISTORICO_DIR", self.dir.name)
+        self.patch.start()
+
+        async def gerar(*args, **kwargs):
+            return "nunca"
+
+        self.pregeracao = PoolPregeracao(gerar, {ABERTURA: (" ", ""), CONTINUACAO: (" ", "")})
+        for tipo in (ABERTURA, CONTINUACAO):
+            self.pregeracao.itens[tipo].append((f"{tipo} pronta", self.pregeracao._agora()))
+        self.conversa = Conversa(AgenteFalso("web_1", "5501"), AgenteFalso("web_2", "5502"), test_mode=True,
+                                 get_ia_response=gerar, pregeracao=self.pregeracao)
+
+    async def asyncTearDown(self):
+        self.patch.stop()
+        self.dir.cleanup()
+
+    async def test_resposta_nao_vira_continuacao_generica(self):
+        self.conversa.entrada = ("tudo bem?", Conversa.PROMPT_RESPOSTA)
+        self.assertGreater(self.conversa.ao_falhar(RuntimeError("backends fora")), 0)
+        self.assertIsNone(self.conversa.pendente)  # gera ao vivo na próxima tentativa
+        self.assertEqual(len(self.pregeracao.itens[CONTINUACAO]), 1)
+
+    async def test_abertura_so_usa_abertura(self):
+        self.assertEqual(self.conversa.ao_falhar(RuntimeError("backends fora")), 0.0)
+        self.assertEqual(await self.conversa.pendente, "abertura pronta")
+        self.assertEqual(len(self.pregeracao.itens[CONTINUACAO]), 1)
+
+        self.assertGreater(self.conversa.ao_falhar(RuntimeError("backends fora")), 0)
+        self.assertIsNone(self.conversa.pendente)
+
+    async def test_continuacao_usa_estoque(self):
+        self.conversa.entrada = ("beleza", Conversa.PROMPT_CONTINUAR)
+        self.assertEqual(self.conversa.ao_falhar(RuntimeError("backends fora")), 0.0)
+        self.assertEqual(await self.conversa.pendente, "continuacao pronta")
+
+
+class TestPregeracaoFallback(unittest.IsolatedAsyncioTestCase):
+    async def test_fallback_do_backend_nao_vai_para_o_estoque(self):
+        respostas = [RESPOSTA_ERRO, RESPOSTA_VAZIA, "e aí, sumido!"]
+
+        async def gerar(*args, **kwargs):
+            return respostas.pop(0) if len(respostas) > 1 else respostas[0]
+
+        pool = PoolPregeracao(gerar, {ABERTURA: (" ", "")}, tamanhos={ABERTURA: 1}, intervalo=0.001)
+        pool.iniciar()
+        try:
+            for _ in range(200):
+                if pool.itens[ABERTURA]:
+                    break
+                await asyncio.sleep(0.001)
+        finally:
+            await pool.parar()
+        self.assertEqual(pool.stats["fallbacks"], 2)
+        self.assertEqual(pool.pegar(ABERTURA), "e aí, sumido!")
+        self.assertIsNone(pool.pegar(ABERTURA))
+
+
+if __name__ == "__main__":
+    unittest.main()
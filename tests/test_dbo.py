@@ -0,0 +1,110 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import httpx
+
+from dbo import dbo
+from GTI import instancia_GTI
+
+
+class TestValidarTabela(unittest.TestCase):
+    def test_aceita_identificadores(self):
+        for tabela in ("ROTA", "dbo.ROTA", "[NEWWORK].[dbo].[ROTA]", "banco.dbo.[ROTA_2]"):
+            self.assertEqual(dbo.validar_tabela(tabela), tabela)
+
+    def test_recusa_sql(self):
+        for tabela in ("ROTA; DROP TABLE ROTA", "ROTA--", "[ROTA]]", "a.b.c.d", "", "ROTA WHERE 1=1", None):
+            with self.assertRaises(ValueError):
+                dbo.validar_tabela(tabela)
+
+    def test_configurar_banco_valida(self):
+        with self.assertRaises(ValueError):
+            dbo.configurar_banco(tabela="ROTA UNION SELECT 1")
+        self.assertEqual(dbo._config["tabela"], dbo.DB_TABELA_ROTA)
+
+
+class TestBancoSqlite(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.arquivo = os.path.join(self.dir.name, "rotas.db")
+        with sqlite3.connect(self.arquivo) as conn:
+            conn.execute("CREATE TABLE ROTA (TELEFONE TEXT, SENHA TEXT, SERVICO TEXT, TIPO_ROTA TEXT)")
+            conn.executemany("INSERT INTO ROTA VALUES (?, ?, 'MATURACAO', 'MATURACAO')",
+                             [("web_1", "s1"), ("web_2", "s2"), ("web_3", "s3")])
+            conn.execute("INSERT INTO ROTA VALUES ('web_9', 's9', 'OUTRO', 'MATURACAO')")
+            conn.execute("INSERT INTO ROTA VALUES ('cel_1', 'c1', 'MATURACAO', 'MATURACAO')")
+
+        self.consultas_status = []
+
+        def atender(request):
+            self.consultas_status.append(request.headers["token"])
+            return httpx.Response(200, json={"status": {"connected": True}, "instance": {"owner": "5511"}})
+
+        self.cliente = httpx.AsyncClient(base_url="http://gti.teste", transport=httpx.MockTransport(atender))
+        self.patch = mock.patch.object(instancia_GTI, "_cliente", self.cliente)
+        self.patch.start()
+        self.config = dict(dbo._config)
+        dbo.configurar_banco(lambda: sqlite3.connect(self.arquivo, check_same_thread=False), tamanho=2, tabela="ROTA")
+
+    async def asyncTearDown(self):
+        await dbo.fechar_banco()
+        dbo._config.update(self.config)
+        self.patch.stop()
+        await self.cliente.aclose()
+        self.dir.cleanup()
+
+    def executar(self, sql, *parametros):
+        with sqlite3.connect(self.arquivo) as conn:
+            conn.execute(sql, parametros)
+
+    async def test_pool_reusa_conexoes(self):
+        pool = dbo.obter_pool()
+        resultados = await asyncio.gather(*(pool.consultar("SELECT COUNT(*) FROM ROTA WHERE SENHA = ?", ("s1",))
+                                            for _ in range(6)))
+        self.assertEqual(resultados, [[(1,)]] * 6)
+        self.assertLessEqual(pool._criadas, 2)
+        self.assertEqual(len(pool._livres), pool._criadas)
+
+    async def test_pool_descarta_conexao_com_erro(self):
+        pool = dbo.obter_pool()
+        with self.assertRaises(sqlite3.OperationalError):
+            await pool.consultar("SELECT * FROM NAO_EXISTE")
+        self.assertEqual(pool._criadas, 0)
+        self.assertEqual(await pool.consultar("SELECT 1"), [(1,)])
+
+    async def test_carga_e_recarga_incremental(self):
+        agentes = await dbo.carregar_agentes_async_do_banco_async()
+        self.assertEqual(sorted(ag.nome for ag in agentes), ["web_1", "web_2", "web_3"])
+        self.assertTrue(all(ag.conectado for ag in agentes))
+        self.assertEqual(sorted(self.consultas_status), ["s1", "s2", "s3"])
+
+        self.executar("DELETE FROM ROTA WHERE TELEFONE = 'web_1'")
+        self.executar("UPDATE ROTA SET SENHA = 's2b' WHERE TELEFONE = 'web_2'")
+        self.executar("INSERT INTO ROTA VALUES ('web_4', 's4', 'MATURACAO', 'MATURACAO')")
+        self.consultas_status.clear()
+        web_3 = next(ag for ag in agentes if ag.nome == "web_3")
+
+        novos, removidos = await dbo.recarregar_agentes_do_banco_async(agentes)
+        self.assertEqual(sorted((ag.nome, ag.token) for ag in novos), [("web_2", "s2b"), ("web_4", "s4")])
+        self.assertEqual(sorted((ag.nome, ag.token) for ag in removidos), [("web_1", "s1"), ("web_2", "s2")])
+        self.assertEqual(sorted(ag.nome for ag in agentes), ["web_2", "web_3", "web_4"])
+        self.assertIn(web_3, agentes)  # quem não mudou continua o mesmo objeto
+        # só os novos consultam status
+        self.assertEqual(sorted(self.consultas_status), ["s2b", "s4"])
+
+        self.assertEqual(await dbo.recarregar_agentes_do_banco_async(agentes), ([], []))
+
+    async def test_recarga_com_banco_fora_nao_mexe(self):
+        agentes = await dbo.carregar_agentes_async_do_banco_async()
+        self.executar("DROP TABLE ROTA")
+        self.assertEqual(await dbo.recarregar_agentes_do_banco_async(agentes), ([], []))
+        self.assertEqual(len(agentes), 3)
+        self.assertIsNone(await dbo.carregar_rotas_do_banco_async())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+import asyncio
+import itertools
+import unittest
+from unittest import mock
+
+import httpx
+
+from GTI import instancia_GTI
+from GTI.instancia_GTI import AgenteGTI, DisparoEmMassa, combinar_envios
+
+_nomes = itertools.count()
+
+
+class TestRetryEnvio(unittest.IsolatedAsyncioTestCase):
+    #cada resposta da lista vira uma requisição: httpx.Response, ou exceção a lançar
+    def montar(self, respostas):
+        self.pedidos = []
+        respostas = iter(respostas)
+
+        def atender(request):
+            self.pedidos.append(request.url.path)
+            resposta = next(respostas)
+            if isinstance(resposta, Exception):
+                raise resposta
+            return resposta
+
+        cliente = httpx.AsyncClient(base_url="http://gti.teste", transport=httpx.MockTransport(atender))
+        self.patches = [mock.patch.object(instancia_GTI, "_cliente", cliente),
+                        mock.patch("utilis.utils.random.uniform", return_value=0.0)]
+        for p in self.patches:
+            p.start()
+        # nome novo por teste: o balde por instância do limitador não atrasa os testes
+        self.agente = AgenteGTI(token="t", nome=f"web_teste_{next(_nomes)}")
+        self.cliente = cliente
+
+    async def asyncTearDown(self):
+        await self.cliente.aclose()
+        for p in self.patches:
+            p.stop()
+
+    async def test_timeout_de_leitura_nao_repete(self):
+        self.montar([httpx.ReadTimeout("lento"), httpx.Response(200, json={})])
+        self.assertEqual(await self.agente.enviar_mensagem_async("5511", "oi"), (False, None))
+        self.assertEqual(len(self.pedidos), 1)
+
+    async def test_5xx_nao_repete(self):
+        self.montar([httpx.Response(500), httpx.Response(200, json={})])
+        self.assertEqual((await self.agente.enviar_mensagem_async("5511", "oi"))[0], False)
+        self.assertEqual(len(self.pedidos), 1)
+
+    async def test_falha_ao_conectar_repete(self):
+        self.montar([httpx.ConnectError("recusada"), httpx.Response(200, json={"id": 1})])
+        self.assertEqual(await self.agente.enviar_mensagem_async("5511", "oi"), (True, {"id": 1}))
+        self.assertEqual(len(self.pedidos), 2)
+
+    async def test_429_com_retry_after_repete(self):
+        self.montar([httpx.Response(429, headers={"Retry-After": "0"}), httpx.Response(200, json={})])
+        self.assertEqual((await self.agente.enviar_mensagem_async("5511", "oi"))[0], True)
+        self.assertEqual(len(self.pedidos), 2)
+
+    async def test_429_sem_retry_after_nao_repete(self):
+        self.montar([httpx.Response(429), httpx.Response(200, json={})])
+        self.assertEqual((await self.agente.enviar_mensagem_async("5511", "oi"))[0], False)
+        self.assertEqual(len(self.pedidos), 1)
+
+    async def test_status_continua_repetindo_timeout(self):
+        self.montar([httpx.ReadTimeout("lento"),
+                     httpx.Response(200, json={"instance": {"owner": "5511"}, "status": {"connected": True}})])
+        await self.agente.atualizar_status_async()
+        self.assertTrue(self.agente.conectado)
+        self.assertEqual(self.pedidos, ["/instance/status", "/instance/status"])
+
+
+class AgenteFalso:
+    def __init__(self, nome, conectado=True, espera=0.0):
+        self.nome = nome
+        self.conectado = conectado
+        self.espera = espera
+        self.enviadas = []
+        self.canceladas = 0
+
+    async def enviar_mensagem_async(self, numero, mensagem):
+        try:
+            await asyncio.sleep(self.espera)
+        except asyncio.CancelledError:
+            self.canceladas += 1
+            raise
+        self.enviadas.append((numero, mensagem))
+        return True, {"id": len(self.enviadas)}
+
+
+class TestDisparoEmMassa(unittest.IsolatedAsyncioTestCase):
+    async def test_envia_todos_e_marca_desconectados(self):
+        agentes = [AgenteFalso("a1"), AgenteFalso("a2", conectado=False)]
+        resultados = await DisparoEmMassa(combinar_envios(agentes, ["n1", "n2"], "oi"), max_paralelo=3).aguardar()
+        self.assertEqual(sorted((r.agente.nome, r.numero, r.status) for r in resultados),
+                         [("a1", "n1", "ok"), ("a1", "n2", "ok"), ("a2", "n1", "desconectado"),
+                          ("a2", "n2", "desconectado")])
+
+    async def test_erro_na_funcao_da_mensagem_vira_resultado(self):
+        def mensagem(ag, numero):
+            if numero == "n2":
+                raise ValueError("sem template")
+            return f"oi {numero}"
+
+        agente = AgenteFalso("a1")
+        disparo = DisparoEmMassa(combinar_envios([agente], ["n1", "n2", "n3"], mensagem), max_paralelo=1)
+        resultados = {r.numero: r for r in await disparo.aguardar()}
+        self.assertEqual(resultados["n2"].status, "erro")
+        self.assertIn("sem template", resultados["n2"].erro)
+        self.assertEqual(agente.enviadas, [("n1", "oi n1"), ("n3", "oi n3")])
+
+    async def test_erro_no_iteravel_sobe_no_async_for(self):
+        agente = AgenteFalso("a1", espera=0.01)
+
+        def envios():
+            yield agente, "n1", "oi"
+            raise RuntimeError("banco caiu")
+
+        disparo = DisparoEmMassa(envios(), max_paralelo=2)
+        with self.assertRaises(RuntimeError):
+            async for _ in disparo:
+                pass
+        self.assertTrue(all(t.done() for t in disparo._tarefas))
+
+    async def test_saida_antecipada_cancela_o_resto(self):
+        agentes = [AgenteFalso(f"a{i}", espera=0.05 * i) for i in range(1, 5)]
+        async with DisparoEmMassa(combinar_envios(agentes, [f"n{i}" for i in range(10)], "oi"),
+                                  max_paralelo=4) as disparo:
+            async for resultado in disparo:
+                self.assertTrue(resultado.ok)
+                break
+        self.assertTrue(disparo.cancelado)
+        self.assertTrue(all(t.done() for t in disparo._tarefas))
+        self.assertEqual(sum(len(a.enviadas) for a in agentes), 1)
+        self.assertGreaterEqual(sum(a.canceladas for a in agentes), 3)  # o resto estava no ar
+
+    async def test_break_sem_async_with_cancela_na_finalizacao(self):
+        agentes = [AgenteFalso(f"a{i}", espera=0.05 * i) for i in range(1, 3)]
+        disparo = DisparoEmMassa(combinar_envios(agentes, ["n1", "n2"], "oi"), max_paralelo=2)
+        async for _ in disparo:
+            break
+        await asyncio.wait_for(asyncio.gather(*disparo._tarefas, return_exceptions=True), 1)
+        self.assertTrue(disparo.cancelado)
+        self.assertEqual(sum(len(a.enviadas) for a in agentes), 1)
+
+    async def test_cancelar_durante_o_disparo(self):
+        agente = AgenteFalso("a1", espera=0.02)
+        disparo = DisparoEmMassa(combinar_envios([agente], [f"n{i}" for i in range(50)], "oi"), max_paralelo=2)
+        recebidos = []
+        async for resultado in disparo:
+            recebidos.append(resultado)
+            if len(recebidos) == 2:
+                disparo.cancelar()
+        self.assertLess(len(recebidos), 50)
+        self.assertEqual(disparo.estatisticas()["cancelado"], True)
+
+    async def test_cancelar_antes_de_percorrer_nao_trava(self):
+        disparo = DisparoEmMassa(combinar_envios([AgenteFalso("a1")], ["n1"], "oi"), max_paralelo=2)
+        disparo.iniciar()
+        disparo.cancelar()
+        self.assertEqual(await asyncio.wait_for(disparo.aguardar(), 1), [])
+
+    async def test_so_percorre_uma_vez(self):
+        disparo = DisparoEmMassa(combinar_envios([AgenteFalso("a1")], ["n1"], "oi"))
+        self.assertEqual(len(await disparo.aguardar()), 1)
+        with self.assertRaises(RuntimeError):
+            await asyncio.wait_for(disparo.aguardar(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from utilis import utils
+
+
+class No:
+    def __init__(self, nome):
+        self.nome = nome
+
+
+def mensagem(i):
+    return {"role": "web_1" if i % 2 == 0 else "web_2", "content": f"mensagem {i} ção 😄", "number": "55"}
+
+
+class TestHistoricoJsonl(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.object(utils, "HISTORICO_DIR", self.dir.name)
+        self.patch.start()
+        self.a1, self.a2 = No("web_1"), No("web_2")
+        self.caminho = os.path.join(self.dir.name, "web_1_web_2.jsonl")
+
+    def tearDown(self):
+        self.patch.stop()
+        self.dir.cleanup()
+
+    def anexar(self, n, inicio=0):
+        for i in range(inicio, inicio + n):
+            utils.anexar_historico(self.a1, self.a2, mensagem(i))
+
+    def test_anexa_uma_linha_por_mensagem(self):
+        self.anexar(3)
+        with open(self.caminho, encoding="utf-8") as f:
+            linhas = f.read().splitlines()
+        self.assertEqual([json.loads(linha) for linha in linhas], [mensagem(i) for i in range(3)])
+
+    def test_limites_de_leitura(self):
+        self.anexar(103)
+        casos = [(0, []), (1, [102]), (50, list(range(53, 103))), (103, list(range(103))),
+                 (500, list(range(103))), (None, list(range(103)))]
+        for limite, esperado in casos:
+            with self.subTest(limite=limite):
+                historico = utils.carregar_historico(self.a1, self.a2, limite=limite)
+                self.assertEqual(historico, [mensagem(i) for i in esperado])
+        self.assertEqual(len(utils.carregar_historico(self.a1, self.a2)), utils.HISTORICO_JANELA)
+
+    def test_leitura_do_final_em_blocos_pequenos(self):
+        self.anexar(20)
+        for bloco in (1, 7, 64, 8192):
+            with self.subTest(bloco=bloco):
+                linhas = utils._ler_ultimas_linhas(self.caminho, 3, bloco=bloco)
+                self.assertEqual([json.loads(linha) for linha in linhas], [mensagem(i) for i in (17, 18, 19)])
+        self.assertEqual(utils._ler_ultimas_linhas(self.caminho, -1), [])
+
+    def test_sem_arquivo(self):
+        self.assertEqual(utils.carregar_historico(self.a1, self.a2), [])
+
+    def test_ultima_linha_cortada(self):
+        self.anexar(3)
+        with open(self.caminho, "ab") as f:
+            f.write(b'{"role": "web_2", "content": "corta')  # queda no meio da escrita
+        self.assertEqual(utils.carregar_historico(self.a1, self.a2), [mensagem(i) for i in range(3)])
+        self.assertEqual(utils.carregar_historico(self.a1, self.a2, limite=2), [mensagem(i) for i in (1, 2)])
+
+        # a próxima mensagem começa numa linha nova e não se perde junto com a cortada
+        self.anexar(1, inicio=3)
+        self.assertEqual(utils.carregar_historico(self.a1, self.a2), [mensagem(i) for i in range(4)])
+
+    def test_linha_corrompida_no_meio(self):
+        self.anexar(2)
+        with open(self.caminho, "a", encoding="utf-8") as f:
+            f.write("isso não é json\n\n")
+        self.anexar(2, inicio=2)
+        self.assertEqual(utils.carregar_historico(self.a1, self.a2, limite=None), [mensagem(i) for i in range(4)])
+
+    def test_salvar_regrava_tudo(self):
+        self.anexar(5)
+        utils.salvar_historico(self.a1, self.a2, [mensagem(9)])
+        self.assertEqual(utils.carregar_historico(self.a1, self.a2), [mensagem(9)])
+        self.assertFalse(os.path.exists(self.caminho + ".tmp"))
+
+
+class TestMigracaoJson(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.object(utils, "HISTORICO_DIR", self.dir.name)
+        self.patch.start()
+        self.a1, self.a2 = No("web_1"), No("web_2")
+        self.antigo = os.path.join(self.dir.name, "web_1_web_2.json")
+
+    def tearDown(self):
+        self.patch.stop()
+        self.dir.cleanup()
+
+    def test_migra_json_antigo(self):
+        with open(self.antigo, "w", encoding="utf-8") as f:
+            json.dump([mensagem(i) for i in range(5)], f)
+        self.assertEqual(utils.carregar_historico(self.a1, self.a2, limite=2), [mensagem(3), mensagem(4)])
+        self.assertFalse(os.path.exists(self.antigo))
+        self.assertTrue(os.path.exists(self.antigo + ".migrado"))
+        utils.anexar_historico(self.a1, self.a2, mensagem(5))
+        self.assertEqual(utils.carregar_historico(self.a1, self.a2), [mensagem(i) for i in range(6)])
+
+    def test_jsonl_existente_tem_prioridade(self):
+        utils.anexar_historico(self.a1, self.a2, mensagem(0))
+        with open(self.antigo, "w", encoding="utf-8") as f:
+            json.dump([mensagem(9)], f)
+        self.assertEqual(utils.carregar_historico(self.a1, self.a2), [mensagem(0)])
+        self.assertTrue(os.path.exists(self.antigo))  # não mexe no antigo
+
+    def test_json_antigo_corrompido_fica_onde_esta(self):
+        with open(self.antigo, "w", encoding="utf-8") as f:
+            f.write("[{\"role\": ")
+        self.assertEqual(utils.carregar_historico(self.a1, self.a2), [])
+        self.assertTrue(os.path.exists(self.antigo))
+        self.assertFalse(os.path.exists(self.antigo + ".migrado"))
+
+
+if __name__ == "__main__":
+    unittest.main()
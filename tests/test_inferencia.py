@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from IA import ia
+
+
+class TestServicoInferencia(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.liberar = threading.Event()
+        self.chamadas = []
+
+        def chamar_ollama(mensagens, max_caracteres=ia.LIMITE_CARACTERES):
+            self.chamadas.append(mensagens[-1]["content"])
+            self.liberar.wait(5)
+            return f"resposta {mensagens[-1]['content']}"
+
+        self.patch = mock.patch.object(ia, "_chamar_ollama", chamar_ollama)
+        self.patch.start()
+        self.servico = ia.ServicoInferencia(janela=0.01, max_paralelo=1)
+        self.servico.iniciar()
+
+    async def asyncTearDown(self):
+        self.liberar.set()
+        await self.servico.parar()
+        self.patch.stop()
+
+    async def test_fila_e_gerando_separados(self):
+        pedidos = [asyncio.create_task(self.servico.gerar(f"oi {i}")) for i in range(3)]
+        await asyncio.sleep(0.1)
+        stats = self.servico.estatisticas()
+        self.assertEqual(stats["gerando"], 1)
+        self.assertEqual(stats["fila"], 2)
+        self.assertEqual(self.servico.pendentes(), 3)
+
+        self.liberar.set()
+        respostas = await asyncio.gather(*pedidos)
+        self.assertEqual(respostas, ["resposta oi 0", "resposta oi 1", "resposta oi 2"])
+        stats = self.servico.estatisticas()
+        self.assertEqual((stats["fila"], stats["gerando"]), (0, 0))
+        self.assertEqual(self.servico.pendentes(), 0)
+
+    async def test_prazo_mais_proximo_sai_primeiro(self):
+        loop = asyncio.get_running_loop()
+        agora = loop.time()
+        primeiro = asyncio.create_task(self.servico.gerar("ocupa", prazo=agora))
+        await asyncio.sleep(0.05)
+        tarde = asyncio.create_task(self.servico.gerar("tarde", prazo=agora + 600))
+        cedo = asyncio.create_task(self.servico.gerar("cedo", prazo=agora + 1))
+        await asyncio.sleep(0.05)
+        self.liberar.set()
+        await asyncio.gather(primeiro, tarde, cedo)
+        self.assertEqual(self.chamadas, ["ocupa", "cedo", "tarde"])
+
+    async def test_janela_zero_nao_espera(self):
+        self.servico.janela = 0
+        self.liberar.set()
+        self.assertEqual(await self.servico.gerar("oi"), "resposta oi")
+        self.assertEqual(self.servico.estatisticas()["lotes"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
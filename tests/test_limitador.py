@@ -0,0 +1,156 @@
+import asyncio
+import unittest
+
+from GTI.limitador import BaldeTokens, LimitadorGTI
+from utilis.relogio import RelogioVirtual, definir_relogio
+
+
+class TestBaldeTokens(unittest.TestCase):
+    def test_comeca_cheio_e_repoe_pela_taxa(self):
+        balde = BaldeTokens(2)
+        self.assertEqual(balde.espera(100.0), 0.0)
+        balde.consumir()
+        balde.consumir()
+        self.assertAlmostEqual(balde.espera(100.0), 0.5)
+        self.assertAlmostEqual(balde.espera(100.25), 0.25)
+        self.assertEqual(balde.espera(100.5), 0.0)
+
+    def test_nao_passa_da_capacidade(self):
+        balde = BaldeTokens(2, capacidade=3)
+        balde.espera(0.0)
+        self.assertEqual(balde.espera(1000.0), 0.0)
+        self.assertEqual(balde.tokens, 3)
+        for _ in range(3):
+            balde.consumir()
+        self.assertAlmostEqual(balde.espera(1000.0), 0.5)
+
+    def test_taxa_menor_que_um(self):
+        balde = BaldeTokens(0.5)
+        self.assertEqual(balde.capacidade, 1.0)
+        balde.espera(0.0)
+        balde.consumir()
+        self.assertAlmostEqual(balde.espera(0.0), 2.0)
+
+
+class TestLimitadorVirtual(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.relogio = RelogioVirtual()
+        definir_relogio(self.relogio)
+
+    async def asyncTearDown(self):
+        definir_relogio(None)
+
+    #roda as corrotinas pulando o relógio virtual sempre que todas estão paradas num dormir()
+    async def simular(self, *corrotinas):
+        tarefas = [asyncio.create_task(c) for c in corrotinas]
+        while not all(t.done() for t in tarefas):
+            await asyncio.sleep(0)
+            pendentes = [t for t in tarefas if not t.done()]
+            proximo = self.relogio.proximo()
+            if pendentes and proximo is not None and self.relogio.ociosas(pendentes):
+                self.relogio.avancar_ate(proximo)
+        return [t.result() for t in tarefas]
+
+    async def requisitar(self, limitador, rota, instancia, n):
+        for _ in range(n):
+            await limitador.adquirir(rota, instancia)
+            limitador.liberar(0.01, 200)
+        return self.relogio.agora()
+
+    async def test_balde_por_rota(self):
+        limitador = LimitadorGTI(taxas={"/send/text": 5}, taxa_instancia=1000)
+        inicio = self.relogio.agora()
+        fim, = await self.simular(self.requisitar(limitador, "/send/text", "web_1", 10))
+        # 5 saem na hora (balde cheio), as outras 5 esperam 1s de tokens a 5/s
+        self.assertAlmostEqual(fim - inicio, 1.0, delta=0.05)
+        self.assertAlmostEqual(limitador.stats["espera_tokens"], 1.0, delta=0.05)
+        self.assertGreater(self.relogio.deslocamento, 0.9)  # o tempo foi pulado, não esperado
+
+    async def test_rota_sem_taxa_usa_a_padrao(self):
+        limitador = LimitadorGTI(taxas={}, taxa_padrao=2, taxa_instancia=1000)
+        inicio = self.relogio.agora()
+        fim, = await self.simular(self.requisitar(limitador, "/chat/find", "web_1", 4))
+        self.assertAlmostEqual(fim - inicio, 1.0, delta=0.05)
+        self.assertIn("/chat/find", limitador.baldes)
+
+    async def test_balde_por_instancia(self):
+        limitador = LimitadorGTI(taxas={"/send/text": 1000}, taxa_instancia=2)
+        inicio = self.relogio.agora()
+        fim, = await self.simular(self.requisitar(limitador, "/send/text", "web_1", 4))
+        self.assertAlmostEqual(fim - inicio, 1.0, delta=0.05)
+
+        # instâncias diferentes não esperam umas pelas outras
+        inicio = self.relogio.agora()
+        fins = await self.simular(*(self.requisitar(limitador, "/send/text", f"web_{i}", 2) for i in range(2, 10)))
+        self.assertAlmostEqual(max(fins) - inicio, 0.0, delta=0.05)
+        self.assertEqual(limitador.estatisticas()["instancias"], 9)
+
+    async def test_aumento_aditivo(self):
+        limitador = LimitadorGTI(concorrencia=4, taxa_instancia=1000)
+        await self.simular(self.requisitar(limitador, "/send/text", "web_1", 4))
+        # +1/limite por resposta boa: ~+1 a cada `limite` respostas
+        self.assertGreater(limitador.limite, 4.8)
+        self.assertLess(limitador.limite, 5.0)
+        await self.simular(self.requisitar(limitador, "/send/text", "web_1", 1000))
+        self.assertAlmostEqual(limitador.limite, (4 ** 2 + 2 * 1004) ** 0.5, delta=0.5)
+
+    async def test_aumento_para_no_teto(self):
+        limitador = LimitadorGTI(concorrencia=9, concorrencia_max=10, taxa_instancia=1000,
+                                 taxas={"/send/text": 1000})
+        await self.simular(self.requisitar(limitador, "/send/text", "web_1", 100))
+        self.assertEqual(limitador.limite, 10)
+
+    async def test_reducao_multiplicativa(self):
+        limitador = LimitadorGTI(concorrencia=16, taxa_instancia=1000, intervalo_reducao=1.0)
+        for status, latencia in ((429, 0.1), (503, 0.1), (429, 0.1)):
+            await limitador.adquirir("/send/text", "web_1")
+            limitador.liberar(latencia, status)
+        # a rajada de respostas ruins conta como uma redução só
+        self.assertEqual(limitador.limite, 8)
+        self.assertEqual(limitador.stats["sobrecarga"], 3)
+        self.assertEqual(limitador.stats["reducoes"], 1)
+
+        for status, latencia in ((None, 0.1), (200, 10.0), (200, 0.1)):
+            self.relogio.avancar_ate(self.relogio.agora() + 1.5)
+            await limitador.adquirir("/send/text", "web_1")
+            limitador.liberar(latencia, status)
+        # erro de rede e latência acima do alvo também reduzem; resposta boa sobe 1/limite
+        self.assertAlmostEqual(limitador.limite, 2 + 1 / 2)
+        self.assertEqual(limitador.stats["reducoes"], 3)
+        self.assertEqual(limitador.stats["sobrecarga"], 3)
+
+    async def test_reducao_respeita_o_minimo(self):
+        limitador = LimitadorGTI(concorrencia=4, concorrencia_min=3, taxa_instancia=1000)
+        await limitador.adquirir("/send/text", "web_1")
+        limitador.liberar(0.1, 429)
+        self.assertEqual(limitador.limite, 3)
+
+    async def test_concorrencia_limita_requisicoes_simultaneas(self):
+        limitador = LimitadorGTI(concorrencia=2, taxa_instancia=1000)
+        await limitador.adquirir("/send/text", "web_1")
+        await limitador.adquirir("/send/text", "web_2")
+        terceira = asyncio.create_task(limitador.adquirir("/send/text", "web_3"))
+        quarta = asyncio.create_task(limitador.adquirir("/send/text", "web_4"))
+        await asyncio.sleep(0)
+        self.assertFalse(terceira.done())
+        self.assertEqual(limitador.estatisticas()["esperando"], 2)
+
+        quarta.cancel()  # desistir na fila não gasta vaga
+        await asyncio.sleep(0)
+        limitador.liberar(0.01, 200)
+        await asyncio.wait_for(terceira, 1)
+        self.assertEqual(limitador._em_uso, 2)
+        self.assertEqual(limitador.estatisticas()["esperando"], 0)
+
+    async def test_definir_concorrencia_acorda_quem_espera(self):
+        limitador = LimitadorGTI(concorrencia=1, taxa_instancia=1000)
+        await limitador.adquirir("/send/text", "web_1")
+        esperando = [asyncio.create_task(limitador.adquirir("/send/text", f"web_{i}")) for i in range(2, 5)]
+        await asyncio.sleep(0)
+        limitador.definir_concorrencia(4)
+        await asyncio.wait_for(asyncio.gather(*esperando), 1)
+        self.assertEqual((limitador.limite, limitador._em_uso), (4, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import asyncio
+import json
+import unittest
+
+from utilis.metricas import Registro, servir_metricas
+
+
+class TestMetricas(unittest.IsolatedAsyncioTestCase):
+    def test_json_sem_nan(self):
+        registro = Registro()
+        registro.medidor("quebrado", "Medidor que lança", lambda: 1 / 0)
+        registro.medidor("infinito", "Prazo infinito", lambda: float("inf"))
+        registro.contador("total", "Contador", ("status",)).inc(status="429")
+        dados = json.loads(registro.json())  # NaN/Infinity fariam o parse estrito falhar abaixo
+        self.assertIsNone(dados["quebrado"])
+        self.assertIsNone(dados["infinito"])
+        self.assertEqual(dados["total"], {"429": 1})
+        json.loads(registro.json(), parse_constant=lambda c: self.fail(f"constante {c} no JSON"))
+
+    def test_prometheus_tipos(self):
+        registro = Registro()
+        registro.contador("gti_sobrecarga_total", "429/503", ("status",)).inc(status="503")
+        texto = registro.texto_prometheus()
+        self.assertIn("# TYPE gti_sobrecarga_total counter", texto)
+        self.assertIn('gti_sobrecarga_total{status="503"} 1', texto)
+
+    async def test_porta_ocupada_nao_derruba(self):
+        ocupada = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+        porta = ocupada.sockets[0].getsockname()[1]
+        try:
+            self.assertIsNone(await servir_metricas("127.0.0.1", porta))
+        finally:
+            ocupada.close()
+            await ocupada.wait_closed()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+import asyncio
+import unittest
+
+from utilis.pareamento import MotorPareamento
+from utilis.relogio import RelogioVirtual, definir_relogio
+
+
+class Agente:
+    def __init__(self, nome):
+        self.nome = nome
+        self.conectado = True
+
+    def __repr__(self):
+        return self.nome
+
+
+class ConversaFalsa:
+    def __init__(self, a1, a2):
+        self.agente1 = a1
+        self.agente2 = a2
+
+
+class BaseMotor:
+    def criar(self, n, **kwargs):
+        self.agentes = [Agente(f"w{i}") for i in range(n)]
+        self.conversas = []
+        self.paradas = []
+
+        def iniciar(a1, a2):
+            conversa = ConversaFalsa(a1, a2)
+            self.conversas.append(conversa)
+            return conversa
+
+        self.motor = MotorPareamento(iniciar, self.paradas.append, **kwargs)
+        return self.motor
+
+    def pares(self, conversas=None):
+        return [(c.agente1.nome, c.agente2.nome) for c in (self.conversas if conversas is None else conversas)]
+
+    def ativas(self):
+        return [c for c in self.conversas if self.motor.ocupados.get(c.agente1) is c]
+
+
+class TestRodizio(BaseMotor, unittest.IsolatedAsyncioTestCase):
+    async def asyncTearDown(self):
+        self.motor.encerrar()
+
+    async def test_carga_inicial_em_ordem(self):
+        motor = self.criar(6)
+        for ag in self.agentes:
+            motor.conectar(ag)
+        self.assertEqual(self.pares(), [("w0", "w1"), ("w2", "w3"), ("w4", "w5")])
+        self.assertEqual(motor.livres, {})
+
+    async def test_frota_ocupada_troca_de_parceiro(self):
+        motor = self.criar(6, recentes=2)
+        for ag in self.agentes:
+            motor.conectar(ag)
+        # termina sempre a conversa mais antiga, com todo o resto ocupado
+        for _ in range(12):
+            motor.liberar(self.ativas()[0])
+        self.assertEqual(motor.stats["repeticoes"], 0)
+        vistos = {frozenset(par) for par in self.pares()}
+        self.assertGreater(len(vistos), 6)
+        # ninguém pareou com um dos dois últimos parceiros
+        ultimos = {}
+        for a, b in self.pares():
+            for x, y in ((a, b), (b, a)):
+                self.assertNotIn(y, ultimos.get(x, [])[-2:])
+                ultimos.setdefault(x, []).append(y)
+
+    async def test_liberar_enfileira_os_dois_antes_de_parear(self):
+        motor = self.criar(4, recentes=2)
+        for ag in self.agentes:
+            motor.conectar(ag)
+        primeira, segunda = self.conversas
+        motor.liberar(primeira)
+        # só o antigo parceiro livre: esperam em vez de repetir
+        self.assertEqual(list(motor.livres), self.agentes[:2])
+        self.assertEqual(len(self.conversas), 2)
+        motor.liberar(segunda)
+        self.assertEqual(self.pares()[2:], [("w0", "w2"), ("w1", "w3")])
+        self.assertEqual(motor.stats["repeticoes"], 0)
+
+    async def test_liberar_sem_reentrar_e_limite_de_conversas(self):
+        motor = self.criar(4, max_conversas=1)
+        for ag in self.agentes:
+            motor.conectar(ag)
+        motor.liberar(self.conversas[0], reentrar=False)
+        motor.liberar(self.conversas[1])
+        self.assertEqual(motor.livres, {})
+        self.assertEqual(motor.ocupados, {})
+        self.assertIsNone(motor.conectar(self.agentes[0]))
+
+    async def test_desconectar(self):
+        motor = self.criar(5)
+        for ag in self.agentes:
+            motor.conectar(ag)
+        self.assertEqual(list(motor.livres), [self.agentes[4]])
+        motor.desconectar(self.agentes[4])
+        self.assertEqual(motor.livres, {})
+
+        w0, w1 = self.agentes[:2]
+        w0.conectado = False
+        motor.desconectar(w0)
+        self.assertEqual(self.paradas, [self.conversas[0]])
+        self.assertEqual(motor.stats["interrompidas"], 1)
+        motor.liberar(self.conversas[0])  # a conversa parada termina
+        self.assertEqual(list(motor.livres), [w1])  # só quem continua conectado volta
+
+    async def test_remover_nao_volta(self):
+        motor = self.criar(4)
+        for ag in self.agentes:
+            motor.conectar(ag)
+        motor.remover(self.agentes[0])
+        motor.liberar(self.conversas[0])
+        self.assertNotIn(self.agentes[0], motor.livres)
+        self.assertNotIn(self.agentes[0], motor.parceiros)
+
+    async def test_retomar(self):
+        motor = self.criar(4)
+        w0, w1, w2, w3 = self.agentes
+        motor.conectar(w0)
+        self.assertIsNotNone(motor.retomar(w0, w3))
+        self.assertEqual(self.pares(), [("w0", "w3")])
+        self.assertEqual(motor.livres, {})
+        self.assertIsNone(motor.retomar(w3, w1))  # w3 já está conversando
+        w2.conectado = False
+        self.assertIsNone(motor.retomar(w1, w2))
+        self.assertEqual(motor.parceiros[w0][-1], w3)
+
+    async def test_suspender_e_reativar(self):
+        motor = self.criar(4)
+        motor.suspender()
+        for ag in self.agentes:
+            motor.conectar(ag)
+        self.assertEqual(self.conversas, [])
+        self.assertEqual(len(motor.livres), 4)
+        motor.reativar()
+        self.assertEqual(self.pares(), [("w0", "w1"), ("w2", "w3")])
+        self.assertEqual(motor.livres, {})
+
+
+class TestEsperaRepeticao(BaseMotor, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.relogio = RelogioVirtual()
+        definir_relogio(self.relogio)
+
+    async def asyncTearDown(self):
+        self.motor.encerrar()
+        definir_relogio(None)
+
+    async def rodar(self):
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    async def test_repete_depois_da_espera(self):
+        motor = self.criar(2, espera_repeticao=30.0)
+        for ag in self.agentes:
+            motor.conectar(ag)
+        motor.liberar(self.conversas[0])
+        await self.rodar()
+        self.assertEqual(len(self.conversas), 1)
+        self.assertEqual(len(motor._esperas), 2)
+
+        self.relogio.avancar_ate(self.relogio.agora() + 29)
+        await self.rodar()
+        self.assertEqual(len(self.conversas), 1)
+
+        self.relogio.avancar_ate(self.relogio.agora() + 2)
+        await self.rodar()
+        self.assertEqual(len(self.conversas), 2)
+        self.assertEqual(set(self.pares()[1]), {"w0", "w1"})
+        self.assertEqual(motor.stats["repeticoes"], 1)
+        self.assertEqual(motor._esperas, {})
+
+    async def test_parceiro_novo_antes_da_espera(self):
+        motor = self.criar(4, espera_repeticao=30.0)
+        for ag in self.agentes:
+            motor.conectar(ag)
+        motor.liberar(self.conversas[0])
+        self.relogio.avancar_ate(self.relogio.agora() + 10)
+        motor.liberar(self.conversas[1])
+        await self.rodar()
+        self.assertEqual(self.pares()[2:], [("w0", "w2"), ("w1", "w3")])
+        self.relogio.avancar_ate(self.relogio.agora() + 60)
+        await self.rodar()
+        self.assertEqual(len(self.conversas), 4)  # a espera vencida não cria par extra
+        self.assertEqual(motor.stats["repeticoes"], 0)
+
+    async def test_sem_espera_repete_na_hora(self):
+        motor = self.criar(2, espera_repeticao=0)
+        for ag in self.agentes:
+            motor.conectar(ag)
+        motor.liberar(self.conversas[0])
+        self.assertEqual(len(self.conversas), 2)
+        self.assertEqual(motor.stats["repeticoes"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
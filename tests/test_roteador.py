@@ -0,0 +1,145 @@
+import asyncio
+import time
+import unittest
+
+from IA.ia import PoolEDF
+from IA.roteador import ABERTO, FECHADO, MEIO_ABERTO, BackendIA, RoteadorIA, SemBackendDisponivel
+
+
+#backend local de teste: responde com o nome, pode falhar sob demanda e conta as chamadas
+class Stub:
+    def __init__(self, nome, atraso=0.0):
+        self.nome = nome
+        self.atraso = atraso
+        self.falhar = False
+        self.chamadas = 0
+
+    async def __call__(self, user_message, historico=None, prompt_extra="", prazo=None):
+        self.chamadas += 1
+        await asyncio.sleep(self.atraso)
+        if self.falhar:
+            raise ConnectionError(f"{self.nome} fora")
+        return self.nome
+
+
+def _assincrono(stub):
+    async def gerar(user_message, historico=None, prompt_extra="", prazo=None):
+        return await stub(user_message, historico, prompt_extra, prazo)
+    return gerar
+
+
+class TestRoteador(unittest.IsolatedAsyncioTestCase):
+    def montar(self, tempo_aberto=60.0):
+        self.principal, self.reserva = Stub("principal"), Stub("reserva")
+        self.roteador = RoteadorIA([
+            BackendIA("principal", _assincrono(self.principal), limite_falhas=2, tempo_aberto=tempo_aberto),
+            BackendIA("reserva", _assincrono(self.reserva), limite_falhas=2, tempo_aberto=tempo_aberto),
+        ])
+
+    async def test_principal_primeiro(self):
+        self.montar()
+        for _ in range(5):
+            self.assertEqual(await self.roteador.gerar("oi"), "principal")
+        self.assertEqual(self.reserva.chamadas, 0)
+
+    async def test_failover_quando_principal_falha(self):
+        self.montar()
+        self.principal.falhar = True
+        self.assertEqual(await self.roteador.gerar("oi"), "reserva")
+        self.assertEqual((self.principal.chamadas, self.reserva.chamadas), (1, 1))
+
+    async def test_disjuntor_abre_e_fecha(self):
+        self.montar(tempo_aberto=0.1)
+        self.principal.falhar = self.reserva.falhar = True
+        for _ in range(2):
+            with self.assertRaises(SemBackendDisponivel):
+                await self.roteador.gerar("oi")
+        loop = asyncio.get_running_loop()
+        self.assertEqual(self.roteador.backend("principal").estado(loop.time()), ABERTO)
+
+        # aberto: nem é tentado
+        with self.assertRaises(SemBackendDisponivel):
+            await self.roteador.gerar("oi")
+        self.assertEqual(self.principal.chamadas, 2)
+
+        # passado o tempo, uma chamada de teste; sucesso fecha o disjuntor
+        await asyncio.sleep(0.15)
+        self.assertEqual(self.roteador.backend("principal").estado(loop.time()), MEIO_ABERTO)
+        self.principal.falhar = False
+        self.assertEqual(await self.roteador.gerar("oi"), "principal")
+        self.assertEqual(self.roteador.backend("principal").estado(loop.time()), FECHADO)
+
+    async def test_todos_fora(self):
+        self.montar()
+        self.principal.falhar = self.reserva.falhar = True
+        with self.assertRaises(SemBackendDisponivel):
+            await self.roteador.gerar("oi")
+
+    async def test_reserva_sem_medida_nao_ganha_do_principal(self):
+        self.montar()
+        self.principal.atraso = 0.02
+        for _ in range(3):
+            await self.roteador.gerar("oi")
+        # reserva nunca chamada não pontua 0 e não rouba o tráfego
+        self.assertEqual(self.reserva.chamadas, 0)
+
+    async def test_principal_lento_perde_para_reserva_medida(self):
+        self.montar()
+        for _ in range(3):
+            self.roteador.backend("principal").registrar_sucesso(0.5)
+        self.roteador.backend("reserva").registrar_sucesso(0.05)
+        self.assertEqual(await self.roteador.gerar("oi"), "reserva")
+
+    async def test_latencia_sem_espera_na_fila(self):
+        pool = PoolEDF(max_workers=1)
+        chamadas = []
+
+        def lento(user_message, historico=None, prompt_extra=""):
+            chamadas.append(user_message)
+            time.sleep(0.2 if user_message == "ocupa" else 0.01)
+            return user_message
+
+        roteador = RoteadorIA([BackendIA("sync", lento)], pool=pool)
+        ocupa = asyncio.create_task(roteador.gerar("ocupa"))
+        await asyncio.sleep(0.02)
+        await roteador.gerar("rapida")  # esperou ~0.2s pela thread, executou em ~0.01s
+        await ocupa
+        latencias = list(roteador.backend("sync").latencias)
+        self.assertLess(latencias[1], 0.1)
+        pool.executor.shutdown()
+
+    async def test_sem_prazo_com_pool_ocupado(self):
+        pool = PoolEDF(max_workers=1)
+        loop = asyncio.get_running_loop()
+        ordem = []
+
+        def trabalho(nome, espera=0.0):
+            time.sleep(espera)
+            ordem.append(nome)
+            return nome
+
+        roteador = RoteadorIA([BackendIA("sync", lambda m, h=None, p="": trabalho(m))], pool=pool)
+        ocupa = asyncio.create_task(pool.executar(loop.time(), trabalho, "ocupa", 0.1))
+        depois = asyncio.create_task(pool.executar(loop.time() + 600, trabalho, "depois"))
+        await asyncio.sleep(0.01)
+        self.assertEqual(pool.pendentes(), 1)
+
+        self.assertEqual(await roteador.gerar("agora"), "agora")
+        await asyncio.gather(ocupa, depois)
+        self.assertEqual(ordem, ["ocupa", "agora", "depois"])  # sem prazo passa na frente
+        self.assertEqual(roteador.backend("sync").falhas_seguidas, 0)
+        pool.executor.shutdown()
+
+    async def test_backend_assincrono_informa_execucao(self):
+        async def com_fila(user_message, historico=None, prompt_extra="", prazo=None, execucao=None):
+            await asyncio.sleep(0.2)  # fila
+            execucao.append(0.01)
+            return "ok"
+
+        roteador = RoteadorIA([BackendIA("fila", com_fila)])
+        self.assertEqual(await roteador.gerar("oi"), "ok")
+        self.assertEqual(list(roteador.backend("fila").latencias), [0.01])
+
+
+if __name__ == "__main__":
+    unittest.main()
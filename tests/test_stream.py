@@ -0,0 +1,103 @@
+import unittest
+
+from IA import ia
+
+
+class StreamFalso:
+    #pedaços como o ollama manda; conta quantos foram lidos e se a conexão foi fechada
+    def __init__(self, pedacos, erro=None):
+        self.pedacos = pedacos
+        self.erro = erro
+        self.lidos = 0
+        self.fechado = False
+
+    def __iter__(self):
+        for pedaco in self.pedacos:
+            self.lidos += 1
+            yield {"message": {"content": pedaco}}
+        if self.erro:
+            raise self.erro
+
+    def close(self):
+        self.fechado = True
+
+
+def conteudo(pedaco):
+    return pedaco["message"]["content"]
+
+
+class TestPontoDeCorte(unittest.TestCase):
+    def test_regras_de_corte(self):
+        vinte_e_cinco = " ".join(f"p{i}" for i in range(1, 26))
+        longas = " ".join(["abcdefghi"] * 15)
+        casos = [
+            # (texto, limite de caracteres, resposta cortada)
+            ("oi tudo bem", 120, "oi tudo bem"),
+            ("Opa, tudo certo por aqui! E você, como vai?", 120, "Opa, tudo certo por aqui!"),
+            ("Oi! Tudo certo por aqui, e contigo como tá?", 120, "Oi! Tudo certo por aqui, e contigo como tá?"),
+            ("Tudo certo por aqui, mano! 😄 E aí?", 120, "Tudo certo por aqui, mano! 😄"),
+            ("Sério mesmo que você foi lá... Conta tudo", 120, "Sério mesmo que você foi lá..."),
+            ("Fala mano\nsegunda linha", 120, "Fala mano"),
+            ("\n\nFala mano", 120, "Fala mano"),
+            (vinte_e_cinco, 120, " ".join(f"p{i}" for i in range(1, 21))),
+            ("x" * 150, 120, "x" * 120),
+            (longas, 120, " ".join(["abcdefghi"] * 12)),
+            (longas, 40, " ".join(["abcdefghi"] * 4)),
+            ("", 120, ""),
+            (None, 120, ""),
+        ]
+        for texto, limite, esperado in casos:
+            with self.subTest(texto=texto, limite=limite):
+                self.assertEqual(ia._cortar_resposta(texto, limite), esperado)
+
+    def test_cabe_inteiro_nao_tem_corte(self):
+        for texto in ("oi", "Oi! Tudo bem?", "tudo certo por aqui mano", "\nFala"):
+            with self.subTest(texto=texto):
+                self.assertIsNone(ia._ponto_de_corte(texto))
+
+    def test_limite_pedido_no_prompt(self):
+        casos = [("Responda curto (<=80 caracteres)", 80), ("<= 45 caracteres", 45), ("", ia.LIMITE_CARACTERES),
+                 (None, ia.LIMITE_CARACTERES), ("sem limite", ia.LIMITE_CARACTERES)]
+        for prompt, esperado in casos:
+            with self.subTest(prompt=prompt):
+                self.assertEqual(ia._limite_caracteres(prompt), esperado)
+
+
+class TestLerStream(unittest.TestCase):
+    def test_para_de_ler_no_fim_da_frase(self):
+        stream = StreamFalso(["Opa, tudo", " certo por", " aqui! E", " você, como", " vai?"] + ["x"] * 50)
+        self.assertEqual(ia._ler_stream(stream, conteudo), "Opa, tudo certo por aqui!")
+        self.assertEqual(stream.lidos, 3)  # o resto nem é pedido ao servidor
+        self.assertTrue(stream.fechado)
+
+    def test_para_no_limite_de_caracteres(self):
+        stream = StreamFalso(["abcdefghi "] * 40)
+        self.assertEqual(ia._ler_stream(stream, conteudo, 40), " ".join(["abcdefghi"] * 4))
+        self.assertEqual(stream.lidos, 5)
+
+    def test_stream_acaba_antes_do_corte(self):
+        casos = [
+            (["  Fala", " mano"], "Fala mano"),
+            (["Oi! ", "Tudo bem?"], "Oi! Tudo bem?"),
+            (["", None, "beleza"], "beleza"),
+            ([], ""),
+        ]
+        for pedacos, esperado in casos:
+            with self.subTest(pedacos=pedacos):
+                stream = StreamFalso(pedacos)
+                self.assertEqual(ia._ler_stream(stream, lambda p: p["message"]["content"]), esperado)
+                self.assertEqual(stream.lidos, len(pedacos))
+                self.assertTrue(stream.fechado)
+
+    def test_erro_no_meio_fecha_o_stream(self):
+        stream = StreamFalso(["Fala"], erro=ConnectionError("caiu"))
+        with self.assertRaises(ConnectionError):
+            ia._ler_stream(stream, conteudo)
+        self.assertTrue(stream.fechado)
+
+    def test_stream_sem_close(self):
+        self.assertEqual(ia._ler_stream(iter([{"message": {"content": "Oi"}}]), conteudo), "Oi")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,247 @@
+import asyncio
+import tempfile
+import unittest
+from collections import Counter
+from unittest import mock
+
+from utilis import utils
+from utilis.supervisor import AnelConsistente, Supervisor
+
+
+class No:
+    def __init__(self, nome):
+        self.nome = nome
+
+
+def checkpoint(a, b):
+    utils.salvar_checkpoint(No(a), No(b), {"agente1": a, "agente2": b, "turno": 1})
+
+
+#trabalhador de verdade (processo spawn): confirma as saídas, responde comandos e sai no "parar"
+def trabalhador_eco(indice, linhas, conexao, opcoes):
+    tem = dict(linhas)
+    while True:
+        tipo, *dados = conexao.recv()
+        if tipo == "parar":
+            return
+        if tipo == "adicionar":
+            tem.update(dados[0])
+        elif tipo == "remover":
+            id_, nomes = dados
+            for nome in nomes:
+                tem.pop(nome, None)
+            conexao.send(("resposta", id_, 200, {"removidos": len(nomes)}))
+        elif tipo == "comando":
+            conexao.send(("resposta", dados[0], 200, {"indice": indice, "instancias": sorted(tem)}))
+
+
+class ProcessoFalso:
+    pid = 0
+    exitcode = -9
+
+    def join(self, timeout=None):
+        pass
+
+
+class ConexaoFalsa:
+    def close(self):
+        pass
+
+
+#supervisor sem processos: registra o que seria mandado e cada trabalhador confirma as saídas
+class SupervisorFalso(Supervisor):
+    def __init__(self, rotas, trabalhadores=3, **kwargs):
+        super().__init__(None, trabalhadores, reinicio=None, **kwargs)
+        self.rotas = dict(rotas)
+        self.log = []
+        self.confirmar = True
+        self._eventos = asyncio.Queue()
+        self._trava = asyncio.Lock()
+        for indice in range(self.trabalhadores):
+            self.anel.adicionar(indice)
+
+    def _iniciar(self, indice, linhas):
+        self.log.append(("iniciar", indice, sorted(linhas)))
+        self.processos[indice] = (ProcessoFalso(), ConexaoFalsa())
+        self.atribuicao[indice] = dict(linhas)
+
+    def _enviar(self, indice, tipo, *dados):
+        if tipo == "remover":
+            id_, nomes = dados
+            self.log.append(("remover", indice, sorted(nomes)))
+            if self.confirmar:
+                loop = asyncio.get_running_loop()
+                loop.call_soon(self._confirmar, indice, id_, nomes)
+        elif tipo == "adicionar":
+            self.log.append(("adicionar", indice, sorted(tel for tel, _ in dados[0])))
+
+    def _confirmar(self, indice, id_, nomes):
+        self.log.append(("confirmou", indice, sorted(nomes)))
+        self._tratar(indice, ("resposta", id_, 200, {"removidos": len(nomes)}))
+
+
+def rotas(n):
+    return {f"web_{i}": f"s{i}" for i in range(1, n + 1)}
+
+
+class TestAnelConsistente(unittest.TestCase):
+    def test_divisao_equilibrada(self):
+        anel = AnelConsistente()
+        for no in range(4):
+            anel.adicionar(no)
+        contagem = Counter(anel.no(f"web_{i}") for i in range(4000))
+        self.assertEqual(set(contagem), {0, 1, 2, 3})
+        for quantos in contagem.values():
+            self.assertLess(abs(quantos - 1000), 250)
+
+    def test_so_um_pedaco_muda_de_no(self):
+        anel = AnelConsistente()
+        for no in range(4):
+            anel.adicionar(no)
+        antes = {i: anel.no(i) for i in range(4000)}
+        anel.adicionar(4)
+        movidos = [i for i in antes if anel.no(i) != antes[i]]
+        self.assertTrue(all(anel.no(i) == 4 for i in movidos))  # só vão para o nó novo
+        self.assertLess(len(movidos), 4000 * 0.3)
+        anel.remover(4)
+        self.assertEqual({i: anel.no(i) for i in antes}, antes)
+        self.assertEqual(anel.nos(), {0, 1, 2, 3})
+
+
+class TestSupervisorDistribuicao(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.object(utils, "HISTORICO_DIR", self.dir.name)
+        self.patch.start()
+
+    async def asyncTearDown(self):
+        self.patch.stop()
+        self.dir.cleanup()
+
+    def assertParesJuntos(self, sup):
+        membros = Counter(sup.grupos.values())
+        self.assertTrue(all(n <= 2 for n in membros.values()))
+        self.assertLessEqual(sum(1 for n in membros.values() if n == 1), len(sup.rotas) % 2)
+        for indice, linhas in sup.atribuicao.items():
+            self.assertEqual(len(linhas) % 2, 0, f"trabalhador {indice} com número ímpar de agentes")
+
+    async def test_par_do_checkpoint_fica_junto(self):
+        checkpoint("web_3", "web_8")
+        sup = SupervisorFalso(rotas(20))
+        await sup._distribuir()
+        self.assertEqual(sup.grupos["web_3"], sup.grupos["web_8"])
+        self.assertEqual(sup._dono_instancia("web_3"), sup._dono_instancia("web_8"))
+        self.assertEqual(sup.grupos["web_1"], sup.grupos["web_2"])
+        self.assertEqual(sup.grupos["web_4"], sup.grupos["web_5"])  # o resto pareia em sequência
+        self.assertParesJuntos(sup)
+        self.assertEqual([e[0] for e in sup.log], ["iniciar"] * 3)
+        self.assertEqual(sorted(tel for linhas in sup.atribuicao.values() for tel in linhas), sorted(rotas(20)))
+
+    async def test_sozinho_pareia_com_o_proximo_novo(self):
+        sup = SupervisorFalso(rotas(10))
+        await sup._distribuir()
+        parceiro = next(tel for tel, chave in sup.grupos.items() if chave == sup.grupos["web_1"] and tel != "web_1")
+        del sup.rotas[parceiro]
+        sup.rotas["web_11"] = "s11"
+        await sup._distribuir()
+        self.assertEqual(sup.grupos["web_1"], sup.grupos["web_11"])
+        self.assertParesJuntos(sup)
+
+    async def test_apaga_checkpoint_que_nao_pode_ser_retomado(self):
+        sup = SupervisorFalso(rotas(20))
+        await sup._distribuir()
+        outro = next(tel for tel in sup.rotas if sup._dono_instancia(tel) != sup._dono_instancia("web_1"))
+        checkpoint("web_1", "web_2")  # mesmo grupo: fica
+        checkpoint("web_1", outro)  # processos diferentes: nunca volta
+        checkpoint("web_3", "web_99")  # fora da ROTA
+        sup._limpar_checkpoints()
+        self.assertEqual([(e["agente1"], e["agente2"]) for e in utils.listar_checkpoints()], [("web_1", "web_2")])
+        self.assertEqual(sup.stats["checkpoints_apagados"], 2)
+
+    async def test_reinicio_tira_dos_sobreviventes_antes_de_iniciar(self):
+        sup = SupervisorFalso(rotas(30))
+        await sup._distribuir()
+        original = dict(sup.atribuicao[1])
+
+        sup._morreu(1)
+        await asyncio.gather(*sup._tarefas)
+        self.assertNotIn(1, sup.processos)
+        self.assertEqual(sorted(tel for linhas in sup.atribuicao.values() for tel in linhas), sorted(sup.rotas))
+        self.assertParesJuntos(sup)
+
+        sup.log.clear()
+        await sup._reiniciar(1)
+        inicio = sup.log.index(("iniciar", 1, sorted(original)))
+        removidos = [tel for tipo, _, nomes in sup.log if tipo == "remover" for tel in nomes]
+        confirmados = [tel for tipo, _, nomes in sup.log[:inicio] if tipo == "confirmou" for tel in nomes]
+        self.assertEqual(sorted(removidos), sorted(original))
+        self.assertEqual(sorted(confirmados), sorted(original))  # todas as saídas confirmadas antes
+        self.assertEqual(sup.atribuicao[1], original)  # o anel devolve exatamente o que era dele
+        donos = Counter(tel for linhas in sup.atribuicao.values() for tel in linhas)
+        self.assertTrue(all(n == 1 for n in donos.values()))
+
+    async def test_sem_confirmacao_segue_depois_da_espera(self):
+        sup = SupervisorFalso(rotas(30), espera_remocao=0.05)
+        await sup._distribuir()
+        sup.confirmar = False
+        sup.anel.adicionar(3)
+        await asyncio.wait_for(sup._distribuir(), 1)
+        self.assertIn(3, sup.processos)
+        self.assertEqual(sup._respostas, {})  # o pedido vencido não fica pendurado
+
+    async def test_morte_resolve_pedidos_pendentes(self):
+        sup = SupervisorFalso(rotas(10))
+        await sup._distribuir()
+        futuro = sup._pedir(0, "comando", "POST", "/pausar", {})
+        sup._morreu(0)
+        self.assertEqual(await futuro, (503, {"erro": "trabalhador parou"}))
+        await asyncio.gather(*sup._tarefas)
+
+
+class TestSupervisorProcessos(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.object(utils, "HISTORICO_DIR", self.dir.name)
+        self.patch.start()
+
+    async def asyncTearDown(self):
+        self.patch.stop()
+        self.dir.cleanup()
+
+    async def test_protocolo_com_trabalhadores_reais(self):
+        async def ler_rotas():
+            return rotas(12)
+
+        sup = Supervisor(trabalhador_eco, trabalhadores=2, rotas=ler_rotas, reinicio=0.2, recarga=0)
+        execucao = asyncio.create_task(sup.executar(controle=False))
+        try:
+            for _ in range(100):
+                if len(sup.processos) == 2:
+                    break
+                await asyncio.sleep(0.05)
+
+            respostas = await sup.repassar("POST", "/pausar", {}, espera=10)
+            self.assertEqual(sorted(respostas), [0, 1])
+            for indice, resposta in respostas.items():
+                self.assertEqual(resposta["status"], 200)
+                self.assertEqual(resposta["instancias"], sorted(sup.atribuicao[indice]))
+
+            # derruba um: as instâncias dele vão para o outro e ele volta com as mesmas
+            antes = sorted(sup.atribuicao[0])
+            sup.processos[0][0].kill()
+            for _ in range(200):
+                if sup.stats["reinicios"] and 0 in sup.processos and not sup._tarefas:
+                    break
+                await asyncio.sleep(0.05)
+            self.assertEqual(sup.stats["mortes"], 1)
+            respostas = await sup.repassar("POST", "/pausar", {}, espera=10)
+            self.assertEqual(respostas[0]["instancias"], antes)
+            self.assertEqual(sorted(respostas[0]["instancias"] + respostas[1]["instancias"]), sorted(rotas(12)))
+        finally:
+            sup._parada.set()
+            await asyncio.wait_for(execucao, 30)
+        self.assertEqual(sup.processos, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
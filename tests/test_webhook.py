@@ -0,0 +1,78 @@
+import json
+import unittest
+
+import httpx
+
+from GTI.webhook import ReceptorWebhook
+
+
+class AgenteFalso:
+    def __init__(self, nome, token, conectado=False):
+        self.nome = nome
+        self.token = token
+        self.conectado = conectado
+        self.numero = None
+
+
+def evento(status, **extra):
+    return json.dumps({"instance": {"status": status}, **extra}).encode()
+
+
+class TestReceptorWebhook(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.a1 = AgenteFalso("ag_1", "t1")
+        self.a2 = AgenteFalso("ag_2", "t2")
+        self.receptor = ReceptorWebhook([self.a1, self.a2], host="127.0.0.1", porta=0, segredo="s3gr3d0")
+        self.conectados = []
+        self.receptor.ao_conectar.append(self.conectados.append)
+
+    def test_token_da_instancia_autentica(self):
+        self.assertTrue(self.receptor.processar("/webhook/ag_1/connection", evento("connected", token="t1")))
+        self.assertTrue(self.a1.conectado)
+        self.assertEqual(self.conectados, [self.a1])
+
+    def test_so_o_nome_nao_autentica(self):
+        self.assertFalse(self.receptor.processar("/webhook/ag_1/connection", evento("connected")))
+        corpo = json.dumps({"EventType": "connection", "instance": {"name": "ag_1", "status": "connected"}})
+        self.assertFalse(self.receptor.processar("/webhook", corpo.encode()))
+        self.assertFalse(self.a1.conectado)
+        self.assertEqual(self.receptor.stats["recusados"], 2)
+
+    def test_token_de_outra_instancia_e_recusado(self):
+        self.assertFalse(self.receptor.processar("/webhook/ag_1/connection", evento("connected", token="t2")))
+        self.assertFalse(self.a1.conectado)
+        self.assertFalse(self.a2.conectado)
+
+    def test_segredo_no_header_autentica_pelo_nome(self):
+        headers = {"x-webhook-segredo": "s3gr3d0"}
+        self.assertTrue(self.receptor.processar("/webhook/ag_2/connection", evento("connected"), headers))
+        self.assertTrue(self.a2.conectado)
+        self.assertFalse(self.receptor.processar("/webhook/ag_2/connection", evento("disconnected"),
+                                                 {"x-webhook-segredo": "errado"}))
+        self.assertTrue(self.a2.conectado)
+
+    def test_sem_segredo_configurado_header_nao_vale(self):
+        receptor = ReceptorWebhook([self.a1], porta=0, segredo="")
+        self.assertFalse(receptor.processar("/webhook/ag_1/connection", evento("connected"),
+                                            {"x-webhook-segredo": ""}))
+        self.assertFalse(self.a1.conectado)
+
+    async def test_http_responde_401_sem_autenticacao(self):
+        await self.receptor.iniciar()
+        try:
+            base = f"http://127.0.0.1:{self.receptor.porta}"
+            async with httpx.AsyncClient() as cliente:
+                r = await cliente.post(f"{base}/webhook/ag_1/connection", json={"instance": {"status": "connected"}})
+                self.assertEqual(r.status_code, 401)
+                self.assertFalse(self.a1.conectado)
+                r = await cliente.post(f"{base}/webhook/ag_1/connection",
+                                       json={"token": "t1", "instance": {"status": "connected", "owner": "5511"}})
+                self.assertEqual(r.status_code, 200)
+            self.assertTrue(self.a1.conectado)
+            self.assertEqual(self.a1.numero, "5511")
+        finally:
+            await self.receptor.parar()
+
+
+if __name__ == "__main__":
+    unittest.main()
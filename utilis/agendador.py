@@ -0,0 +1,169 @@
+import asyncio
+import heapq
+import itertools
+
+from utilis.metricas import metricas
+from utilis.relogio import relogio_atual
+
+M_ATRASO = metricas.histograma("agendador_atraso_segundos", "Atraso entre o horário marcado e o início do passo",
+                               buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30))
+M_PASSO = metricas.histograma("agendador_passo_segundos", "Duração de cada passo de conversa (geração pendente + envio)")
+
+# ===========================
+# Agendador central de conversas
+# ===========================
+# em vez de uma corrotina dormindo por conversa, cada conversa é uma máquina de estados
+# com um método `passo()` que faz o trabalho do momento (gerar/enviar) e devolve em quantos
+# segundos quer rodar de novo (ou None quando terminou). Os eventos "próximo envio em T"
+# ficam num heap e um único laço acorda só quando o primeiro vence.
+# O semáforo limita apenas trabalho real (envio), nunca a espera; a geração é limitada
+# pelo pool EDF do IA.ia.
+# Com um relógio virtual (simulação), quando nenhum passo nem geração pendente está rodando
+# (todos parados num dormir() do relógio, ou nenhum) o laço pula o tempo direto para o
+# próximo evento em vez de esperar.
+class Agendador:
+    def __init__(self, max_envio=20, relogio=None):
+        self.sem_envio = asyncio.Semaphore(max_envio)
+        self.max_envio = max_envio
+        self.ativas = set()
+        self.relogio = relogio or relogio_atual()
+
+        self._fila = []  # heap de (quando, seq, conversa)
+        self._pausadas = {}  # conversa pausada -> horário em que deveria ter rodado
+        self._seq = itertools.count()
+        self._acordar = asyncio.Event()
+        self._tarefas = set()
+        self._geracoes = set()  # gerações pendentes das conversas, rodando entre um passo e outro
+        self._rodando = False
+        if self.relogio.virtual:
+            self.relogio.ouvintes.append(self._acordar.set)
+
+    def agora(self):
+        return self.relogio.agora()
+
+    def adicionar(self, conversa, atraso=0.0):
+        conversa.agendador = self
+        self.ativas.add(conversa)
+        self.agendar(conversa, atraso)
+
+    def agendar(self, conversa, atraso):
+        quando = self.agora() + atraso
+        heapq.heappush(self._fila, (quando, next(self._seq), conversa))
+        # só precisa acordar o laço se o novo evento passou a ser o primeiro
+        if self._fila[0][2] is conversa:
+            self._acordar.set()
+
+    def pendentes(self):
+        return len(self._fila)
+
+    #geração disparada por uma conversa para o próximo passo: enquanto roda, o tempo virtual não pula
+    def acompanhar(self, tarefa):
+        self._geracoes.add(tarefa)
+        tarefa.add_done_callback(self._geracao_terminou)
+
+    def _geracao_terminou(self, tarefa):
+        self._geracoes.discard(tarefa)
+        if self.relogio.virtual:
+            self._acordar.set()
+
+    async def executar(self):
+        self._rodando = True
+        while self._rodando:
+            espera = self._fila[0][0] - self.agora() if self._fila else None  # None = heap vazio
+            if espera is None or espera > 0:
+                if self.relogio.virtual and self.relogio.ociosas(self._tarefas | self._geracoes):
+                    # simulação: ninguém trabalhando, pula até o próximo evento (ou dormir() pendente)
+                    alvos = [q for q in (self._fila[0][0] if self._fila else None, self.relogio.proximo())
+                             if q is not None]
+                    if alvos:
+                        self.relogio.avancar_ate(min(alvos))
+                        continue
+                self._acordar.clear()
+                try:
+                    await asyncio.wait_for(self._acordar.wait(), espera)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            quando, _, conversa = heapq.heappop(self._fila)
+            if conversa.cancelada:
+                continue  # evento de conversa já encerrada, sai do heap sem rodar
+            if conversa.pausada:
+                self._pausadas[conversa] = quando  # fica fora do heap até retomar()
+                continue
+            M_ATRASO.observar(self.agora() - quando)
+            tarefa = asyncio.create_task(self._passo(conversa))
+            self._tarefas.add(tarefa)
+            tarefa.add_done_callback(self._tarefas.discard)
+
+    async def _passo(self, conversa):
+        try:
+            with M_PASSO.tempo():
+                atraso = await conversa.passo()
+        except asyncio.CancelledError:
+            if not conversa.cancelada:
+                raise
+            atraso = None  # cancelar() derrubou a geração pendente que o passo esperava
+        except Exception as e:
+            try:
+                atraso = conversa.ao_falhar(e)
+            except Exception:
+                atraso = None
+
+        if conversa.cancelada:
+            pass  # já foi finalizada por cancelar()
+        elif atraso is None:
+            self.ativas.discard(conversa)
+            conversa.finalizar()
+        else:
+            self.agendar(conversa, atraso)
+        if self.relogio.virtual:
+            # o laço pode estar esperando este passo acabar para pular o tempo
+            self._tarefas.discard(asyncio.current_task())
+            self._acordar.set()
+
+    #encerra a conversa agora, sem esperar o próximo evento dela;
+    #manter_checkpoint=True quando outro processo vai retomar a conversa
+    def cancelar(self, conversa, manter_checkpoint=False):
+        if conversa not in self.ativas:
+            return False
+        conversa.cancelada = True
+        self.ativas.discard(conversa)
+        self._pausadas.pop(conversa, None)
+        conversa.finalizar(manter_checkpoint)
+        return True
+
+    #a conversa termina o passo em andamento e para antes do próximo envio
+    def pausar(self, conversa):
+        if conversa not in self.ativas or conversa.pausada:
+            return False
+        conversa.pausada = True
+        return True
+
+    #volta para o heap no horário original (ou já, se ele passou durante a pausa)
+    def retomar(self, conversa):
+        if not conversa.pausada:
+            return False
+        conversa.pausada = False
+        if conversa in self._pausadas:
+            self.agendar(conversa, max(0.0, self._pausadas.pop(conversa) - self.agora()))
+        return True
+
+    def pausadas(self):
+        return sum(1 for c in self.ativas if c.pausada)
+
+    #troca o limite de envios simultâneos; quem já está enviando termina no semáforo antigo
+    def definir_max_envio(self, max_envio):
+        self.sem_envio = asyncio.Semaphore(max_envio)
+        self.max_envio = max_envio
+
+    async def aguardar(self):
+        #espera todas as conversas ativas terminarem
+        while self.ativas:
+            await asyncio.wait([c.concluida for c in self.ativas])
+
+    def parar(self):
+        self._rodando = False
+        self._acordar.set()
+        for tarefa in list(self._tarefas):
+            tarefa.cancel()
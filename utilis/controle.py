@@ -0,0 +1,121 @@
+import asyncio
+import http
+import json
+import os
+from urllib.parse import parse_qsl, urlsplit
+
+# ===========================
+# Painel de controle local
+# ===========================
+# substitui a leitura do teclado: um endpoint HTTP pequeno no mesmo loop (sem laço de
+# polling, só acorda quando chega um pedido), em 127.0.0.1 ou num socket Unix (CONTROLE_SOCKET),
+# então funciona sem terminal e dentro do container. As rotas são registradas por quem
+# sobe o painel (o main); parâmetros vêm da query string e/ou de um corpo JSON.
+#   curl -X POST 'localhost:9109/pausar?agente=web_1'
+#   curl --unix-socket /tmp/maturador.sock localhost/estado
+CONTROLE_HOST = os.getenv("CONTROLE_HOST", "127.0.0.1")
+CONTROLE_PORTA = int(os.getenv("CONTROLE_PORTA", "9109"))  # 0 = porta livre qualquer
+CONTROLE_SOCKET = os.getenv("CONTROLE_SOCKET", "")  # caminho do socket Unix (tem prioridade sobre a porta)
+
+
+class ErroComando(Exception):
+    #erro do pedido (parâmetro faltando, agente inexistente...) -> HTTP 400
+    pass
+
+
+class PainelControle:
+    def __init__(self, host=CONTROLE_HOST, porta=CONTROLE_PORTA, socket=CONTROLE_SOCKET):
+        self.host = host
+        self.porta = porta
+        self.socket = socket
+        self.rotas = {}  # (metodo, caminho) -> handler(params) -> dict (ou corrotina)
+        self.servidor = None
+
+    #registra um comando: @painel.rota("POST", "/pausar")
+    def rota(self, metodo, caminho):
+        def registrar(handler):
+            self.rotas[(metodo, caminho)] = handler
+            return handler
+        return registrar
+
+    #porta ocupada / socket inválido não derruba o processo: avisa e devolve None
+    async def iniciar(self):
+        try:
+            if self.socket:
+                self.servidor = await asyncio.start_unix_server(self._atender, self.socket)
+            else:
+                self.servidor = await asyncio.start_server(self._atender, self.host, self.porta)
+        except OSError as e:
+            local = f"unix:{self.socket}" if self.socket else f"{self.host}:{self.porta}"
+            print(f"⚠️ Painel de controle não iniciou em {local}: {e}")
+            self.servidor = None
+            return None
+        if self.socket:
+            print(f"🎛️ Painel de controle em unix:{self.socket}")
+        else:
+            self.porta = self.servidor.sockets[0].getsockname()[1]
+            print(f"🎛️ Painel de controle em http://{self.host}:{self.porta}")
+        return self.servidor
+
+    async def parar(self):
+        if self.servidor:
+            self.servidor.close()
+            await self.servidor.wait_closed()
+            if self.socket and os.path.exists(self.socket):
+                os.remove(self.socket)
+
+    #roda um comando já separado em caminho + parâmetros; devolve (status http, corpo)
+    #(também usado pelo supervisor para repassar comandos aos processos trabalhadores)
+    async def executar(self, metodo, caminho, params):
+        handler = self.rotas.get((metodo, caminho.rstrip("/") or "/"))
+        if handler is None:
+            return 404, {"erro": f"comando desconhecido: {metodo} {caminho}",
+                         "comandos": sorted(f"{m} {c}" for m, c in self.rotas)}
+        try:
+            resultado = handler(params)
+            if asyncio.iscoroutine(resultado):
+                resultado = await resultado
+            return 200, resultado if resultado is not None else {"ok": True}
+        except ErroComando as e:
+            return 400, {"erro": str(e)}
+        except Exception as e:
+            print(f"⚠️ Erro no comando {metodo} {caminho}: {e}")
+            return 500, {"erro": str(e)}
+
+    async def _executar(self, metodo, alvo, corpo):
+        url = urlsplit(alvo)
+        params = dict(parse_qsl(url.query))
+        if corpo:
+            try:
+                dados = json.loads(corpo)
+            except ValueError:
+                return 400, {"erro": "corpo não é JSON"}
+            if isinstance(dados, dict):
+                params.update(dados)
+        return await self.executar(metodo, url.path, params)
+
+    async def _atender(self, reader, writer):
+        try:
+            linha = await asyncio.wait_for(reader.readline(), 5)
+            partes = linha.decode("latin-1").split()
+            if len(partes) < 2:
+                return
+            headers = {}
+            while True:
+                h = await asyncio.wait_for(reader.readline(), 5)
+                if h in (b"\r\n", b"\n", b""):
+                    break
+                chave, _, valor = h.decode("latin-1").partition(":")
+                headers[chave.strip().lower()] = valor.strip()
+            corpo = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+            status, resposta = await self._executar(partes[0], partes[1], corpo)
+            dados = json.dumps(resposta, ensure_ascii=False, default=str).encode("utf-8")
+            writer.write(f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                         f"Content-Length: {len(dados)}\r\nConnection: close\r\n\r\n".encode("latin-1") + dados)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        except Exception as e:
+            print(f"⚠️ Erro no painel de controle: {e}")
+        finally:
+            writer.close()
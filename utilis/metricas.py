@@ -0,0 +1,228 @@
+import asyncio
+import json
+import math
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# ===========================
+# Métricas (contadores, histogramas e medidores)
+# ===========================
+# custo baixo para ficar sempre ligado: observar é um bisect em poucos buckets fixos e os
+# medidores (tamanho de filas etc.) só são calculados quando alguém lê as métricas.
+# Leitura em formato Prometheus (GET /metrics) ou JSON (GET /metrics.json ou arquivo periódico).
+METRICAS_PORTA = int(os.getenv("METRICAS_PORTA", "0"))  # ex.: 9108; 0 = endpoint desligado
+METRICAS_ARQUIVO = os.getenv("METRICAS_ARQUIVO", "")  # snapshot JSON periódico (vazio = desligado)
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _rotulos(nomes, valores, extra=None):
+    pares = list(zip(nomes, valores)) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in pares) + "}"
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.valores = {}
+
+    def inc(self, valor=1, **rotulos):
+        chave = tuple(rotulos.get(r, "") for r in self.rotulos)
+        self.valores[chave] = self.valores.get(chave, 0) + valor
+
+    def linhas(self):
+        for chave, valor in self.valores.items():
+            yield f"{self.nome}{_rotulos(self.rotulos, chave)} {valor}"
+
+    def snapshot(self):
+        return {",".join(chave) or "_": valor for chave, valor in self.valores.items()}
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(buckets)
+        self.series = {}  # chave -> [contagens por bucket (+Inf no fim), soma, total]
+
+    def observar(self, valor, **rotulos):
+        chave = tuple(rotulos.get(r, "") for r in self.rotulos)
+        serie = self.series.get(chave)
+        if serie is None:
+            serie = self.series[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        serie[0][bisect_left(self.buckets, valor)] += 1
+        serie[1] += valor
+        serie[2] += 1
+
+    #mede o tempo do bloco: with hist.tempo(backend="ollama"): ...
+    @contextmanager
+    def tempo(self, **rotulos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+    def quantil(self, q, **rotulos):
+        #interpolação linear dentro do bucket (como o histogram_quantile do Prometheus)
+        serie = self.series.get(tuple(rotulos.get(r, "") for r in self.rotulos))
+        if not serie or not serie[2]:
+            return 0.0
+        alvo, acumulado = q * serie[2], 0
+        for i, n in enumerate(serie[0]):
+            if n and acumulado + n >= alvo:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                inferior = self.buckets[i - 1] if i else 0.0
+                return round(inferior + (self.buckets[i] - inferior) * (alvo - acumulado) / n, 4)
+            acumulado += n
+        return self.buckets[-1]
+
+    def linhas(self):
+        for chave, (contagens, soma, total) in self.series.items():
+            acumulado = 0
+            for limite, n in zip(self.buckets + ("+Inf",), contagens):
+                acumulado += n
+                yield f"{self.nome}_bucket{_rotulos(self.rotulos, chave, ('le', limite))} {acumulado}"
+            yield f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {soma}"
+            yield f"{self.nome}_count{_rotulos(self.rotulos, chave)} {total}"
+
+    def snapshot(self):
+        return {
+            ",".join(chave) or "_": {
+                "total": total,
+                "media": round(soma / total, 4) if total else 0.0,
+                "p50": self.quantil(0.5, **dict(zip(self.rotulos, chave))),
+                "p99": self.quantil(0.99, **dict(zip(self.rotulos, chave))),
+            }
+            for chave, (_, soma, total) in self.series.items()
+        }
+
+
+class Medidor:
+    tipo = "gauge"
+
+    #valor lido na hora da coleta (ex.: tamanho de uma fila)
+    def __init__(self, nome, ajuda, funcao):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.funcao = funcao
+
+    def valor(self):
+        try:
+            return self.funcao()
+        except Exception:
+            return float("nan")
+
+    def linhas(self):
+        yield f"{self.nome} {self.valor()}"
+
+    def snapshot(self):
+        return self.valor()
+
+
+class Registro:
+    def __init__(self):
+        self.metricas = {}
+
+    def _registrar(self, metrica):
+        # registrar de novo com o mesmo nome devolve a métrica existente
+        return self.metricas.setdefault(metrica.nome, metrica)
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def histograma(self, nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+        return self._registrar(Histograma(nome, ajuda, rotulos, buckets))
+
+    #medidores são substituídos (o objeto medido pode ser recriado)
+    def medidor(self, nome, ajuda, funcao):
+        self.metricas[nome] = Medidor(nome, ajuda, funcao)
+        return self.metricas[nome]
+
+    def texto_prometheus(self):
+        saida = []
+        for m in self.metricas.values():
+            saida.append(f"# HELP {m.nome} {m.ajuda}")
+            saida.append(f"# TYPE {m.nome} {m.tipo}")
+            saida.extend(m.linhas())
+        return "\n".join(saida) + "\n"
+
+    def snapshot(self):
+        return {"hora": time.strftime("%d/%m/%Y %H:%M:%S"),
+                **{m.nome: m.snapshot() for m in self.metricas.values()}}
+
+    #snapshot em JSON válido: NaN/Infinity (medidor que falhou, prazo infinito...) viram null
+    def json(self):
+        return json.dumps(_finitos(self.snapshot()), ensure_ascii=False, allow_nan=False)
+
+
+def _finitos(valor):
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    if isinstance(valor, dict):
+        return {k: _finitos(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_finitos(v) for v in valor]
+    return valor
+
+
+metricas = Registro()
+
+
+# ======================== EXPOSIÇÃO ========================
+async def _atender(reader, writer):
+    try:
+        linha = await asyncio.wait_for(reader.readline(), 5)
+        partes = linha.decode("latin-1").split()
+        caminho = partes[1] if len(partes) > 1 else "/"
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        if caminho.startswith("/metrics.json"):
+            corpo, tipo, status = metricas.json(), "application/json", "200 OK"
+        elif caminho.startswith("/metrics"):
+            corpo, tipo, status = metricas.texto_prometheus(), "text/plain; version=0.0.4", "200 OK"
+        else:
+            corpo, tipo, status = "not found\n", "text/plain", "404 Not Found"
+        dados = corpo.encode("utf-8")
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {tipo}; charset=utf-8\r\n"
+                     f"Content-Length: {len(dados)}\r\nConnection: close\r\n\r\n".encode("latin-1") + dados)
+        await writer.drain()
+    except Exception as e:
+        print(f"⚠️ Erro no endpoint de métricas: {e}")
+    finally:
+        writer.close()
+
+
+#endpoint HTTP local: /metrics (Prometheus) e /metrics.json; porta ocupada só desliga as métricas
+async def servir_metricas(host="127.0.0.1", porta=METRICAS_PORTA):
+    try:
+        servidor = await asyncio.start_server(_atender, host, porta)
+    except OSError as e:
+        print(f"⚠️ Endpoint de métricas não iniciou em {host}:{porta}: {e}")
+        return None
+    print(f"📈 Métricas em http://{host}:{porta}/metrics")
+    return servidor
+
+
+#grava um snapshot JSON a cada `intervalo` segundos
+async def snapshot_periodico(caminho=METRICAS_ARQUIVO, intervalo=60):
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            tmp = caminho + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(metricas.json())
+            os.replace(tmp, caminho)
+        except Exception as e:
+            print(f"⚠️ Erro ao gravar métricas: {e}")
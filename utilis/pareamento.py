@@ -0,0 +1,168 @@
+import asyncio
+from collections import deque
+
+from utilis.relogio import relogio_atual
+
+# ===========================
+# Motor de pareamento
+# ===========================
+# mantém o índice de agentes livres (conectados e sem conversa) e ocupados e reage a eventos
+# um agente por vez, sem reordenar a frota: conectar, desconectar e fim de conversa custam
+# O(1) + uma busca limitada a `busca` candidatos. Quem fica livre entra no fim da fila e
+# pareia com o primeiro livre com quem não falou nas últimas `recentes` conversas, então os
+# números vão rodando de parceiro ao longo do tempo. Se só tem parceiro recente livre, o
+# agente espera até aparecer outro ou passar `espera_repeticao` segundos (aí repete o par).
+class MotorPareamento:
+    #iniciar(a1, a2) -> conversa: cria a conversa do par; parar(conversa): encerra (agente caiu)
+    #max_conversas = quantas conversas cada agente faz no total (None = sem limite, roda sempre)
+    #espera_repeticao = 0 repete o par na hora quando não tem outro livre
+    def __init__(self, iniciar, parar, recentes=5, busca=32, max_conversas=None, espera_repeticao=30.0):
+        self.iniciar = iniciar
+        self.parar = parar
+        self.recentes = recentes
+        self.busca = busca
+        self.max_conversas = max_conversas
+        self.espera_repeticao = espera_repeticao
+
+        self.livres = {}  # agente -> instante em que ficou livre (dict mantém a ordem de chegada)
+        self.ocupados = {}  # agente -> conversa
+        self.parceiros = {}  # agente -> deque dos últimos parceiros
+        self.conversas = {}  # agente -> quantas conversas já começou
+        self.ativo = True  # False = só enfileira, não forma pares novos (pausa/parada geral)
+        self._esperas = {}  # agente -> tarefa que repete o par depois de espera_repeticao
+        self.stats = {"pares": 0, "repeticoes": 0, "interrompidas": 0}
+
+    def _pode_conversar(self, agente):
+        return self.max_conversas is None or self.conversas.get(agente, 0) < self.max_conversas
+
+    #parceiro recente só serve se um dos dois já esperou espera_repeticao
+    def _parceiro(self, agente, chegada):
+        recentes = self.parceiros.get(agente, ())
+        limite = relogio_atual().agora() - self.espera_repeticao
+        repetido = False
+        for i, (candidato, desde) in enumerate(self.livres.items()):
+            if i >= self.busca:
+                break
+            if candidato not in recentes:
+                return candidato
+            if min(chegada, desde) <= limite:
+                self.stats["repeticoes"] += 1
+                return candidato
+            repetido = True
+        if repetido:
+            self._esperar_repeticao(agente)
+        return None
+
+    #agente fora da fila entra nela e pareia se der; chegada = quando ficou livre
+    def _parear(self, agente, chegada=None):
+        if chegada is None:
+            chegada = relogio_atual().agora()
+        parceiro = self._parceiro(agente, chegada) if self.ativo else None
+        if parceiro is None:
+            self.livres[agente] = chegada
+            return None
+        del self.livres[parceiro]
+        # quem esperava mais fala primeiro (mantém a ordem 1x2, 3x4 da carga inicial)
+        return self._iniciar_par(parceiro, agente)
+
+    def _iniciar_par(self, a1, a2):
+        for a, b in ((a1, a2), (a2, a1)):
+            self.parceiros.setdefault(a, deque(maxlen=self.recentes)).append(b)
+            self.conversas[a] = self.conversas.get(a, 0) + 1
+        conversa = self.iniciar(a1, a2)
+        self.ocupados[a1] = self.ocupados[a2] = conversa
+        self.stats["pares"] += 1
+        return conversa
+
+    #recria um par que estava conversando antes do restart (checkpoint), se os dois estiverem livres
+    def retomar(self, a1, a2):
+        for ag in (a1, a2):
+            if ag in self.ocupados or not ag.conectado or not self._pode_conversar(ag):
+                return None
+        self.livres.pop(a1, None)
+        self.livres.pop(a2, None)
+        return self._iniciar_par(a1, a2)
+
+    #só parceiro recente livre: tenta de novo quando o agente completar espera_repeticao na fila
+    def _esperar_repeticao(self, agente):
+        if agente in self._esperas:
+            return
+        try:
+            tarefa = asyncio.get_running_loop().create_task(self._repetir_depois(agente))
+        except RuntimeError:
+            return  # sem loop (uso síncrono): o próximo evento pareia
+        self._esperas[agente] = tarefa
+
+    async def _repetir_depois(self, agente):
+        try:
+            while agente in self.livres:
+                espera = self.livres[agente] + self.espera_repeticao - relogio_atual().agora()
+                if espera <= 0:
+                    break
+                await relogio_atual().dormir(espera)
+        finally:
+            self._esperas.pop(agente, None)
+        if agente in self.livres and self.ativo:
+            self._parear(agente, self.livres.pop(agente))
+
+    #agente conectado e sem conversa entra na fila (e já pareia se tiver alguém esperando)
+    def conectar(self, agente):
+        if agente in self.livres or agente in self.ocupados or not self._pode_conversar(agente):
+            return None
+        return self._parear(agente)
+
+    #agente caiu ou saiu do banco: sai da fila e, se estava conversando, a conversa para
+    #(o parceiro volta para a fila quando a conversa terminar, em liberar())
+    def desconectar(self, agente):
+        self.livres.pop(agente, None)
+        conversa = self.ocupados.get(agente)
+        if conversa is not None:
+            self.stats["interrompidas"] += 1
+            self.parar(conversa)
+
+    def remover(self, agente):
+        self.desconectar(agente)
+        self.parceiros.pop(agente, None)
+        self.conversas.pop(agente, None)
+
+    #fim da conversa: os dois agentes ficam livres; reentrar=False não repareia (ex.: falhou de cara).
+    #Os dois entram na fila antes de qualquer um parear, senão o primeiro só acharia o antigo parceiro
+    def liberar(self, conversa, reentrar=True):
+        voltam = []
+        for agente in (conversa.agente1, conversa.agente2):
+            if self.ocupados.get(agente) is conversa:
+                del self.ocupados[agente]
+                # removido (remover()) não tem mais contagem e não volta
+                if reentrar and agente.conectado and agente in self.conversas and self._pode_conversar(agente):
+                    voltam.append(agente)
+        agora = relogio_atual().agora()
+        for agente in voltam:
+            self.livres[agente] = agora
+        for agente in voltam:
+            if agente in self.livres:
+                self._parear(agente, self.livres.pop(agente))
+
+    #sincroniza um agente com o estado de conexão atual (ex.: depois de consultar o status)
+    def atualizar(self, agente):
+        if agente.conectado:
+            self.conectar(agente)
+        else:
+            self.desconectar(agente)
+
+    def suspender(self):
+        self.ativo = False
+
+    #volta a formar pares e pareia quem ficou esperando durante a suspensão
+    def reativar(self):
+        self.ativo = True
+        esperando, self.livres = list(self.livres.items()), {}
+        for agente, chegada in esperando:
+            self._parear(agente, chegada)
+
+    #cancela as esperas de repetição (fim do main)
+    def encerrar(self):
+        for tarefa in list(self._esperas.values()):
+            tarefa.cancel()
+
+    def estatisticas(self):
+        return {**self.stats, "livres": len(self.livres), "ocupados": len(self.ocupados), "ativo": self.ativo}
@@ -0,0 +1,115 @@
+import asyncio
+import heapq
+import itertools
+from datetime import datetime, timedelta
+
+# ===========================
+# Relógios (real e virtual)
+# ===========================
+# o agendador, o delay_ms_async e os horários gravados no histórico leem a hora por aqui,
+# então dá para trocar o relógio real por um virtual e simular horas de maturação em minutos.
+# O relógio virtual anda junto com o real (trabalho de verdade - geração, envio - continua
+# custando o tempo que custa) e, quando ninguém está trabalhando, o agendador pula direto
+# para o próximo evento marcado em vez de esperar os 1-10 minutos entre mensagens.
+# "Ninguém trabalhando" = todo passo e toda geração em andamento está parado num dormir()
+# deste relógio (backoff de retry, limitador...), nunca rodando de verdade.
+class RelogioReal:
+    virtual = False
+
+    def agora(self):
+        return asyncio.get_running_loop().time()
+
+    def datahora(self):
+        return datetime.now()
+
+    async def dormir(self, segundos):
+        await asyncio.sleep(segundos)
+
+
+class RelogioVirtual:
+    virtual = True
+
+    #inicio = data/hora simulada de partida (padrão: agora)
+    def __init__(self, inicio=None):
+        self.inicio = inicio
+        self.deslocamento = 0.0  # segundos pulados até agora
+        self.saltos = 0
+        self._base = None  # agora() no momento em que a data/hora de início vale
+        self._timers = []  # heap de (quando, seq, futuro, tarefa) de quem está em dormir()
+        self._seq = itertools.count()
+        self._dormindo = set()  # tarefas paradas agora num dormir()
+        self.ouvintes = []  # chamados quando alguma tarefa começa a dormir (o agendador reavalia o salto)
+
+    def agora(self):
+        agora = asyncio.get_running_loop().time() + self.deslocamento
+        if self._base is None:
+            self._base = agora
+            self.inicio = self.inicio or datetime.now()
+        return agora
+
+    def datahora(self):
+        agora = self.agora()
+        return self.inicio + timedelta(seconds=agora - self._base)
+
+    async def dormir(self, segundos):
+        alvo = self.agora() + segundos
+        tarefa = asyncio.current_task()
+        try:
+            while (restante := alvo - self.agora()) > 0:
+                futuro = asyncio.get_running_loop().create_future()
+                heapq.heappush(self._timers, (alvo, next(self._seq), futuro, tarefa))
+                self._dormindo.add(tarefa)
+                for ouvinte in self.ouvintes:
+                    ouvinte()
+                try:
+                    # sem salto nenhum acorda pelo tempo real, como o asyncio.sleep
+                    await asyncio.wait_for(futuro, restante)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._dormindo.discard(tarefa)
+
+    #True se todas as tarefas estão paradas num dormir() (dá para pular o tempo sem atropelar ninguém)
+    def ociosas(self, tarefas):
+        return all(tarefa in self._dormindo for tarefa in tarefas)
+
+    #instante do próximo dormir() pendente (None = nenhum)
+    def proximo(self):
+        while self._timers and self._timers[0][2].done():
+            heapq.heappop(self._timers)
+        return self._timers[0][0] if self._timers else None
+
+    #pula o tempo até `quando` e acorda quem estava dormindo até lá
+    def avancar_ate(self, quando):
+        salto = quando - self.agora()
+        if salto > 0:
+            self.deslocamento += salto
+            self.saltos += 1
+        agora = self.agora()
+        while self._timers and self._timers[0][0] <= agora:
+            _, _, futuro, tarefa = heapq.heappop(self._timers)
+            if not futuro.done():
+                futuro.set_result(None)
+                # acordada já conta como trabalhando, mesmo antes de voltar a rodar
+                self._dormindo.discard(tarefa)
+
+    def estatisticas(self):
+        return {
+            "datahora": self.datahora().strftime("%d/%m/%Y %H:%M:%S") if self._base is not None else None,
+            "pulado_s": round(self.deslocamento, 1),
+            "saltos": self.saltos,
+        }
+
+
+relogio = RelogioReal()
+
+
+#relógio de quem não recebe um explicitamente (backoff do retry, limitador da GTI);
+#a simulação troca aqui e volta ao real no fim (None = real)
+def definir_relogio(novo):
+    global relogio
+    relogio = novo or RelogioReal()
+
+
+def relogio_atual():
+    return relogio
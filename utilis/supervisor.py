@@ -0,0 +1,468 @@
+import asyncio
+import hashlib
+import itertools
+import multiprocessing
+import os
+import threading
+from bisect import bisect, insort
+
+from utilis.controle import PainelControle, ErroComando
+from utilis.utils import apagar_checkpoints, extrair_numero, listar_checkpoints
+
+# ===========================
+# Supervisor multiprocesso
+# ===========================
+# um loop só não passa de um núcleo (JSON, prompts e os clientes síncronos do ollama/gemini
+# dividem o mesmo interpretador). Com SUPERVISOR_TRABALHADORES > 1 o processo principal só
+# lê as rotas do banco e divide as instâncias entre N processos trabalhadores por hash
+# consistente de grupos de duas (o par do checkpoint fica no mesmo processo); cada trabalhador
+# roda o main() normal (loop, pool HTTP, pool do LLM e fila de inferência próprios) só com o seu
+# pedaço e manda o estado para o supervisor.
+# Trabalhador que morre sai do anel (as instâncias dele vão para os outros) e volta depois de
+# SUPERVISOR_REINICIO segundos; rota nova no banco vai direto para o dono no anel. Só ~1/N das
+# instâncias mudam de processo a cada mudança: quem perde um grupo para a conversa mantendo o
+# checkpoint e confirma, e só então o novo dono recebe o grupo e retoma a conversa de onde
+# parou. Checkpoint que não tem mais como ser retomado é apagado pelo supervisor.
+# Comandos do painel (pausar, limites...) são repassados aos trabalhadores; com `agente` só
+# para o dono dele. Nos trabalhadores o webhook fica desligado (uma URL pública só) e cada um
+# expõe as métricas em METRICAS_PORTA + 1 + índice (e grava METRICAS_ARQUIVO com o índice no nome).
+SUPERVISOR_TRABALHADORES = int(os.getenv("SUPERVISOR_TRABALHADORES", "0"))  # 0/1 = um processo só
+SUPERVISOR_REINICIO = float(os.getenv("SUPERVISOR_REINICIO", "5"))  # segundos até recriar um trabalhador morto
+SUPERVISOR_RELATORIO = float(os.getenv("SUPERVISOR_RELATORIO", "5"))  # intervalo do estado enviado pelos trabalhadores
+
+
+#anel de hash consistente: cada nó ocupa `replicas` pontos, a chave vai para o próximo ponto
+class AnelConsistente:
+    def __init__(self, replicas=128):
+        self.replicas = replicas
+        self._pontos = []  # ordenados
+        self._donos = {}  # ponto -> nó
+
+    @staticmethod
+    def _hash(chave):
+        return int.from_bytes(hashlib.blake2b(str(chave).encode("utf-8"), digest_size=8).digest(), "big")
+
+    def adicionar(self, no):
+        for r in range(self.replicas):
+            ponto = self._hash(f"{no}#{r}")
+            if ponto not in self._donos:
+                self._donos[ponto] = no
+                insort(self._pontos, ponto)
+
+    def remover(self, no):
+        self._pontos = [p for p in self._pontos if self._donos[p] != no]
+        self._donos = {p: n for p, n in self._donos.items() if n != no}
+
+    def no(self, chave):
+        if not self._pontos:
+            return None
+        i = bisect(self._pontos, self._hash(chave)) % len(self._pontos)
+        return self._donos[self._pontos[i]]
+
+    def nos(self):
+        return set(self._donos.values())
+
+    def __len__(self):
+        return len(self.nos())
+
+
+#thread que lê uma ponta do Pipe e entrega cada mensagem no loop; EOF (o outro lado morreu) vira `fim`
+def _ler_pipe(conexao, loop, entregar, fim):
+    def ler():
+        while True:
+            try:
+                msg = conexao.recv()
+            except (EOFError, OSError):
+                msg = fim
+            try:
+                loop.call_soon_threadsafe(entregar, msg)
+            except RuntimeError:
+                return  # loop já fechou
+            if msg is fim:
+                return
+    threading.Thread(target=ler, daemon=True, name="pipe").start()
+
+
+def _enviar_pipe(conexao, msg):
+    try:
+        conexao.send(msg)
+        return True
+    except (OSError, ValueError):
+        return False  # o outro lado já fechou
+
+
+#lado do trabalhador: comandos do supervisor chegam numa fila do loop; supervisor sumido = parar
+class CanalTrabalhador:
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self._fila = None
+
+    def iniciar(self):
+        self._fila = asyncio.Queue()
+        _ler_pipe(self.conexao, asyncio.get_running_loop(), self._fila.put_nowait, ("parar", None))
+
+    async def receber(self):
+        return await self._fila.get()
+
+    def enviar(self, *msg):
+        return _enviar_pipe(self.conexao, msg)
+
+
+class Supervisor:
+    #alvo(indice, linhas, conexao, opcoes): função do processo trabalhador (ex.: main.rodar_trabalhador)
+    #opcoes = argumentos repassados ao main() de cada trabalhador (turno, test_mode, rodadas)
+    #rotas() -> {telefone: senha} ou None: de onde vêm as instâncias (None = tabela ROTA do banco)
+    def __init__(self, alvo, trabalhadores=SUPERVISOR_TRABALHADORES, opcoes=None, rotas=None,
+                 reinicio=SUPERVISOR_REINICIO, recarga=None, espera_remocao=30.0):
+        self.alvo = alvo
+        self.trabalhadores = max(1, trabalhadores)
+        self.opcoes = opcoes or {}
+        self.consultar_rotas = rotas
+        self.reinicio = reinicio
+        self.recarga = recarga
+        self.espera_remocao = espera_remocao
+
+        self.anel = AnelConsistente()
+        self.rotas = {}  # telefone -> senha (todas)
+        self.grupos = {}  # telefone -> chave do grupo no anel (o par vai junto para o mesmo processo)
+        self.processos = {}  # índice -> (Process, conexão) dos vivos
+        self.atribuicao = {}  # índice -> {telefone: senha} que o trabalhador tem agora
+        self.estados = {}  # índice -> último estado enviado pelo trabalhador
+        self.stats = {"mortes": 0, "reinicios": 0, "movidos": 0, "checkpoints_apagados": 0}
+
+        self._ctx = multiprocessing.get_context("spawn")  # sem herdar loop/threads do pai
+        self._eventos = None
+        self._respostas = {}  # id do pedido -> (índice do trabalhador, future da resposta)
+        self._ids = itertools.count()
+        self._trava = None  # uma redistribuição por vez
+        self._tarefas = set()
+        self._parada = None
+        self._parando = False
+
+    # ======================== PROCESSOS ========================
+    #porta e arquivo de métricas próprios por trabalhador (o env é lido no import, dentro do processo novo)
+    def _ambiente(self, indice):
+        base = int(os.getenv("METRICAS_PORTA", "0"))
+        ambiente = {"METRICAS_PORTA": str(base + 1 + indice) if base else "0", "WEBHOOK_URL": ""}
+        arquivo = os.getenv("METRICAS_ARQUIVO", "")
+        if arquivo:
+            raiz, ext = os.path.splitext(arquivo)
+            ambiente["METRICAS_ARQUIVO"] = f"{raiz}.{indice}{ext}"
+        return ambiente
+
+    #linhas = {telefone: senha} que o trabalhador recebe ao nascer
+    def _iniciar(self, indice, linhas):
+        pai, filho = self._ctx.Pipe()
+        proc = self._ctx.Process(target=self.alvo, args=(indice, list(linhas.items()), filho, self.opcoes),
+                                 name=f"trabalhador-{indice}", daemon=True)
+        ambiente = self._ambiente(indice)
+        anterior = {chave: os.environ.get(chave) for chave in ambiente}
+        os.environ.update(ambiente)
+        try:
+            proc.start()
+        finally:
+            for chave, valor in anterior.items():
+                if valor is None:
+                    os.environ.pop(chave, None)
+                else:
+                    os.environ[chave] = valor
+        filho.close()  # só o filho fica com a ponta dele: quando ele morre, recv() do pai dá EOF
+        self.processos[indice] = (proc, pai)
+        self.atribuicao[indice] = dict(linhas)
+        _ler_pipe(pai, asyncio.get_running_loop(), lambda msg: self._eventos.put_nowait((indice, msg)),
+                  ("morreu", None))
+        print(f"🧩 Trabalhador {indice} iniciado (pid {proc.pid}) com {len(linhas)} instâncias")
+
+    def _enviar(self, indice, *msg):
+        if indice in self.processos:
+            _enviar_pipe(self.processos[indice][1], msg)
+
+    #mensagem que o trabalhador responde com ("resposta", id, status, corpo); devolve o future da resposta
+    def _pedir(self, indice, tipo, *dados):
+        id_ = next(self._ids)
+        futuro = asyncio.get_running_loop().create_future()
+        self._respostas[id_] = (indice, futuro)
+        self._enviar(indice, tipo, id_, *dados)
+        futuro.add_done_callback(lambda _: self._respostas.pop(id_, None))
+        return futuro
+
+    #tarefa solta (reinício, redistribuição) com referência guardada até terminar
+    def _agendar(self, corotina):
+        tarefa = asyncio.create_task(corotina)
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._tarefas.discard)
+        return tarefa
+
+    def _morreu(self, indice):
+        proc, conexao = self.processos.pop(indice)
+        conexao.close()
+        proc.join(timeout=1)
+        self.anel.remover(indice)
+        self.atribuicao.pop(indice, None)
+        self.estados.pop(indice, None)
+        # quem esperava resposta dele não fica pendurado até o timeout
+        for dono, futuro in list(self._respostas.values()):
+            if dono == indice and not futuro.done():
+                futuro.set_result((503, {"erro": "trabalhador parou"}))
+        self.stats["mortes"] += 1
+        print(f"💥 Trabalhador {indice} parou (código {proc.exitcode}); redistribuindo as instâncias")
+        self._agendar(self._distribuir())
+        if self.reinicio is not None:
+            asyncio.get_running_loop().call_later(self.reinicio, lambda: self._agendar(self._reiniciar(indice)))
+
+    async def _reiniciar(self, indice):
+        if self._parando or indice in self.processos:
+            return
+        self.stats["reinicios"] += 1
+        self.anel.adicionar(indice)
+        await self._distribuir()
+
+    # ======================== DISTRIBUIÇÃO ========================
+    #as instâncias vão para o anel em grupos de até dois (chave = nome do primeiro): par que estava
+    #conversando (checkpoint) fica junto e cada processo recebe um número par de agentes, então a
+    #divisão não deixa ninguém sem parceiro. Grupo formado não muda enquanto os dois existirem;
+    #quem ficou sozinho (o parceiro saiu da ROTA) pareia com a próxima instância nova
+    def _agrupar(self):
+        grupos = {tel: chave for tel, chave in self.grupos.items() if tel in self.rotas}
+        membros = {}
+        for tel, chave in grupos.items():
+            membros.setdefault(chave, []).append(tel)
+        for estado in listar_checkpoints():
+            par = [estado["agente1"], estado["agente2"]]
+            if all(tel in self.rotas and tel not in grupos for tel in par):
+                grupos[par[0]] = grupos[par[1]] = par[0]
+        sozinhos = sorted((m[0] for m in membros.values() if len(m) == 1), key=extrair_numero)
+        novos = sorted((tel for tel in self.rotas if tel not in grupos), key=extrair_numero)
+        pares = []
+        while sozinhos and novos:
+            pares.append((sozinhos.pop(0), novos.pop(0)))
+        resto = sozinhos + novos  # só uma das duas listas sobrou
+        pares += zip(resto[::2], resto[1::2])
+        for a, b in pares:
+            grupos.setdefault(a, a)
+            grupos[b] = grupos[a]
+        if len(resto) % 2:
+            grupos.setdefault(resto[-1], resto[-1])
+        self.grupos = grupos
+
+    def _dono_instancia(self, tel):
+        return self.anel.no(self.grupos[tel]) if tel in self.grupos else None
+
+    #leva cada trabalhador do que ele tem ao que o anel diz que é dele, em duas fases: primeiro
+    #as saídas, esperando a confirmação de cada trabalhador (as conversas dele já pararam, com o
+    #checkpoint gravado), depois os processos novos e as entradas. Assim uma instância nunca fica
+    #em dois processos e quem recebe um par retoma a conversa do checkpoint
+    async def _distribuir(self):
+        async with self._trava:
+            if self._parando:
+                return
+            self._agrupar()
+            desejado = {indice: {} for indice in self.anel.nos()}
+            for tel, senha in self.rotas.items():
+                desejado[self._dono_instancia(tel)][tel] = senha
+
+            saidas = {}
+            for indice in list(self.processos):
+                atual = self.atribuicao[indice]
+                sair = [tel for tel, senha in atual.items() if desejado.get(indice, {}).get(tel) != senha]
+                if sair:
+                    saidas[indice] = (sair, self._pedir(indice, "remover", sair))
+            for indice, (sair, futuro) in saidas.items():
+                try:
+                    await asyncio.wait_for(futuro, self.espera_remocao)
+                except asyncio.TimeoutError:
+                    print(f"⚠️ Trabalhador {indice} não confirmou a saída de {len(sair)} instâncias")
+                if indice in self.atribuicao:
+                    self.atribuicao[indice] = {tel: senha for tel, senha in self.atribuicao[indice].items()
+                                               if tel not in sair}
+
+            vivos = self.anel.nos()
+            for indice, linhas in desejado.items():
+                if indice not in vivos:
+                    continue  # morreu enquanto esperava as saídas; a próxima redistribuição cuida
+                if indice not in self.processos:
+                    self._iniciar(indice, linhas)
+                    continue
+                atual = self.atribuicao[indice]
+                entrar = [(tel, senha) for tel, senha in linhas.items() if atual.get(tel) != senha]
+                if entrar:
+                    self._enviar(indice, "adicionar", entrar)
+                    self.stats["movidos"] += len(entrar)
+                self.atribuicao[indice] = linhas
+            self._limpar_checkpoints()
+
+    #checkpoint que não tem mais como ser retomado: agente fora da ROTA ou os dois em processos diferentes
+    def _limpar_checkpoints(self):
+        def apagar(estado):
+            dono = self._dono_instancia(estado.get("agente1"))
+            return dono is None or dono != self._dono_instancia(estado.get("agente2"))
+
+        apagados = apagar_checkpoints(apagar)
+        if apagados:
+            self.stats["checkpoints_apagados"] += apagados
+            print(f"🧹 {apagados} checkpoints que não podem mais ser retomados apagados")
+
+    # ======================== ROTAS ========================
+    async def _ler_rotas(self):
+        if self.consultar_rotas is not None:
+            return await self.consultar_rotas()
+        from dbo.dbo import carregar_rotas_do_banco_async
+        return await carregar_rotas_do_banco_async()
+
+    async def recarregar(self):
+        rotas = await self._ler_rotas()
+        if rotas is None:
+            return False
+        if rotas != self.rotas:
+            novas = len(rotas.keys() - self.rotas.keys())
+            removidas = len(self.rotas.keys() - rotas.keys())
+            self.rotas = rotas
+            print(f"🔄 Rotas: +{novas} -{removidas} (total {len(rotas)})")
+            await self._distribuir()
+        return True
+
+    async def _recarga_periodica(self):
+        while True:
+            await asyncio.sleep(self.recarga)
+            await self.recarregar()
+
+    # ======================== COMANDOS ========================
+    #repassa um comando do painel aos trabalhadores (todos ou `indices`) e junta as respostas
+    async def repassar(self, metodo, caminho, params, indices=None, espera=30.0):
+        pendentes = {indice: self._pedir(indice, "comando", metodo, caminho, params)
+                     for indice in (list(self.processos) if indices is None else indices)}
+        respostas = {}
+        for indice, futuro in pendentes.items():
+            try:
+                status, corpo = await asyncio.wait_for(futuro, espera)
+            except asyncio.TimeoutError:
+                status, corpo = 504, {"erro": "trabalhador não respondeu"}
+            respostas[indice] = {"status": status, **corpo}
+        return respostas
+
+    def _dono(self, params):
+        nome = params.get("agente")
+        if not nome:
+            return None
+        if nome not in self.rotas:
+            raise ErroComando(f"agente {nome} não encontrado")
+        return [self._dono_instancia(nome)]
+
+    def _registrar_rotas(self, painel):
+        @painel.rota("GET", "/estado")
+        def estado(params):
+            return self.estatisticas(detalhe=bool(params.get("detalhe")))
+
+        @painel.rota("POST", "/atualizar")
+        async def atualizar(params):
+            await self.recarregar()
+            return await self.repassar("POST", "/atualizar", params)
+
+        for caminho in ("/cancelar", "/pausar", "/retomar", "/limites"):
+            @painel.rota("POST", caminho)
+            async def repassar(params, caminho=caminho):
+                return await self.repassar("POST", caminho, params, self._dono(params))
+
+        @painel.rota("POST", "/parar")
+        def parar(params):
+            self._parada.set()
+            return {"parando": True}
+
+    # ======================== EXECUÇÃO ========================
+    def _tratar(self, indice, msg):
+        tipo = msg[0]
+        if tipo == "estado":
+            self.estados[indice] = msg[1]
+        elif tipo == "resposta":
+            _, id_, status, corpo = msg
+            _, futuro = self._respostas.get(id_, (None, None))
+            if futuro is not None and not futuro.done():
+                futuro.set_result((status, corpo))
+        elif tipo == "morreu" and not self._parando and indice in self.processos:
+            self._morreu(indice)
+
+    async def executar(self, controle=True):
+        self._eventos = asyncio.Queue()
+        self._parada = asyncio.Event()
+        self._trava = asyncio.Lock()
+        rotas = await self._ler_rotas()
+        if rotas is None:
+            print("❌ Supervisor sem rotas para distribuir")
+            return
+        self.rotas = rotas
+        if self.recarga is None:
+            from dbo.dbo import DB_RECARGA_INTERVALO
+            self.recarga = DB_RECARGA_INTERVALO
+        print(f"🧩 Supervisor: {len(rotas)} instâncias em {self.trabalhadores} processos")
+        # anel completo antes do primeiro processo, senão o primeiro pegaria tudo
+        for indice in range(self.trabalhadores):
+            self.anel.adicionar(indice)
+        await self._distribuir()
+
+        painel = None
+        if controle:
+            painel = PainelControle()
+            self._registrar_rotas(painel)
+            await painel.iniciar()
+        tarefa_recarga = asyncio.create_task(self._recarga_periodica()) if self.recarga else None
+        parada = asyncio.create_task(self._parada.wait())
+        try:
+            while not self._parada.is_set():
+                proximo = asyncio.create_task(self._eventos.get())
+                await asyncio.wait((proximo, parada), return_when=asyncio.FIRST_COMPLETED)
+                if not proximo.done():
+                    proximo.cancel()
+                    break
+                self._tratar(*proximo.result())
+        finally:
+            parada.cancel()
+            if tarefa_recarga:
+                tarefa_recarga.cancel()
+            if painel:
+                await painel.parar()
+            await self.encerrar()
+
+    #parada limpa: cada trabalhador fecha as conversas mantendo os checkpoints
+    async def encerrar(self, espera=30.0):
+        self._parando = True
+        for tarefa in list(self._tarefas):
+            tarefa.cancel()
+        for indice in list(self.processos):
+            self._enviar(indice, "parar", None)
+        print(f"📊 Supervisor: {self.estatisticas()}")
+
+        def aguardar():
+            for proc, conexao in self.processos.values():
+                proc.join(espera)
+                if proc.is_alive():
+                    print(f"⚠️ {proc.name} não parou a tempo, encerrando")
+                    proc.terminate()
+                    proc.join(5)
+                conexao.close()
+        await asyncio.to_thread(aguardar)
+        self.processos.clear()
+        if self.consultar_rotas is None:
+            from dbo.dbo import fechar_banco
+            await fechar_banco()
+
+    def estatisticas(self, detalhe=False):
+        trabalhadores = {}
+        for indice in range(self.trabalhadores):
+            estado = self.estados.get(indice, {})
+            proc = self.processos.get(indice)
+            trabalhadores[indice] = {
+                "pid": proc[0].pid if proc else None,
+                "vivo": proc is not None,
+                "instancias": len(self.atribuicao.get(indice, ())),
+                "conversas_ativas": estado.get("conversas_ativas", 0),
+                "msgs_por_minuto": estado.get("msgs_por_minuto", 0.0),
+            }
+            if detalhe:
+                trabalhadores[indice]["estado"] = estado
+        return {
+            "instancias": len(self.rotas),
+            "conversas_ativas": sum(t["conversas_ativas"] for t in trabalhadores.values()),
+            "msgs_por_minuto": round(sum(t["msgs_por_minuto"] for t in trabalhadores.values()), 2),
+            **self.stats,
+            "trabalhadores": trabalhadores,
+        }
@@ -1,9 +1,16 @@
 import asyncio
+import itertools
 import json
 import os
+import random
 import re
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from functools import wraps
-from dbo.dbo import carregar_agentes_async_do_banco_async
+
+from utilis.metricas import metricas
+from utilis.relogio import relogio_atual
 
 HISTORICO_DIR = "historicos"
 os.makedirs(HISTORICO_DIR, exist_ok=True)
@@ -11,19 +18,121 @@ os.makedirs(HISTORICO_DIR, exist_ok=True)
 # ===========================
 # Decorador Retry
 # ===========================
-def retry(max_tentativas: int = 3, delay: int = 2, exceptions: tuple = (Exception,)) -> callable:
+# funciona em funções síncronas e async; espera com backoff exponencial + jitter entre as
+# tentativas, respeita Retry-After e só repete o que vale a pena (rede, 408/425/429/5xx;
+# `repetir_se` troca o critério, ex. envios que não podem sair duas vezes).
+# Todas as chamadas dividem um orçamento global de retries: se a API cair, as fichas acabam
+# e as falhas voltam direto em vez de virar uma avalanche de novas tentativas.
+STATUS_REPETIVEIS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class OrcamentoRetry:
+    #cada chamada nova deposita `proporcao` de ficha, cada retry gasta uma;
+    #`minimo_por_segundo` garante algum retry mesmo com pouco tráfego
+    def __init__(self, proporcao=0.2, minimo_por_segundo=1.0, maximo=50.0):
+        self.proporcao = proporcao
+        self.minimo_por_segundo = minimo_por_segundo
+        self.maximo = maximo
+        self.fichas = maximo
+        self.negados = 0
+        self._ultimo = time.monotonic()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self.fichas = min(self.maximo, self.fichas + (agora - self._ultimo) * self.minimo_por_segundo)
+        self._ultimo = agora
+
+    def registrar_chamada(self):
+        self._repor()
+        self.fichas = min(self.maximo, self.fichas + self.proporcao)
+
+    def gastar(self):
+        self._repor()
+        if self.fichas >= 1:
+            self.fichas -= 1
+            return True
+        self.negados += 1
+        return False
+
+
+orcamento_retry = OrcamentoRetry()
+
+
+def _status_http(erro):
+    return getattr(getattr(erro, "response", None), "status_code", None)
+
+
+#segundos pedidos pelo header Retry-After (número ou data HTTP), se houver
+def retry_after(erro):
+    headers = getattr(getattr(erro, "response", None), "headers", None) or {}
+    valor = headers.get("Retry-After")
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(valor) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+#erros HTTP só repetem em 408/425/429/5xx; os demais (rede, timeout...) sempre.
+#Só serve para chamadas idempotentes (GET de status etc.); envio usa um critério próprio
+def erro_repetivel(erro):
+    status = _status_http(erro)
+    return status is None or status in STATUS_REPETIVEIS
+
+
+#delay em segundos: espera base da 1ª repetição, multiplicada por `fator` a cada tentativa
+def retry(max_tentativas: int = 3, delay: float = 2, exceptions: tuple = (Exception,), fator: float = 2.0,
+          delay_max: float = 60.0, jitter: bool = True, repetir_se=erro_repetivel,
+          orcamento: OrcamentoRetry = orcamento_retry) -> callable:
     def decorator(func):
+        def proxima_espera(tentativa, erro):
+            #None = desistir e propagar o erro
+            if tentativa >= max_tentativas or not repetir_se(erro):
+                return None
+            if orcamento is not None and not orcamento.gastar():
+                print(f"Tentativa {tentativa} falhou: {erro} (orçamento de retries esgotado)")
+                return None
+            espera = min(delay_max, delay * fator ** (tentativa - 1))
+            if jitter:
+                espera = random.uniform(0, espera)
+            pedido = retry_after(erro)
+            if pedido is not None:
+                espera = min(delay_max, max(espera, pedido))
+            print(f"Tentativa {tentativa} falhou: {erro} (nova tentativa em {espera:.1f}s)")
+            return espera
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper_async(*args, **kwargs):
+                if orcamento is not None:
+                    orcamento.registrar_chamada()
+                for tentativa in itertools.count(1):
+                    try:
+                        return await func(*args, **kwargs)
+                    except exceptions as e:
+                        espera = proxima_espera(tentativa, e)
+                        if espera is None:
+                            raise
+                        await relogio_atual().dormir(espera)
+            return wrapper_async
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            for tentativa in range(1, max_tentativas + 1):
+            if orcamento is not None:
+                orcamento.registrar_chamada()
+            for tentativa in itertools.count(1):
                 try:
                     return func(*args, **kwargs)
                 except exceptions as e:
-                    print(f"Tentativa {tentativa} falhou: {e}")
-                    if tentativa == max_tentativas:
+                    espera = proxima_espera(tentativa, e)
+                    if espera is None:
                         raise
-                    delay_ms_async(delay)
-            return None
+                    time.sleep(espera)
         return wrapper
     return decorator
 
@@ -59,30 +168,238 @@ async def verificar_agentes(agentes):
 
 
 async def carregar_agentes():
+    # import tardio: dbo -> GTI -> utils formaria import circular
+    from dbo.dbo import carregar_agentes_async_do_banco_async
     agentes = await carregar_agentes_async_do_banco_async()
     return agentes
 
-#salva historico de mensagens
+#aplica no lugar só as rotas que entraram/saíram do banco; devolve (novos, removidos)
+async def recarregar_agentes(agentes):
+    from dbo.dbo import recarregar_agentes_do_banco_async
+    return await recarregar_agentes_do_banco_async(agentes)
+
+# ===========================
+# Histórico (log append-only em JSONL)
+# ===========================
+# cada par tem um arquivo historicos/<a1>_<a2>.jsonl com uma mensagem por linha;
+# gravar uma mensagem custa O(1) e ler só carrega o final do arquivo
+HISTORICO_JANELA = 50  # quantas mensagens recentes carregar por padrão
+M_HISTORICO = metricas.histograma("historico_segundos", "Tempo de leitura/gravação do histórico", ("operacao",))
+
+
+def _caminho_historico(ag1, ag2, ext=".jsonl"):
+    return os.path.join(HISTORICO_DIR, f"{ag1.nome}_{ag2.nome}{ext}")
+
+
+def _gravar_jsonl(caminho, historico: list):
+    # grava em arquivo temporário e troca de uma vez pra não deixar log pela metade
+    tmp = caminho + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for msg in historico:
+            f.write(json.dumps(msg, ensure_ascii=False) + "\n")
+    os.replace(tmp, caminho)
+
+
+def _migrar_historico_json(ag1, ag2):
+    # converte o formato antigo (.json com a lista inteira) para .jsonl
+    antigo = _caminho_historico(ag1, ag2, ".json")
+    novo = _caminho_historico(ag1, ag2)
+    if not os.path.exists(antigo) or os.path.exists(novo):
+        return
+    try:
+        with open(antigo, "r", encoding="utf-8") as f:
+            historico = json.load(f)
+        _gravar_jsonl(novo, historico)
+        os.replace(antigo, antigo + ".migrado")
+        print(f"📦 Histórico de {ag1.nome} com {ag2.nome} migrado para JSONL ({len(historico)} msgs)")
+    except Exception as e:
+        print(f"⚠️ Erro ao migrar histórico de {ag1.nome} com {ag2.nome}: {e}")
+
+
+def _ler_ultimas_linhas(caminho, n, bloco=8192):
+    # lê o arquivo de trás pra frente só até ter n linhas completas
+    if n <= 0:
+        return []  # [-0:] seria a lista inteira
+    with open(caminho, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        dados = b""
+        while pos > 0 and dados.count(b"\n") <= n:
+            passo = min(bloco, pos)
+            pos -= passo
+            f.seek(pos)
+            dados = f.read(passo) + dados
+    linhas = dados.splitlines()
+    if dados and not dados.endswith(b"\n"):
+        linhas.pop()  # última linha cortada (queda no meio da escrita) não conta no limite
+    return linhas[-n:]
+
+
+#acrescenta uma mensagem ao histórico sem regravar o arquivo; se a última linha ficou cortada
+#(queda no meio da escrita) começa numa linha nova para não estragar a mensagem nova também
+def anexar_historico(ag1, ag2, mensagem: dict):
+    caminho = _caminho_historico(ag1, ag2)
+    try:
+        with M_HISTORICO.tempo(operacao="anexar"), open(caminho, "a+b") as f:
+            linha = (json.dumps(mensagem, ensure_ascii=False) + "\n").encode("utf-8")
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    linha = b"\n" + linha
+            f.write(linha)
+    except Exception as e:
+        print(f"⚠️ Erro ao salvar histórico de {ag1.nome} com {ag2.nome}: {e}")
+
+
+#regrava o histórico inteiro (compactação/migração); no fluxo normal use anexar_historico
 def salvar_historico(ag1, ag2, historico: list):
-    caminho = os.path.join(HISTORICO_DIR, f"{ag1.nome}_{ag2.nome}.json")
+    caminho = _caminho_historico(ag1, ag2)
     try:
-        with open(caminho, "w", encoding="utf-8") as f:
-            json.dump(historico, f, ensure_ascii=False, indent=2)
+        _gravar_jsonl(caminho, historico)
     except Exception as e:
         print(f"⚠️ Erro ao salvar histórico de {ag1.nome} com {ag2.nome}: {e}")
 
 
-def carregar_historico(ag1, ag2):
-    caminho = os.path.join(HISTORICO_DIR, f"{ag1.nome}_{ag2.nome}.json")
+#carrega as últimas `limite` mensagens (None carrega tudo)
+def carregar_historico(ag1, ag2, limite=HISTORICO_JANELA):
+    with M_HISTORICO.tempo(operacao="carregar"):
+        return _carregar_historico(ag1, ag2, limite)
+
+
+def _carregar_historico(ag1, ag2, limite):
+    _migrar_historico_json(ag1, ag2)
+    caminho = _caminho_historico(ag1, ag2)
+    if not os.path.exists(caminho):
+        return []
+    try:
+        if limite is None:
+            with open(caminho, "rb") as f:
+                linhas = f.read().splitlines()
+        else:
+            linhas = _ler_ultimas_linhas(caminho, limite)
+    except Exception as e:
+        print(f"⚠️ Erro ao ler histórico de {ag1.nome} com {ag2.nome}: {e}")
+        return []
+
+    historico = []
+    for linha in linhas:
+        if not linha.strip():
+            continue
+        try:
+            historico.append(json.loads(linha))
+        except json.JSONDecodeError:
+            # linha cortada por queda do processo no meio da escrita
+            continue
+    return historico
+
+#contexto resumido do par (resumo + últimas mensagens), pequeno e regravado a cada mensagem
+def salvar_contexto(ag1, ag2, contexto: dict):
+    caminho = _caminho_historico(ag1, ag2, ".ctx.json")
+    try:
+        with M_HISTORICO.tempo(operacao="contexto"):
+            _gravar_contexto(caminho, contexto)
+    except Exception as e:
+        print(f"⚠️ Erro ao salvar contexto de {ag1.nome} com {ag2.nome}: {e}")
+
+
+def _gravar_contexto(caminho, contexto):
+    tmp = caminho + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(contexto, f, ensure_ascii=False)
+    os.replace(tmp, caminho)
+
+
+def carregar_contexto(ag1, ag2):
+    caminho = _caminho_historico(ag1, ag2, ".ctx.json")
+    if os.path.exists(caminho):
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Erro ao ler contexto de {ag1.nome} com {ag2.nome}: {e}")
+    return None
+
+# ===========================
+# Checkpoint das conversas em andamento
+# ===========================
+# um arquivo pequeno por par (<a1>_<a2>.estado.json) regravado a cada passo com turno, vez,
+# contadores, a próxima fala já gerada e o horário do próximo envio; no restart a conversa
+# continua dali em vez de voltar ao turno 0. Os nomes dos agentes vão dentro do arquivo.
+# Antes de cada envio o arquivo é regravado com a fala em "enviando" e, depois do envio,
+# com o estado seguinte: quem cai no meio sabe que aquela fala pode ter saído.
+def salvar_checkpoint(ag1, ag2, estado: dict):
+    caminho = _caminho_historico(ag1, ag2, ".estado.json")
+    try:
+        with M_HISTORICO.tempo(operacao="checkpoint"):
+            _gravar_contexto(caminho, estado)
+    except Exception as e:
+        print(f"⚠️ Erro ao salvar checkpoint de {ag1.nome} com {ag2.nome}: {e}")
+
+
+def carregar_checkpoint(ag1, ag2):
+    return _ler_checkpoint(_caminho_historico(ag1, ag2, ".estado.json"))
+
+
+def _ler_checkpoint(caminho):
     if os.path.exists(caminho):
         try:
             with open(caminho, "r", encoding="utf-8") as f:
                 return json.load(f)
         except Exception as e:
-            print(f"⚠️ Erro ao ler histórico de {ag1.nome} com {ag2.nome}: {e}")
-    return []
+            print(f"⚠️ Erro ao ler checkpoint {caminho}: {e}")
+    return None
+
+
+def apagar_checkpoint(ag1, ag2):
+    try:
+        os.remove(_caminho_historico(ag1, ag2, ".estado.json"))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ Erro ao apagar checkpoint de {ag1.nome} com {ag2.nome}: {e}")
+
+
+#todos os checkpoints deixados pela última execução
+def listar_checkpoints():
+    estados = []
+    for nome in os.listdir(HISTORICO_DIR):
+        if nome.endswith(".estado.json"):
+            estado = _ler_checkpoint(os.path.join(HISTORICO_DIR, nome))
+            if estado and estado.get("agente1") and estado.get("agente2"):
+                estados.append(estado)
+    return estados
+
+
+#apaga os checkpoints cujo estado satisfaz apagar(estado); devolve quantos
+def apagar_checkpoints(apagar):
+    apagados = 0
+    for arquivo in os.listdir(HISTORICO_DIR):
+        if not arquivo.endswith(".estado.json"):
+            continue
+        estado = _ler_checkpoint(os.path.join(HISTORICO_DIR, arquivo))
+        if estado is None or not apagar(estado):
+            continue
+        try:
+            os.remove(os.path.join(HISTORICO_DIR, arquivo))
+            apagados += 1
+        except FileNotFoundError:
+            pass
+    return apagados
+
+
+#apaga os checkpoints de pares com algum agente fora de `nomes` (saiu da ROTA, nunca vai ser retomado)
+def apagar_checkpoints_orfaos(nomes):
+    nomes = set(nomes)
+    apagados = apagar_checkpoints(lambda e: e.get("agente1") not in nomes or e.get("agente2") not in nomes)
+    if apagados:
+        print(f"🧹 {apagados} checkpoints de agentes fora da ROTA apagados")
+    return apagados
+
+
+def segundos_delay(min, test_mode=False):
+    return 0.1 if test_mode else min * 60
 
-async def delay_ms_async(min, test_mode=False):
-    min *= 60
-    await asyncio.sleep(0.1 if test_mode else min)
+#relogio = relógio a usar (None = o padrão, real); com um virtual a espera pode ser pulada
+async def delay_ms_async(min, test_mode=False, relogio=None):
+    await (relogio or relogio_atual()).dormir(segundos_delay(min, test_mode))
     return True